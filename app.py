@@ -1,51 +1,140 @@
 # app.py
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, g, abort
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
-from flask_bcrypt import Bcrypt
 from database import db, User, Attendance, Task, Classroom, ClassroomTask, ClassroomMembership # Import all models
+from database import SQL_STATS_TOP_N, track_queries, start_query_tracking, stop_query_tracking
+from config import get_config
+from bootstrap import bootstrap_database
+from roster import get_roster, invalidate_roster, roster_cache
+from classroom_cache import get_classroom_details, get_fragment, bump_classroom_version, classroom_cache
+from user_cache import load_cached_user, invalidate_user, user_cache
+from passwords import hash_password, password_verifier, PasswordCheckRejected
+from attendance import upsert_attendance, mark_roll_call, attendance_today, ATTENDANCE_STATUSES
+from reports import classroom_attendance_rates, weekly_attendance_rates, student_attendance_rates
+from upload_store import store_upload, store_path_hash
+from thumbnails import queue_thumbnail, thumbnail_path
+from outbox import queue_notification, send_queued, outbox_status, outbox
+from notifications import default_notification, absent_late_recipients
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import mimetypes
 from werkzeug.utils import secure_filename
-from datetime import datetime
-
-# Create the Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_super_secret_key' # Change this
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db' # Use a SQLite database
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# File upload configuration
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
-app.config['ALLOWED_EXTENSIONS'] = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
-
-# Create uploads directory if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Initialize extensions
-db.init_app(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+from werkzeug.security import safe_join
+from markupsafe import Markup
+from datetime import datetime, timedelta
+from functools import wraps
+from collections import deque
+from sqlalchemy.orm import joinedload
+
+# Routes live on a blueprint so create_app() can build any number of configured apps
+bp = Blueprint('main', __name__)
+
+# Initialize extensions (bound to each app in create_app)
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+def create_app(config=None):
+    """
+    Build a configured app. config is a config class or name from config.py
+    (default: ENGAGE_CONFIG, else 'development'). Does not touch the database;
+    run `python manage.py bootstrap` once to create the schema and seed data.
+    """
+    app = Flask(__name__)
+    app.config.from_object(get_config(config))
+    
+    # Create uploads directory if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    
+    # Per-request SQL summaries (query count, database time, slowest statements), newest last
+    app.extensions['recent_sql_requests'] = deque(maxlen=app.config['SQL_RECENT_REQUESTS'])
+    return app
 
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Read-only snapshot from the per-process user cache (see user_cache.py)
+    return load_cached_user(db.session, user_id)
+
+def keyset_page(query, key_column, after, page_size):
+    """
+    Fetch one page of query ordered by key_column, starting after the given key.
+    Returns (rows, next_key); next_key is None on the last page. Unlike OFFSET,
+    the cost of a page does not grow with how far into the list it is.
+    """
+    rows = query.filter(key_column > after).order_by(key_column).limit(page_size + 1).all()
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, getattr(rows[-1], key_column.key)
+    return rows, None
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a route issues more SQL statements than its declared budget."""
+
+def query_budget(max_queries):
+    """
+    Declare the most SQL statements a route may issue per request, including
+    loading the current user and rendering the template. The budget is enforced
+    under test (or when ENFORCE_QUERY_BUDGETS is true), so an N+1 regression
+    fails loudly instead of quietly slowing the page down.
+    Place it directly under @bp.route so it wraps @login_required too.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            with track_queries(request.endpoint) as counter:
+                response = view(*args, **kwargs)
+            enforce = current_app.config['ENFORCE_QUERY_BUDGETS']
+            if enforce is None:
+                enforce = current_app.testing
+            if enforce and counter.count > max_queries:
+                raise QueryBudgetExceeded(
+                    f'{request.endpoint} issued {counter.count} SQL statements (budget {max_queries})'
+                )
+            return response
+        wrapped.query_budget = max_queries
+        return wrapped
+    return decorator
+
+@bp.before_app_request
+def start_request_sql_tracking():
+    g.sql_stats = start_query_tracking()
+
+@bp.after_app_request
+def add_sql_timing_header(response):
+    # Shows up under the browser dev tools' Timing tab
+    stats = g.get('sql_stats')
+    if stats is not None:
+        response.headers['Server-Timing'] = f'db;dur={stats.total_time * 1000:.1f};desc="{stats.count} queries"'
+    return response
+
+@bp.teardown_app_request
+def finish_request_sql_tracking(exception=None):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return
+    stop_query_tracking(stats)
+    if request.endpoint == 'static':
+        return
+    stats.label = f'{request.method} {request.path}'
+    summary = stats.as_dict()
+    summary['endpoint'] = request.endpoint
+    summary['at'] = datetime.now().isoformat(timespec='seconds')
+    current_app.extensions['recent_sql_requests'].append(summary)
 
 # --- ROUTES ---
 
-@app.route('/')
+@bp.route('/')
 def home():
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         # Parsing form data (Complexity 9)
@@ -53,28 +142,60 @@ def login():
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
         
-        if user and bcrypt.check_password_hash(user.password_hash, password):
+        valid = False
+        if user:
+            try:
+                # Verified on the bounded password pool; a full queue is turned away at once
+                valid, new_hash = password_verifier.verify(user.password_hash, password)
+            except PasswordCheckRejected:
+                flash('The server is busy. Please try again in a moment.', 'warning')
+                return render_template('login.html'), 503
+        
+        if valid:
+            # Hash made with an older work factor: store one at the current factor
+            if new_hash:
+                user.password_hash = new_hash
+                db.session.commit()
             login_user(user, remember=True)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid username or password.', 'danger')
             
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
+@query_budget(4)
 @login_required
 def dashboard():
     if current_user.role == 'admin':
-        # Admin sees all classrooms and can manage them
-        classrooms = Classroom.query.all()
-        users = User.query.filter(User.role.in_(['student', 'teacher'])).all()
-        return render_template('dashboard.html', classrooms=classrooms, users=users, is_admin=True)
+        # Admin sees classrooms and users one keyset page at a time, filtered server-side
+        page_size = current_app.config['DASHBOARD_PAGE_SIZE']
+        
+        classroom_search = request.args.get('classroom_q', '').strip()
+        after_classroom = request.args.get('after_classroom', 0, type=int)
+        classrooms_query = Classroom.query.options(joinedload(Classroom.teacher))
+        if classroom_search:
+            classrooms_query = classrooms_query.filter(Classroom.name.contains(classroom_search))
+        classrooms, next_classroom = keyset_page(classrooms_query, Classroom.id, after_classroom, page_size)
+        
+        user_role = request.args.get('role', '')
+        user_search = request.args.get('q', '').strip()
+        after_user = request.args.get('after_user', 0, type=int)
+        roles = [user_role] if user_role in ['student', 'teacher'] else ['student', 'teacher']
+        users_query = User.query.options(joinedload(User.classroom)).filter(User.role.in_(roles))
+        if user_search:
+            users_query = users_query.filter(User.username.contains(user_search))
+        users, next_user = keyset_page(users_query, User.id, after_user, page_size)
+        
+        return render_template('dashboard.html', classrooms=classrooms, users=users, is_admin=True,
+                               next_classroom=next_classroom, next_user=next_user,
+                               classroom_search=classroom_search, user_role=user_role, user_search=user_search)
     elif current_user.role == 'teacher':
         # Teacher sees only their assigned classrooms
         classrooms = Classroom.query.filter_by(teacher_id=current_user.id).all()
@@ -82,16 +203,18 @@ def dashboard():
     else:
         # Student dashboard
         tasks = Task.query.filter_by(user_id=current_user.id).all()
-        classroom = current_user.classroom
+        classroom = None
+        if current_user.classroom_id:
+            classroom = Classroom.query.options(joinedload(Classroom.teacher)).get(current_user.classroom_id)
         return render_template('dashboard.html', tasks=tasks, classroom=classroom, is_student=True)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 @login_required
 def register():
     # Only admins can create accounts
     if current_user.role != 'admin':
         flash('You do not have permission to access this page.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     classrooms = Classroom.query.all()
     
@@ -105,37 +228,46 @@ def register():
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash(f'Username {username} already exists. Please choose a different username.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hash_password(password)
         
         try:
             new_user = User(username=username, password_hash=hashed_password, role=role)
-            
+            db.session.add(new_user)
+
             # Assign classroom if provided and role is student or teacher
             if classroom_id and role in ['student', 'teacher']:
                 new_user.classroom_id = classroom_id
-                
+                db.session.flush()  # assigns new_user.id; the user and their assignment commit together
+
                 # If role is teacher, also set as classroom teacher
                 if role == 'teacher':
                     classroom = Classroom.query.get(classroom_id)
                     if classroom:
                         classroom.teacher_id = new_user.id
-            
-            db.session.add(new_user)
+                else:
+                    # Keep classroom_membership authoritative for rosters
+                    db.session.add(ClassroomMembership(user_id=new_user.id, classroom_id=classroom_id))
+                bump_classroom_version(db.session, classroom_id)
+
             db.session.commit()
+
+            if role == 'student':
+                invalidate_roster(classroom_id)
+            invalidate_user(new_user.id)
             
             flash(f'User {username} created successfully!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         except Exception as e:
             db.session.rollback()
             flash(f'An error occurred while creating the user: {str(e)}', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
     return render_template('register.html', classrooms=classrooms)
 
 # Route for admin/teacher to mark attendance
-@app.route('/mark_attendance/<int:classroom_id>/<int:user_id>/<string:status>')
+@bp.route('/mark_attendance/<int:classroom_id>/<int:user_id>/<string:status>')
 @login_required
 def mark_attendance(classroom_id, user_id, status):
     # Check if user is admin or the teacher of this classroom
@@ -143,7 +275,7 @@ def mark_attendance(classroom_id, user_id, status):
     
     if current_user.role != 'admin' and (current_user.role != 'teacher' or classroom.teacher_id != current_user.id):
         flash('You do not have permission to perform this action.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     # Check if the student belongs to this classroom (legacy or membership)
     student = User.query.get_or_404(user_id)
@@ -153,35 +285,67 @@ def mark_attendance(classroom_id, user_id, status):
     )
     if not is_member:
         flash('This student does not belong to this classroom.', 'danger')
-        return redirect(url_for('classroom_details', classroom_id=classroom_id))
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
     # Validate status
     if status not in ['present', 'absent', 'late']:
         flash('Invalid attendance status.', 'danger')
-        return redirect(url_for('classroom_details', classroom_id=classroom_id))
-    
-    # Check if attendance already marked today
-    from datetime import date
-    today = date.today()
-    existing_record = Attendance.query.filter(
-        Attendance.user_id == user_id,
-        Attendance.classroom_id == classroom_id,
-        Attendance.date >= today
-    ).first()
-    
-    if existing_record:
-        existing_record.status = status
-    else:
-        new_attendance = Attendance(user_id=user_id, classroom_id=classroom_id, status=status)
-        db.session.add(new_attendance)
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
+    # Insert or update today's record in a single statement
+    upsert_attendance(db.session, user_id, classroom_id, status)
+    bump_classroom_version(db.session, classroom_id)
     db.session.commit()
     flash(f'Attendance marked for {student.username} as {status}.', 'success')
     
-    return redirect(url_for('classroom_details', classroom_id=classroom_id))
+    return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+
+# Route for admin/teacher to submit a whole classroom's roll call at once
+@bp.route('/roll_call/<int:classroom_id>', methods=['POST'])
+@login_required
+def submit_roll_call(classroom_id):
+    # Check if user is admin or the teacher of this classroom
+    classroom = Classroom.query.get_or_404(classroom_id)
+    
+    if current_user.role != 'admin' and (current_user.role != 'teacher' or classroom.teacher_id != current_user.id):
+        flash('You do not have permission to perform this action.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    # Collect the status map from the status_<user_id> form fields, skipping unchanged rows
+    statuses = {}
+    for field, status in request.form.items():
+        if not field.startswith('status_') or not status:
+            continue
+        if status not in ATTENDANCE_STATUSES:
+            flash('Invalid attendance status.', 'danger')
+            return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+        try:
+            statuses[int(field[len('status_'):])] = status
+        except ValueError:
+            continue
+    
+    if not statuses:
+        flash('No attendance statuses were selected.', 'danger')
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+    
+    # Check membership once for the whole set and write every row in one transaction
+    try:
+        marked_ids, rejected_ids = mark_roll_call(db.session, classroom_id, statuses)
+        bump_classroom_version(db.session, classroom_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred while saving the roll call: {str(e)}', 'danger')
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+    
+    flash(f'Roll call saved for {len(marked_ids)} students.', 'success')
+    if rejected_ids:
+        flash(f'{len(rejected_ids)} students were skipped because they do not belong to this classroom.', 'danger')
+    
+    return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
 
 # Route to send email notification to parents
-@app.route('/send_parent_notification/<int:classroom_id>/<int:user_id>', methods=['GET', 'POST'])
+@bp.route('/send_parent_notification/<int:classroom_id>/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def send_parent_notification(classroom_id, user_id):
     # Check if user is admin or the teacher of this classroom
@@ -189,17 +353,17 @@ def send_parent_notification(classroom_id, user_id):
     
     if current_user.role != 'admin' and (current_user.role != 'teacher' or classroom.teacher_id != current_user.id):
         flash('You do not have permission to perform this action.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     # Check if the student belongs to this classroom
     student = User.query.get_or_404(user_id)
     if student.classroom_id != classroom_id:
         flash('This student does not belong to this classroom.', 'danger')
-        return redirect(url_for('classroom_details', classroom_id=classroom_id))
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
     if not student.parent_email:
         flash(f'No parent email is set for {student.username}. Please add a parent email first.', 'danger')
-        return redirect(url_for('classroom_details', classroom_id=classroom_id))
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
     if request.method == 'POST':
         sender_email = request.form.get('sender_email')
@@ -209,79 +373,29 @@ def send_parent_notification(classroom_id, user_id):
         
         if not all([sender_email, sender_password, subject, message_body]):
             flash('All email fields are required.', 'danger')
-            return redirect(url_for('send_parent_notification', classroom_id=classroom_id, user_id=user_id))
+            return redirect(url_for('main.send_parent_notification', classroom_id=classroom_id, user_id=user_id))
         
-        try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = student.parent_email
-            msg['Subject'] = subject
-            
-            # Attach message body
-            msg.attach(MIMEText(message_body, 'plain'))
-            
-            # Connect to Gmail SMTP server
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(sender_email, sender_password)
-            
-            # Send email
-            server.send_message(msg)
-            server.quit()
-            
-            flash(f'Notification sent to parent of {student.username} at {student.parent_email}', 'success')
-            return redirect(url_for('classroom_details', classroom_id=classroom_id))
-            
-        except smtplib.SMTPAuthenticationError:
-            flash('Email login failed. If using Gmail, make sure you are using an App Password, not your regular password.', 'danger')
-        except smtplib.SMTPException as smtp_error:
-            flash(f'Email server error: {str(smtp_error)}', 'danger')
-        except Exception as e:
-            flash(f'Failed to send email: {str(e)}', 'danger')
+        # Queued for the background sender; the page does not wait on SMTP
+        queue_notification(db.session, sender_email, sender_password, student.parent_email, subject, message_body,
+                           student_id=student.id, classroom_id=classroom_id)
+        db.session.commit()
+        send_queued(db.engine)
+        
+        flash(f'Notification to the parent of {student.username} ({student.parent_email}) is queued for sending. '
+              f'Its delivery status is shown under Parent Notifications.', 'success')
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
     # Get today's attendance status for the student
-    from datetime import date
-    today = date.today()
-    attendance_record = Attendance.query.filter(
-        Attendance.user_id == user_id,
-        Attendance.classroom_id == classroom_id,
-        Attendance.date >= today
+    attendance_record = Attendance.query.filter_by(
+        user_id=user_id,
+        classroom_id=classroom_id,
+        day=attendance_today()
     ).first()
     
     attendance_status = attendance_record.status if attendance_record else 'Not marked'
     
     # Default message based on attendance status
-    if attendance_status == 'absent':
-        default_subject = f'Absence Notification for {student.username}'
-        default_message = f"""Dear Parent/Guardian,
-
-This is to inform you that {student.username} was marked absent today in {classroom.name}.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
-    elif attendance_status == 'late':
-        default_subject = f'Late Arrival Notification for {student.username}'
-        default_message = f"""Dear Parent/Guardian,
-
-This is to inform you that {student.username} was marked late today in {classroom.name}.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
-    else:
-        default_subject = f'Attendance Notification for {student.username}'
-        default_message = f"""Dear Parent/Guardian,
-
-This is to inform you about {student.username}'s attendance status in {classroom.name}.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
+    default_subject, default_message = default_notification(student.username, classroom.name, attendance_status)
     
     return render_template('send_notification.html', 
                          student=student, 
@@ -290,31 +404,71 @@ School Administration"""
                          default_subject=default_subject,
                          default_message=default_message)
 
+# Route to notify the parents of every student marked absent or late today in one go
+@bp.route('/notify_absent_parents/<int:classroom_id>', methods=['GET', 'POST'])
+@login_required
+def notify_absent_parents(classroom_id):
+    classroom = Classroom.query.get_or_404(classroom_id)
+    
+    if current_user.role != 'admin' and (current_user.role != 'teacher' or classroom.teacher_id != current_user.id):
+        flash('You do not have permission to perform this action.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    recipients, missing_email = absent_late_recipients(db.session, classroom)
+    
+    if request.method == 'POST':
+        sender_email = request.form.get('sender_email')
+        sender_password = request.form.get('sender_password')
+        
+        if not sender_email or not sender_password:
+            flash('Your email address and password are required.', 'danger')
+            return redirect(url_for('main.notify_absent_parents', classroom_id=classroom_id))
+        if not recipients:
+            flash('There are no absent or late students with a parent email today.', 'info')
+            return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+        
+        # One outbox row per parent; the sender delivers them all over one SMTP connection
+        messages = [
+            queue_notification(db.session, sender_email, sender_password, recipient.parent_email,
+                               recipient.subject, recipient.body, student_id=recipient.student_id, classroom_id=classroom_id)
+            for recipient in recipients
+        ]
+        db.session.commit()
+        send_queued(db.engine)
+        
+        return render_template('notify_parents.html',
+                               classroom=classroom,
+                               recipients=recipients,
+                               missing_email=missing_email,
+                               message_ids=[message.id for message in messages])
+    
+    return render_template('notify_parents.html',
+                           classroom=classroom,
+                           recipients=recipients,
+                           missing_email=missing_email,
+                           message_ids=None)
+
 # Simplified route for students to submit a task
-@app.route('/submit_task', methods=['POST'])
+@bp.route('/submit_task', methods=['POST'])
 @login_required
 def submit_task():
     if current_user.role != 'student':
         flash('You do not have permission to submit a task.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     content = request.form.get('task_content')
     classroom_task_id = request.form.get('classroom_task_id')
     
     # Check if a file was uploaded
     file = request.files.get('task_file')
-    file_path = None
+    stored = None
     file_type = None
     
     if file and file.filename:
         if allowed_file(file.filename):
-            # Secure the filename and save the file
+            # Streamed into the shared store; a file already stored is not written again
             filename = secure_filename(file.filename)
-            # Create a unique filename with timestamp
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
+            stored = store_upload(db.session, file.stream, filename, current_app.config['UPLOAD_FOLDER'])
             
             # Determine file type
             extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
@@ -326,47 +480,110 @@ def submit_task():
                 file_type = 'other'
         else:
             flash('File type not allowed.', 'danger')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
     
     # Create the task
     new_task = Task(
         user_id=current_user.id, 
         content=content,
         classroom_task_id=classroom_task_id if classroom_task_id else None,
-        file_path=file_path,
-        file_type=file_type
+        file_path=stored.path if stored else None,
+        file_type=file_type,
+        file_hash=stored.file_hash if stored else None
     )
     
     db.session.add(new_task)
     db.session.commit()
     
+    if stored:
+        queue_thumbnail(current_app.config['UPLOAD_FOLDER'], stored.path)
+    
     flash('Task submitted successfully!', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
 # Helper function to check if file extension is allowed
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
-
-# Route to download uploaded files
-@app.route('/uploads/<filename>')
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+# Whether the user may download a stored file: admins always, students their own
+# submissions, teachers submissions to tasks they created. One query on ix_task_file_hash.
+def can_view_upload(user, file_hash):
+    if user.role == 'admin':
+        return True
+    query = db.session.query(Task.id).filter(Task.file_hash == file_hash)
+    if user.role == 'teacher':
+        query = query.join(ClassroomTask, Task.classroom_task_id == ClassroomTask.id) \
+            .filter(ClassroomTask.teacher_id == user.id)
+    else:
+        query = query.filter(Task.user_id == user.id)
+    return db.session.query(query.exists()).scalar()
+
+def send_upload(path, etag, max_age):
+    """
+    Response for a file under UPLOAD_FOLDER: strong ETag, Last-Modified, 304s and
+    Range handling, with the bytes sent by Flask or handed to the front proxy.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if current_app.config['UPLOAD_SENDFILE'] == 'x-accel-redirect':
+        # nginx streams the file (and serves ranges) from its internal location
+        full_path = safe_join(upload_folder, path)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + path
+        response.last_modified = os.path.getmtime(full_path)
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect')
+    else:
+        # Flask sends the bytes itself (handling Range), or only an X-Sendfile header when USE_X_SENDFILE is set
+        response = send_from_directory(upload_folder, path, etag=etag, max_age=0, conditional=True)
+    
+    # Content-addressed, so a stored file never changes: private because it needs a login
+    response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.expires = None
+    return response
+
+# Route to download uploaded files (store paths look like ab/cd/<sha256>.pdf)
+@bp.route('/uploads/<path:filename>')
 @login_required
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    file_hash = store_path_hash(filename)
+    if file_hash is None or not can_view_upload(current_user, file_hash):
+        abort(404)
+    return send_upload(filename, file_hash, current_app.config['UPLOAD_CACHE_MAX_AGE'])
+
+# Route to a stored image's thumbnail; serves the original until the thumbnail has been made
+@bp.route('/thumbnails/<path:filename>')
+@login_required
+def upload_thumbnail(filename):
+    file_hash = store_path_hash(filename)
+    if file_hash is None or not can_view_upload(current_user, file_hash):
+        abort(404)
+    thumbnail = thumbnail_path(filename)
+    if not os.path.isfile(os.path.join(current_app.config['UPLOAD_FOLDER'], thumbnail)):
+        queue_thumbnail(current_app.config['UPLOAD_FOLDER'], filename)
+        return send_upload(filename, file_hash, 0)
+    return send_upload(thumbnail, f'{file_hash}-thumb', current_app.config['THUMBNAIL_CACHE_MAX_AGE'])
 
 # Route for teachers to create classroom tasks
-@app.route('/create_classroom_task/<int:classroom_id>', methods=['GET', 'POST'])
+@bp.route('/create_classroom_task/<int:classroom_id>', methods=['GET', 'POST'])
 @login_required
 def create_classroom_task(classroom_id):
     # Check if user is a teacher or admin
     if current_user.role not in ['teacher', 'admin']:
         flash('You do not have permission to create classroom tasks.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     # Check if teacher is assigned to this classroom or user is admin
     classroom = Classroom.query.get_or_404(classroom_id)
     if current_user.role == 'teacher' and classroom.teacher_id != current_user.id:
         flash('You can only create tasks for classrooms you teach.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         title = request.form.get('title')
@@ -375,7 +592,7 @@ def create_classroom_task(classroom_id):
         
         if not title or not description:
             flash('Title and description are required.', 'danger')
-            return redirect(url_for('create_classroom_task', classroom_id=classroom_id))
+            return redirect(url_for('main.create_classroom_task', classroom_id=classroom_id))
         
         # Parse due date if provided
         due_date = None
@@ -384,7 +601,7 @@ def create_classroom_task(classroom_id):
                 due_date = datetime.strptime(due_date_str, '%Y-%m-%d')
             except ValueError:
                 flash('Invalid date format. Please use YYYY-MM-DD.', 'danger')
-                return redirect(url_for('create_classroom_task', classroom_id=classroom_id))
+                return redirect(url_for('main.create_classroom_task', classroom_id=classroom_id))
         
         new_task = ClassroomTask(
             title=title,
@@ -395,20 +612,21 @@ def create_classroom_task(classroom_id):
         )
         
         db.session.add(new_task)
+        bump_classroom_version(db.session, classroom_id)
         db.session.commit()
         
         flash(f'Task "{title}" created successfully!', 'success')
-        return redirect(url_for('classroom_details', classroom_id=classroom_id))
+        return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
     
     return render_template('create_classroom_task.html', classroom=classroom)
 
 # Route to create a new classroom
-@app.route('/create_classroom', methods=['GET', 'POST'])
+@bp.route('/create_classroom', methods=['GET', 'POST'])
 @login_required
 def create_classroom():
     if current_user.role != 'admin':
         flash('Only administrators can create classrooms.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -417,7 +635,7 @@ def create_classroom():
         
         if not name:
             flash('Classroom name is required.', 'danger')
-            return redirect(url_for('create_classroom'))
+            return redirect(url_for('main.create_classroom'))
         
         new_classroom = Classroom(name=name, description=description)
         
@@ -430,36 +648,21 @@ def create_classroom():
         db.session.add(new_classroom)
         db.session.commit()
         flash(f'Classroom "{name}" created successfully!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     # Get all teachers for the dropdown
     teachers = User.query.filter_by(role='teacher').all()
     return render_template('create_classroom.html', teachers=teachers)
 
-# Route to view classroom details
-@app.route('/classroom/<int:classroom_id>')
+# Route to view classroom details (a warm cache costs the version lookup plus a student's submissions)
+@bp.route('/classroom/<int:classroom_id>')
+@query_budget(7)
 @login_required
 def classroom_details(classroom_id):
-    classroom = Classroom.query.get_or_404(classroom_id)
-    
-    # Get all students in this classroom (legacy and membership)
-    legacy_students = User.query.filter_by(classroom_id=classroom_id, role='student')
-    member_students = User.query.join(ClassroomMembership, ClassroomMembership.user_id == User.id) \
-        .filter(ClassroomMembership.classroom_id == classroom_id, User.role == 'student')
-    students = legacy_students.union(member_students).all()
-    
-    # Get today's attendance records
-    today = datetime.now().date()
-    attendance_records = Attendance.query.filter(
-        Attendance.classroom_id == classroom_id,
-        Attendance.date >= today
-    ).all()
-    
-    # Create a dictionary of user_id -> attendance status for easy lookup
-    attendance_dict = {record.user_id: record.status for record in attendance_records}
-    
-    # Get classroom tasks
-    classroom_tasks = ClassroomTask.query.filter_by(classroom_id=classroom_id).order_by(ClassroomTask.created_date.desc()).all()
+    # Classroom, tasks, roster and today's attendance, cached until the classroom's version is bumped
+    details = get_classroom_details(db.session, classroom_id)
+    if details is None:
+        abort(404)
     
     # For students, get their task submissions
     student_submissions = {}
@@ -467,36 +670,46 @@ def classroom_details(classroom_id):
         submissions = Task.query.filter_by(user_id=current_user.id).all()
         student_submissions = {submission.classroom_task_id: submission for submission in submissions if submission.classroom_task_id}
     
+    # The students table (the bulk of the page) differs only between staff and students
+    staff_view = current_user.role in ['admin', 'teacher']
+    students_html = get_fragment(details, f'students:{staff_view}', lambda: render_template(
+        '_classroom_students.html',
+        classroom=details.classroom,
+        students=details.students,
+        attendance_dict=details.attendance,
+        staff_view=staff_view
+    ))
+    
     return render_template(
         'classroom_details.html',
-        classroom=classroom,
-        students=students,
-        attendance_dict=attendance_dict,
-        classroom_tasks=classroom_tasks,
+        classroom=details.classroom,
+        students_html=Markup(students_html),
+        classroom_tasks=details.tasks,
         student_submissions=student_submissions
     )
 
 # Route to view task submissions for a classroom task
-@app.route('/classroom_task/<int:task_id>/submissions')
+@bp.route('/classroom_task/<int:task_id>/submissions')
+@query_budget(4)
 @login_required
 def view_task_submissions(task_id):
     # Check if user is a teacher or admin
     if current_user.role not in ['teacher', 'admin']:
         flash('You do not have permission to view task submissions.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     classroom_task = ClassroomTask.query.get_or_404(task_id)
     
     # Check if teacher is assigned to this classroom or user is admin
     if current_user.role == 'teacher' and classroom_task.teacher_id != current_user.id:
         flash('You can only view submissions for tasks you created.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     # Get all submissions for this task
     submissions = Task.query.filter_by(classroom_task_id=task_id).all()
     
-    # Get all students in the classroom
-    students = User.query.filter_by(classroom_id=classroom_task.classroom_id, role='student').all()
+    # Get all students in the classroom (legacy and membership)
+    students = get_roster(db.session, classroom_task.classroom_id)
     
     # Create a dictionary of user_id -> submission for easy lookup
     submission_dict = {submission.user_id: submission for submission in submissions}
@@ -508,8 +721,9 @@ def view_task_submissions(task_id):
         submission_dict=submission_dict
     )
 
-# Route to view classroom attendance
-@app.route('/classroom/<int:classroom_id>/attendance')
+# Route to view classroom attendance: the roster and today's marks are on the classroom page
+@bp.route('/classroom/<int:classroom_id>/attendance')
+@query_budget(5)
 @login_required
 def classroom_attendance(classroom_id):
     classroom = Classroom.query.get_or_404(classroom_id)
@@ -517,50 +731,134 @@ def classroom_attendance(classroom_id):
     # Check permissions
     if current_user.role == 'student' and current_user.classroom_id != classroom_id:
         flash('You do not have permission to view this classroom.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if current_user.role == 'teacher' and classroom.teacher_id != current_user.id:
         flash('You are not assigned to this classroom.', 'danger')
-        return redirect(url_for('dashboard'))
-    
-    # Get students in this classroom (legacy and membership)
-    legacy_students = User.query.filter_by(classroom_id=classroom_id, role='student')
-    member_students = User.query.join(ClassroomMembership, ClassroomMembership.user_id == User.id) \
-        .filter(ClassroomMembership.classroom_id == classroom_id, User.role == 'student')
-    students = legacy_students.union(member_students).all()
-    
-    # Get today's attendance records
-    from datetime import date
-    today = date.today()
-    attendance_records = Attendance.query.filter(
-        Attendance.classroom_id == classroom_id,
-        Attendance.date >= today
-    ).all()
-    
-    # Create a dictionary of user_id -> attendance status for easy lookup
-    attendance_dict = {record.user_id: record.status for record in attendance_records}
-    
-    return render_template('classroom_details.html', 
-                           classroom=classroom, 
-                           students=students, 
-                           attendance_dict=attendance_dict,
-                           is_admin=(current_user.role == 'admin'),
-                           is_teacher=(current_user.role == 'teacher'))
+        return redirect(url_for('main.dashboard'))
+    
+    return redirect(url_for('main.classroom_details', classroom_id=classroom_id))
+
+# Attendance rates over a date range, answered from the rollup tables
+@bp.route('/reports/attendance')
+@query_budget(6)
+@login_required
+def attendance_report():
+    if current_user.role == 'student':
+        flash('Only teachers and administrators can view attendance reports.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    end = request.args.get('end', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date()) or attendance_today()
+    start = request.args.get('start', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date()) or end - timedelta(days=29)
+    if start > end:
+        start, end = end, start
+    
+    # Teachers only see their own classrooms
+    classroom_ids = None
+    if current_user.role == 'teacher':
+        classroom_ids = [row.id for row in db.session.query(Classroom.id).filter_by(teacher_id=current_user.id)]
+    
+    classroom_rates = classroom_attendance_rates(db.session, start, end, classroom_ids)
+    
+    # Weekly and per-student breakdown for one selected classroom
+    selected_classroom = request.args.get('classroom_id', type=int)
+    if selected_classroom not in {rate.key for rate in classroom_rates}:
+        selected_classroom = None
+    weekly_rates = student_rates = []
+    if selected_classroom:
+        weekly_rates = weekly_attendance_rates(db.session, selected_classroom, start, end)
+        student_rates = student_attendance_rates(db.session, start, end, [selected_classroom])
+    
+    return render_template('attendance_report.html',
+                           start=start,
+                           end=end,
+                           classroom_rates=classroom_rates,
+                           selected_classroom=selected_classroom,
+                           weekly_rates=weekly_rates,
+                           student_rates=student_rates)
+
+# Delivery status of a classroom's recent parent notifications (polled by classroom_details)
+@bp.route('/classroom/<int:classroom_id>/notifications')
+@login_required
+def notification_status(classroom_id):
+    classroom = Classroom.query.get_or_404(classroom_id)
+    if current_user.role != 'admin' and (current_user.role != 'teacher' or classroom.teacher_id != current_user.id):
+        return jsonify({'error': 'forbidden'}), 403
+    
+    # ?ids=1,2,3 limits the result to one batch
+    message_ids = None
+    if request.args.get('ids'):
+        message_ids = [int(message_id) for message_id in request.args['ids'].split(',') if message_id.isdigit()]
+    return jsonify(outbox_status(db.session, classroom_id, limit=200 if message_ids else 20, message_ids=message_ids))
+
+# Lightweight classroom lookup feeding the shared classroom picker on the admin dashboard
+@bp.route('/classrooms/lookup')
+@login_required
+def classroom_lookup():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'forbidden'}), 403
+    
+    search = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    query = db.session.query(Classroom.id, Classroom.name)
+    if search:
+        query = query.filter(Classroom.name.contains(search))
+    classrooms = query.order_by(Classroom.name).limit(limit).all()
+    return jsonify([{'id': classroom.id, 'name': classroom.name} for classroom in classrooms])
+
+# SQL instrumentation for the most recent requests, plus cache statistics
+@bp.route('/debug/sql')
+@login_required
+def debug_sql():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'forbidden'}), 403
+    
+    requests_seen = list(current_app.extensions['recent_sql_requests'])
+    
+    # Slowest statements across every recorded request
+    statements = {}
+    for summary in requests_seen:
+        for entry in summary['slowest']:
+            totals = statements.setdefault(entry['statement'], {'statement': entry['statement'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            totals['calls'] += entry['calls']
+            totals['total_ms'] = round(totals['total_ms'] + entry['total_ms'], 3)
+            totals['max_ms'] = max(totals['max_ms'], entry['max_ms'])
+    slowest = sorted(statements.values(), key=lambda totals: totals['total_ms'], reverse=True)[:SQL_STATS_TOP_N]
+    
+    return jsonify({
+        'requests': requests_seen[::-1],
+        'slowest_statements': slowest,
+        'roster_cache': roster_cache.stats(),
+        'classroom_cache': classroom_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'outbox': outbox.stats(),
+    })
+
+# Helper to send the admin back to the dashboard page they were on
+def dashboard_return_url():
+    next_url = request.form.get('next', '')
+    if next_url.startswith(url_for('main.dashboard')):
+        return next_url
+    return url_for('main.dashboard')
 
 # Route to assign students to a classroom
-@app.route('/assign_classroom/<int:user_id>', methods=['POST'])
+@bp.route('/assign_classroom/<int:user_id>', methods=['POST'])
 @login_required
 def assign_classroom(user_id):
     if current_user.role != 'admin':
         flash('Only administrators can assign classrooms.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     classroom_id = request.form.get('classroom_id')
     user = User.query.get_or_404(user_id)
     
     if user.role not in ['student', 'teacher']:
         flash('Only students and teachers can be assigned to classrooms.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(dashboard_return_url())
+    
+    if not classroom_id:
+        flash('Please select a classroom.', 'danger')
+        return redirect(dashboard_return_url())
     
     # Legacy: keep single classroom_id if empty, but allow multiple via membership
     if not user.classroom_id:
@@ -575,33 +873,17 @@ def assign_classroom(user_id):
         if classroom:
             classroom.teacher_id = user_id
     
+    bump_classroom_version(db.session, classroom_id)
     db.session.commit()
+    invalidate_roster(classroom_id)
+    invalidate_user(user_id)
     flash(f'User {user.username} has been assigned to the classroom.', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(dashboard_return_url())
     
 if __name__ == '__main__':
-    # Create all tables
+    # Development server: bootstrap the database if needed, then serve with the reloader.
+    # Production: `python manage.py bootstrap` once, then `python manage.py serve --workers N`.
+    app = create_app('development')
     with app.app_context():
-        db.create_all()
-        
-        # Check if a default classroom exists
-        default_classroom = Classroom.query.filter_by(name='Default Classroom').first()
-        if not default_classroom:
-            # Create a default classroom
-            default_classroom = Classroom(name='Default Classroom', description='Default classroom for all students')
-            db.session.add(default_classroom)
-            db.session.commit()
-            print("Default classroom created.")
-        
-        # Check if an admin user already exists
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            # Create a default admin user if one doesn't exist
-            print("Creating default admin user...")
-            hashed_password = bcrypt.generate_password_hash('admin_password').decode('utf-8')
-            admin_user = User(username='admin', password_hash=hashed_password, role='admin')
-            db.session.add(admin_user)
-            db.session.commit()
-            print("Default admin user created with username 'admin' and password 'admin_password'.")
-        
-    app.run(debug=True)
\ No newline at end of file
+        bootstrap_database(db.engine, db.session)
+    app.run(debug=True)
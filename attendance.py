@@ -0,0 +1,80 @@
+# attendance.py
+
+# Shared attendance helpers used by both the web application and the desktop client.
+
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import Attendance
+from roster import get_roster
+
+# Valid attendance statuses
+ATTENDANCE_STATUSES = ('present', 'absent', 'late')
+
+def attendance_now():
+    """
+    Current time on the school's local clock.
+    Every attendance mark and every "today" lookup goes through here so the
+    stored day bucket and the day being queried can never disagree.
+    """
+    return datetime.now()
+
+def attendance_today():
+    """The local calendar day attendance is currently being taken for."""
+    return attendance_now().date()
+
+def _upsert_statement():
+    """INSERT ... ON CONFLICT DO UPDATE keyed on the (user_id, classroom_id, day) unique index."""
+    statement = sqlite_insert(Attendance.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=['user_id', 'classroom_id', 'day'],
+        set_={'status': statement.excluded.status, 'date': statement.excluded.date}
+    )
+
+def upsert_attendance(session, user_id, classroom_id, status, now=None):
+    """
+    Record a student's attendance for the day as a single
+    INSERT ... ON CONFLICT DO UPDATE on (user_id, classroom_id, day).
+    The caller owns the transaction and must commit.
+    """
+    if status not in ATTENDANCE_STATUSES:
+        raise ValueError(f'Invalid attendance status: {status}')
+
+    now = now or attendance_now()
+    session.execute(_upsert_statement().values(
+        user_id=user_id,
+        classroom_id=classroom_id,
+        status=status,
+        date=now,
+        day=now.date()
+    ))
+
+def mark_roll_call(session, classroom_id, statuses, now=None):
+    """
+    Mark a whole classroom at once from a {user_id: status} map.
+    Membership is checked against the classroom roster once for the whole
+    set and every row is written with a single executemany upsert. The caller
+    owns the transaction and must commit.
+    Returns (marked_ids, rejected_ids).
+    """
+    for status in statuses.values():
+        if status not in ATTENDANCE_STATUSES:
+            raise ValueError(f'Invalid attendance status: {status}')
+
+    member_ids = {student.id for student in get_roster(session, classroom_id)}
+    marked_ids = [user_id for user_id in statuses if user_id in member_ids]
+    rejected_ids = [user_id for user_id in statuses if user_id not in member_ids]
+
+    if marked_ids:
+        now = now or attendance_now()
+        session.execute(_upsert_statement(), [
+            {
+                'user_id': user_id,
+                'classroom_id': classroom_id,
+                'status': statuses[user_id],
+                'date': now,
+                'day': now.date()
+            }
+            for user_id in marked_ids
+        ])
+
+    return marked_ids, rejected_ids
@@ -0,0 +1,98 @@
+# benchmarks/bench_desktop_day.py
+
+# Runs a teaching day through the desktop app, headless, against a small synthetic school
+# (synthetic_school.py): every round a teacher opens a classroom, marks attendance, takes
+# a roll call and closes it, a student submits a task and the admin reloads the lists.
+# Prints database.session_report() as it goes. The identity maps must stay flat: exits
+# with status 1 if sessions or the objects they hold grew between the first and last report.
+# Usage:  python benchmarks/bench_desktop_day.py --rounds 300 --report-every 50
+
+import gc
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+parser = argparse.ArgumentParser(description='Check that a long desktop session keeps its identity maps flat.')
+parser.add_argument('--rounds', type=int, default=200, help='classroom visits to simulate')
+parser.add_argument('--report-every', type=int, default=25, help='rounds between session reports')
+args = parser.parse_args()
+
+# Point the desktop code at a scratch database before it is imported
+run_dir = tempfile.mkdtemp(prefix='engage-day-')
+os.environ['ENGAGE_DATABASE_PATH'] = os.path.join(run_dir, 'school.db')
+os.environ['ENGAGE_SMTP_HOST'] = '127.0.0.1'  # nothing listens on the discard port: queued mail fails fast
+os.environ['ENGAGE_SMTP_PORT'] = '9'
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from synthetic_school import SIZES, seed_school
+
+print(f"Seeding a small school into {run_dir} ...")
+seed_school(os.environ['ENGAGE_DATABASE_PATH'], os.path.join(run_dir, 'uploads'), SIZES['small'])
+
+from PyQt5.QtCore import QEvent
+from PyQt5.QtWidgets import QApplication, QMessageBox
+qt_app = QApplication.instance() or QApplication([])
+import desktop_app as desktop
+import desktop_loader as loads
+from database import session_report, format_session_report
+from attendance import ATTENDANCE_STATUSES
+from submit_task_dialog import SubmitTaskDialog
+
+# Nobody is there to close message boxes
+QMessageBox.information = QMessageBox.warning = QMessageBox.critical = staticmethod(lambda *args: QMessageBox.Ok)
+
+def settle():
+    """Let the loads finish, their results arrive and closed widgets be deleted."""
+    loads.load_pool().waitForDone()
+    qt_app.processEvents()
+    qt_app.sendPostedEvents(None, QEvent.DeferredDelete)
+    gc.collect()
+
+admin = loads.fetch('bench', loads.signed_in_user, 1)
+teacher = loads.fetch('bench', loads.signed_in_user, 2)
+classroom_ids = [classroom.id for classroom in loads.fetch('bench', loads.teacher_classrooms, teacher.id)]
+admin_dashboard = desktop.AdminDashboard(admin)
+teacher_dashboard = desktop.TeacherDashboard(teacher)
+
+reports = []
+started = time.perf_counter()
+for round_number in range(1, args.rounds + 1):
+    classroom_id = classroom_ids[round_number % len(classroom_ids)]
+    dialog = desktop.ClassroomDetailsDialog(classroom_id, teacher)
+    settle()
+    for n, student in enumerate(dialog.students):
+        dialog.mark_attendance(student.id, ATTENDANCE_STATUSES[(n + round_number) % len(ATTENDANCE_STATUSES)])
+    dialog.save_marks()
+    dialog.done(0)
+    dialog.deleteLater()
+
+    student = dialog.students[round_number % len(dialog.students)]
+    tasks, _ = loads.fetch('bench', loads.classroom_tasks_for_student, classroom_id, student.id)
+    submit = SubmitTaskDialog(tasks[0].id, student.id)
+    submit.content_input.setPlainText(f'Answer {round_number}')
+    submit.submit_response()
+    submit.deleteLater()
+
+    teacher_dashboard.load_classrooms()
+    admin_dashboard.load_users()
+    settle()
+
+    if round_number % args.report_every == 0 or round_number == args.rounds:
+        report = session_report()
+        reports.append(report)
+        print(f"round {round_number:>5} ({time.perf_counter() - started:6.1f}s) {format_session_report(report)}")
+
+shutil.rmtree(run_dir, ignore_errors=True)
+first, last = reports[0], reports[-1]
+grew = [key for key in ('sessions', 'open_sessions', 'identity_map_objects') if last[key] > first[key]]
+if grew:
+    print(f"Grew over the day: {', '.join(grew)}")
+    sys.exit(1)
+print('Sessions and identity maps stayed flat.')
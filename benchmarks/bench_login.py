@@ -0,0 +1,72 @@
+# benchmarks/bench_login.py
+
+# Measures /login throughput and latency at several bcrypt work factors against a
+# throwaway database, with a burst of concurrent logins like the 8:00 rush.
+# Usage:  python benchmarks/bench_login.py --rounds 10 11 12 --requests 200 --concurrency 16
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description='Benchmark /login at different bcrypt work factors.')
+parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12], help='bcrypt work factors to compare')
+parser.add_argument('--requests', type=int, default=100, help='logins per work factor')
+parser.add_argument('--concurrency', type=int, default=16, help='simultaneous clients')
+parser.add_argument('--workers', type=int, default=None, help='password pool workers (default: ENGAGE_PASSWORD_WORKERS)')
+parser.add_argument('--queue-limit', type=int, default=None, help='password pool queue limit (default: ENGAGE_PASSWORD_QUEUE_LIMIT)')
+args = parser.parse_args()
+
+# Point the app at a scratch database before it is imported
+scratch_dir = tempfile.mkdtemp(prefix='engage-bench-')
+os.environ['ENGAGE_DATABASE_PATH'] = os.path.join(scratch_dir, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as web
+from database import db, User
+from passwords import hash_password, PasswordVerifier, PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT
+
+app = web.create_app('production')
+workers = args.workers or PASSWORD_WORKERS
+queue_limit = args.queue_limit if args.queue_limit is not None else PASSWORD_QUEUE_LIMIT
+
+with app.app_context():
+    db.create_all()
+    db.session.add(User(username='bench_student', password_hash='', role='student'))
+    db.session.commit()
+
+def login_once(_):
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/login', data={'username': 'bench_student', 'password': 'password'})
+    return response.status_code, time.perf_counter() - started
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+print(f"{args.requests} logins per setting, {args.concurrency} concurrent clients, "
+      f"{workers} password workers, queue limit {queue_limit}")
+print(f"{'rounds':>6} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'ok':>5} {'503':>5} {'other':>6}")
+
+for rounds in args.rounds:
+    with app.app_context():
+        user = User.query.filter_by(username='bench_student').first()
+        user.password_hash = hash_password('password', rounds)
+        db.session.commit()
+    # Verify at the same factor so no login rehashes during the run
+    web.password_verifier = PasswordVerifier(workers=workers, queue_limit=queue_limit, rounds=rounds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+        results = list(clients.map(login_once, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    web.password_verifier.shutdown()
+
+    latencies = [latency for status, latency in results if status == 302]
+    rejected = sum(1 for status, _ in results if status == 503)
+    other = len(results) - len(latencies) - rejected
+    print(f"{rounds:>6} {len(latencies) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.1f} {len(latencies):>5} {rejected:>5} {other:>6}")
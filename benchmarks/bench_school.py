@@ -0,0 +1,283 @@
+# benchmarks/bench_school.py
+
+# Latency and query counts for every web route and the desktop loaders against a
+# synthetic school (synthetic_school.py), compared with a saved baseline.
+# The seeded database is kept under benchmarks/data/ and copied for each run, so runs
+# start from the same data; it is reseeded each day so "today" and the report ranges match.
+# Usage:  python benchmarks/bench_school.py                      # 20k students, 2M attendance rows
+#         python benchmarks/bench_school.py --size small --repeat 5
+#         python benchmarks/bench_school.py --save-baseline       # after a deliberate change
+# Exits with status 1 if any case got slower (p95) or runs more queries than the baseline.
+
+import io
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import date
+from collections import namedtuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+parser = argparse.ArgumentParser(description='Benchmark every route and desktop loader against a synthetic school.')
+parser.add_argument('--size', choices=['small', 'school'], default='school', help='preset school size')
+parser.add_argument('--students', type=int, help='override the preset number of students')
+parser.add_argument('--classrooms', type=int, help='override the preset number of classrooms')
+parser.add_argument('--days', type=int, help='override the preset days of attendance')
+parser.add_argument('--submissions', type=int, help='override the preset number of task submissions')
+parser.add_argument('--repeat', type=int, default=20, help='timed runs per case (after one warm-up run)')
+parser.add_argument('--only', help='run only the cases whose name contains this text')
+parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'), help='baseline file to compare with')
+parser.add_argument('--save-baseline', action='store_true', help='write this run to the baseline file')
+parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown before a case counts as a regression')
+parser.add_argument('--reseed', action='store_true', help='seed a new database even if one is kept for these settings')
+args = parser.parse_args()
+
+# Point the app and the desktop code at a scratch copy before they are imported
+run_dir = tempfile.mkdtemp(prefix='engage-school-')
+os.environ['ENGAGE_DATABASE_PATH'] = os.path.join(run_dir, 'school.db')
+os.environ['ENGAGE_BCRYPT_ROUNDS'] = '4'
+os.environ['ENGAGE_SMTP_HOST'] = '127.0.0.1'  # nothing listens on the discard port: queued mail fails fast
+os.environ['ENGAGE_SMTP_PORT'] = '9'
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from synthetic_school import SIZES, seed_school
+from database import track_queries
+
+size = SIZES[args.size]._replace(**{field: getattr(args, field) for field in ('students', 'classrooms', 'days', 'submissions')
+                                    if getattr(args, field) is not None})
+MIN_REGRESSION_MS = 2.0  # p95 changes smaller than this are noise, whatever the percentage
+
+# Seed once per size and day, then copy
+data_prefix = os.path.join(BENCH_DIR, 'data', '{}s-{}c-{}d-{}t-{}k'.format(*size))
+data_dir = f'{data_prefix}-{date.today().isoformat()}'
+if args.reseed or not os.path.exists(os.path.join(data_dir, 'school.db')):
+    for stale_dir in glob.glob(f'{data_prefix}-*'):
+        shutil.rmtree(stale_dir)
+    os.makedirs(data_dir)
+    print(f"Seeding {size.students} students, {size.classrooms} classrooms, {size.days} days, "
+          f"{size.submissions} submissions into {data_dir} ...")
+    started = time.perf_counter()
+    counts = seed_school(os.path.join(data_dir, 'school.db.partial'), os.path.join(data_dir, 'uploads'), size)
+    os.replace(os.path.join(data_dir, 'school.db.partial'), os.path.join(data_dir, 'school.db'))
+    print(f"Seeded in {time.perf_counter() - started:.1f}s: " + ', '.join(f'{n} {table}' for table, n in counts.items()))
+shutil.copy(os.path.join(data_dir, 'school.db'), os.environ['ENGAGE_DATABASE_PATH'])
+shutil.copytree(os.path.join(data_dir, 'uploads'), os.path.join(run_dir, 'uploads'))
+
+import app as web
+from database import db, User, Classroom, ClassroomTask, Task
+from attendance import ATTENDANCE_STATUSES
+from roster import load_roster
+
+app = web.create_app('production')
+app.config['UPLOAD_FOLDER'] = os.path.join(run_dir, 'uploads')
+
+# The people and rows the cases act on: classroom 1, its teacher, a student in it and its first task
+with app.app_context():
+    classroom = Classroom.query.get(1)
+    teacher = User.query.get(classroom.teacher_id)
+    student_ids = [student.id for student in load_roster(db.session, classroom.id)]
+    student = User.query.filter(User.id.in_(student_ids), User.parent_email.isnot(None)).order_by(User.id).first()
+    other_classroom_id = Classroom.query.filter(Classroom.id != classroom.id).first().id
+    task = ClassroomTask.query.filter_by(classroom_id=classroom.id).order_by(ClassroomTask.id).first()
+    stored_path = db.session.query(Task.file_path).join(ClassroomTask, Task.classroom_task_id == ClassroomTask.id) \
+        .filter(ClassroomTask.teacher_id == teacher.id, Task.file_hash.isnot(None)).limit(1).scalar()
+    CLASSROOM_ID, TEACHER_ID, STUDENT_ID, TASK_ID = classroom.id, teacher.id, student.id, task.id
+    TEACHER_NAME, STUDENT_NAME = teacher.username, student.username
+
+def logged_in_client(username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': 'password'})
+    assert response.status_code == 302, f'login as {username} failed'
+    return client
+
+clients = {'admin': logged_in_client('admin'), 'teacher': logged_in_client(TEACHER_NAME), 'student': logged_in_client(STUDENT_NAME)}
+
+def roll_call_form(i):
+    return {f'status_{student_id}': ATTENDANCE_STATUSES[(n + i) % len(ATTENDANCE_STATUSES)]
+            for n, student_id in enumerate(student_ids)}
+
+def submission_form(i):
+    return {'task_content': f'Answer {i}', 'classroom_task_id': str(TASK_ID),
+            'task_file': (io.BytesIO(f'Worked answer number {i}\n'.encode() * 200), 'answer.txt')}
+
+sender = {'sender_email': 'teacher@example.com', 'sender_password': 'password'}
+
+# name, endpoint, method, url, form data, client; url and data may be functions of the run number,
+# client is a function called (untimed) before each run
+WebCase = namedtuple('WebCase', ['name', 'endpoint', 'method', 'url', 'data', 'client'])
+as_admin, as_teacher, as_student = (lambda: clients['admin']), (lambda: clients['teacher']), (lambda: clients['student'])
+
+WEB_CASES = [
+    WebCase('home', 'main.home', 'GET', '/', None, app.test_client),
+    WebCase('login page', 'main.login', 'GET', '/login', None, app.test_client),
+    WebCase('login', 'main.login', 'POST', '/login', {'username': STUDENT_NAME, 'password': 'password'}, app.test_client),
+    WebCase('logout', 'main.logout', 'GET', '/logout', None, lambda: logged_in_client(STUDENT_NAME)),
+    WebCase('dashboard admin', 'main.dashboard', 'GET', '/dashboard', None, as_admin),
+    WebCase('dashboard admin search', 'main.dashboard', 'GET', '/dashboard?classroom_q=01&role=student&q=student1', None, as_admin),
+    WebCase('dashboard teacher', 'main.dashboard', 'GET', '/dashboard', None, as_teacher),
+    WebCase('dashboard student', 'main.dashboard', 'GET', '/dashboard', None, as_student),
+    WebCase('register page', 'main.register', 'GET', '/register', None, as_admin),
+    WebCase('register', 'main.register', 'POST', '/register',
+            lambda i: {'username': f'bench_new_{i}_{time.time_ns()}', 'password': 'password', 'role': 'student',
+                       'classroom_id': str(CLASSROOM_ID)}, as_admin),
+    WebCase('create classroom page', 'main.create_classroom', 'GET', '/create_classroom', None, as_admin),
+    WebCase('create classroom', 'main.create_classroom', 'POST', '/create_classroom',
+            lambda i: {'name': f'Bench classroom {i}', 'description': 'Benchmark', 'teacher_id': str(TEACHER_ID)}, as_admin),
+    WebCase('assign classroom', 'main.assign_classroom', 'POST', f'/assign_classroom/{STUDENT_ID}',
+            {'classroom_id': str(other_classroom_id), 'next': '/dashboard'}, as_admin),
+    WebCase('classroom lookup', 'main.classroom_lookup', 'GET', '/classrooms/lookup?q=Classroom 00', None, as_admin),
+    WebCase('classroom teacher', 'main.classroom_details', 'GET', f'/classroom/{CLASSROOM_ID}', None, as_teacher),
+    WebCase('classroom student', 'main.classroom_details', 'GET', f'/classroom/{CLASSROOM_ID}', None, as_student),
+    WebCase('mark attendance', 'main.mark_attendance', 'GET',
+            lambda i: f'/mark_attendance/{CLASSROOM_ID}/{STUDENT_ID}/{ATTENDANCE_STATUSES[i % len(ATTENDANCE_STATUSES)]}',
+            None, as_teacher),
+    WebCase('roll call', 'main.submit_roll_call', 'POST', f'/roll_call/{CLASSROOM_ID}', roll_call_form, as_teacher),
+    WebCase('classroom attendance', 'main.classroom_attendance', 'GET', f'/classroom/{CLASSROOM_ID}/attendance', None, as_teacher),
+    WebCase('attendance report', 'main.attendance_report', 'GET', '/reports/attendance', None, as_admin),
+    WebCase('attendance report classroom', 'main.attendance_report', 'GET',
+            f'/reports/attendance?classroom_id={CLASSROOM_ID}', None, as_admin),
+    WebCase('create task page', 'main.create_classroom_task', 'GET', f'/create_classroom_task/{CLASSROOM_ID}', None, as_teacher),
+    WebCase('create task', 'main.create_classroom_task', 'POST', f'/create_classroom_task/{CLASSROOM_ID}',
+            lambda i: {'title': f'Bench task {i}', 'description': 'Benchmark', 'due_date': '2030-01-01'}, as_teacher),
+    WebCase('submit task', 'main.submit_task', 'POST', '/submit_task', submission_form, as_student),
+    WebCase('task submissions', 'main.view_task_submissions', 'GET', f'/classroom_task/{TASK_ID}/submissions', None, as_teacher),
+    WebCase('uploaded file', 'main.uploaded_file', 'GET', f'/uploads/{stored_path}', None, as_teacher),
+    WebCase('thumbnail', 'main.upload_thumbnail', 'GET', f'/thumbnails/{stored_path}', None, as_teacher),
+    WebCase('parent notification page', 'main.send_parent_notification', 'GET',
+            f'/send_parent_notification/{CLASSROOM_ID}/{STUDENT_ID}', None, as_teacher),
+    WebCase('parent notification', 'main.send_parent_notification', 'POST',
+            f'/send_parent_notification/{CLASSROOM_ID}/{STUDENT_ID}',
+            dict(sender, subject='Attendance', message_body='Benchmark message'), as_teacher),
+    WebCase('notify absent page', 'main.notify_absent_parents', 'GET', f'/notify_absent_parents/{CLASSROOM_ID}', None, as_teacher),
+    WebCase('notify absent', 'main.notify_absent_parents', 'POST', f'/notify_absent_parents/{CLASSROOM_ID}', sender, as_teacher),
+    WebCase('notification status', 'main.notification_status', 'GET', f'/classroom/{CLASSROOM_ID}/notifications', None, as_teacher),
+    WebCase('debug sql', 'main.debug_sql', 'GET', '/debug/sql', None, as_admin),
+]
+
+if not stored_path:
+    WEB_CASES = [case for case in WEB_CASES if case.endpoint not in ('main.uploaded_file', 'main.upload_thumbnail')]
+
+def web_runner(case):
+    def run(i):
+        client = case.client()
+        url = case.url(i) if callable(case.url) else case.url
+        data = case.data(i) if callable(case.data) else case.data
+        with track_queries(case.name) as stats:
+            started = time.perf_counter()
+            response = client.open(url, method=case.method, data=data)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{case.method} {url} returned {response.status_code}')
+        return elapsed, stats.count
+    return run
+
+# Desktop loaders, run headless. Each case is the loader's query (fetched on this thread
+# instead of the load pool, so its queries are counted) plus filling the widget's table.
+from PyQt5.QtWidgets import QApplication
+qt_app = QApplication.instance() or QApplication([])
+import desktop_app as desktop
+import desktop_loader as loads
+from task_submissions_dialog import TaskSubmissionsDialog
+
+desktop_admin = loads.fetch('bench', loads.signed_in_user, 1)
+desktop_teacher = loads.fetch('bench', loads.signed_in_user, TEACHER_ID)
+desktop_student = loads.fetch('bench', loads.signed_in_user, STUDENT_ID)
+admin_dashboard = desktop.AdminDashboard(desktop_admin)
+teacher_dashboard = desktop.TeacherDashboard(desktop_teacher)
+student_dashboard = desktop.StudentDashboard(desktop_student)
+teacher_classroom = desktop.ClassroomDetailsDialog(CLASSROOM_ID, desktop_teacher)
+student_classroom = desktop.ClassroomDetailsDialog(CLASSROOM_ID, desktop_student)
+submissions_dialog = TaskSubmissionsDialog(TASK_ID)
+loads.load_pool().waitForDone()  # the loads the widgets started for themselves
+qt_app.processEvents()
+report_range = admin_dashboard.report_range()
+
+def desktop_case(label, show, query, *query_args):
+    return (f'desktop {label}', lambda: show(loads.fetch(label, query, *query_args)))
+
+DESKTOP_CASES = [
+    desktop_case('AdminDashboard.load_classrooms', admin_dashboard.show_classrooms, loads.all_classrooms),
+    desktop_case('AdminDashboard.load_users', admin_dashboard.show_users, loads.staff_users),
+    desktop_case('AdminDashboard.load_report', admin_dashboard.show_report, loads.attendance_report, *report_range),
+    desktop_case('AdminDashboard.load_classroom_report', admin_dashboard.show_classroom_report,
+                 loads.classroom_attendance_report, CLASSROOM_ID, *report_range),
+    desktop_case('TeacherDashboard.load_classrooms', teacher_dashboard.show_classrooms, loads.teacher_classrooms, TEACHER_ID),
+    desktop_case('StudentDashboard.load_tasks', student_dashboard.show_tasks, loads.student_submissions, STUDENT_ID),
+    desktop_case('ClassroomDetailsDialog.load_students', teacher_classroom.show_students, loads.classroom_students, CLASSROOM_ID),
+    desktop_case('ClassroomDetailsDialog.load_tasks', teacher_classroom.show_tasks, loads.classroom_tasks, CLASSROOM_ID),
+    desktop_case('ClassroomDetailsDialog.load_student_tasks', student_classroom.show_student_tasks,
+                 loads.classroom_tasks_for_student, CLASSROOM_ID, STUDENT_ID),
+    desktop_case('TaskSubmissionsDialog.load_submissions', submissions_dialog.show_submissions, loads.task_submissions, TASK_ID),
+]
+
+def desktop_runner(name, loader):
+    def run(i):
+        with track_queries(name) as stats:
+            started = time.perf_counter()
+            loader()
+            elapsed = time.perf_counter() - started
+        return elapsed, stats.count
+    return run
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+uncovered = sorted({rule.endpoint for rule in app.url_map.iter_rules()} - {case.endpoint for case in WEB_CASES} - {'static'})
+if uncovered:
+    print(f"Warning: no benchmark case for {', '.join(uncovered)}")
+
+cases = [(case.name, web_runner(case)) for case in WEB_CASES] + [(name, desktop_runner(name, loader)) for name, loader in DESKTOP_CASES]
+if args.only:
+    cases = [(name, run) for name, run in cases if args.only in name]
+
+baseline = None
+if os.path.exists(args.baseline):
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['size'] != size._asdict():
+        print(f"Baseline {args.baseline} was recorded for {baseline['size']}; not comparing")
+        baseline = None
+
+print(f"{args.repeat} runs per case; {size.students} students, {size.classrooms} classrooms, "
+      f"{size.days} days of attendance, {size.submissions} submissions")
+print(f"{'case':<48} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'base p95':>9} {'base q':>7}")
+
+results = {}
+regressions = []
+for name, run in cases:
+    run(0)  # warm-up: first-use caches and compiled statements
+    timings, query_counts = zip(*(run(i) for i in range(1, args.repeat + 1)))
+    result = results[name] = {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'queries': sorted(query_counts)[len(query_counts) // 2],
+    }
+    base = (baseline or {}).get('results', {}).get(name)
+    flag = ''
+    if base:
+        slower = result['p95_ms'] > base['p95_ms'] * (1 + args.tolerance) and result['p95_ms'] - base['p95_ms'] > MIN_REGRESSION_MS
+        if slower or result['queries'] > base['queries']:
+            regressions.append(name)
+            flag = '  REGRESSION'
+    print(f"{name:<48} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['queries']:>8} "
+          f"{base['p95_ms'] if base else '-':>9} {base['queries'] if base else '-':>7}{flag}")
+
+if args.save_baseline:
+    if args.only and baseline:
+        results = dict(baseline['results'], **results)
+    with open(args.baseline, 'w') as baseline_file:
+        json.dump({'size': size._asdict(), 'results': results}, baseline_file, indent=2, sort_keys=True)
+    print(f"Baseline written to {args.baseline}")
+
+shutil.rmtree(run_dir, ignore_errors=True)
+if regressions and not args.save_baseline:
+    print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    sys.exit(1)
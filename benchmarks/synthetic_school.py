@@ -0,0 +1,135 @@
+# benchmarks/synthetic_school.py
+
+# Seeds a synthetic school into an empty database through the models in database.py:
+# one admin, a teacher per two classrooms, students spread evenly over the classrooms
+# (legacy classroom_id plus a membership row), a few tasks per classroom, one
+# attendance row per student per day, and submissions, every tenth with a stored file.
+# Everybody's password is 'password'. Used by bench_school.py.
+
+import os
+import random
+from datetime import datetime, timedelta
+from collections import namedtuple
+from sqlalchemy.orm import sessionmaker
+from database import (db, make_engine, User, Classroom, ClassroomMembership, ClassroomTask, Task, Attendance,
+                      UploadBlob, ATTENDANCE_ROLLUP_TRIGGERS)
+from passwords import hash_password
+from reports import rebuild_attendance_rollups
+from upload_store import blob_path
+
+SchoolSize = namedtuple('SchoolSize', ['students', 'classrooms', 'days', 'submissions', 'tasks_per_classroom'])
+
+SIZES = {
+    'small': SchoolSize(students=2000, classrooms=60, days=30, submissions=10000, tasks_per_classroom=5),
+    'school': SchoolSize(students=20000, classrooms=600, days=100, submissions=100000, tasks_per_classroom=10),
+}
+
+BATCH_SIZE = 50000
+STORED_FILES = 50  # distinct files behind the submissions that have one
+
+def _insert(session, model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(model.__table__.insert(), rows[start:start + BATCH_SIZE])
+
+def seed_school(database_path, upload_folder, size, seed=42):
+    """Create the schema in a new database file and fill it; returns the row counts."""
+    rng = random.Random(seed)
+    engine = make_engine(f'sqlite:///{database_path}')
+    db.Model.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    now = datetime.now().replace(microsecond=0)
+    today = now.date()
+    password_hash = hash_password('password', 4)  # cheap to check; bench runs with ENGAGE_BCRYPT_ROUNDS=4
+
+    _insert(session, User, [{'id': 1, 'username': 'admin', 'password_hash': password_hash, 'role': 'admin'}])
+
+    teacher_count = max(1, size.classrooms // 2)
+    _insert(session, User, [
+        {'id': 2 + n, 'username': f'teacher{n}', 'password_hash': password_hash, 'role': 'teacher'}
+        for n in range(teacher_count)
+    ])
+    _insert(session, Classroom, [
+        {'id': 1 + n, 'name': f'Classroom {n:04d}', 'description': f'Synthetic classroom {n}',
+         'teacher_id': 2 + n % teacher_count}
+        for n in range(size.classrooms)
+    ])
+
+    first_student_id = 2 + teacher_count
+    students = [(first_student_id + n, 1 + n % size.classrooms) for n in range(size.students)]
+    _insert(session, User, [
+        {'id': user_id, 'username': f'student{user_id - first_student_id}', 'password_hash': password_hash,
+         'role': 'student', 'classroom_id': classroom_id,
+         'parent_email': f'parent{user_id}@example.com' if rng.random() < 0.9 else None}
+        for user_id, classroom_id in students
+    ])
+    _insert(session, ClassroomMembership, [
+        {'user_id': user_id, 'classroom_id': classroom_id} for user_id, classroom_id in students
+    ])
+
+    tasks_by_classroom = {}
+    task_rows = []
+    for classroom_id in range(1, size.classrooms + 1):
+        for n in range(size.tasks_per_classroom):
+            task_id = len(task_rows) + 1
+            task_rows.append({'id': task_id, 'title': f'Task {n}', 'description': 'Synthetic task ' * 8,
+                              'classroom_id': classroom_id, 'teacher_id': 2 + (classroom_id - 1) % teacher_count,
+                              'created_date': now - timedelta(days=7 * n), 'due_date': now + timedelta(days=7 - n)})
+            tasks_by_classroom.setdefault(classroom_id, []).append(task_id)
+    _insert(session, ClassroomTask, task_rows)
+
+    # A few stored files shared by many submissions, as with a handed-back worksheet
+    blobs = []
+    for n in range(STORED_FILES):
+        contents = rng.randbytes(rng.randint(20000, 400000))
+        file_hash = '%064x' % rng.getrandbits(256)
+        path = blob_path(file_hash, '.pdf')
+        os.makedirs(os.path.join(upload_folder, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(upload_folder, path), 'wb') as stored_file:
+            stored_file.write(contents)
+        blobs.append({'hash': file_hash, 'path': path, 'size': len(contents), 'refcount': 0, 'created_at': now})
+
+    submission_rows = []
+    submitted = set()
+    while len(submission_rows) < min(size.submissions, size.students * size.tasks_per_classroom):
+        user_id, classroom_id = students[rng.randrange(len(students))]
+        task_id = rng.choice(tasks_by_classroom[classroom_id])
+        if (user_id, task_id) in submitted:
+            continue
+        submitted.add((user_id, task_id))
+        row = {'user_id': user_id, 'classroom_task_id': task_id, 'content': 'Synthetic answer ' * 10,
+               'date': now - timedelta(minutes=rng.randrange(60 * 24 * 30)),
+               'file_path': None, 'file_type': None, 'file_hash': None}
+        if len(submission_rows) % 10 == 0:
+            blob = blobs[rng.randrange(len(blobs))]
+            blob['refcount'] += 1
+            row.update(file_path=blob['path'], file_type='document', file_hash=blob['hash'])
+        submission_rows.append(row)
+    _insert(session, UploadBlob, blobs)
+    _insert(session, Task, submission_rows)
+    session.commit()
+
+    # Attendance is loaded without the rollup triggers, then the rollups are built in one pass
+    connection = session.connection()
+    for name in ATTENDANCE_ROLLUP_TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+    attendance_rows = 0
+    for day_offset in range(size.days, 0, -1):
+        day = today - timedelta(days=day_offset)
+        marked_at = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=5)
+        statuses = rng.choices(('present', 'absent', 'late'), weights=(85, 10, 5), k=len(students))
+        _insert(session, Attendance, [
+            {'user_id': user_id, 'classroom_id': classroom_id, 'status': status, 'date': marked_at, 'day': day}
+            for (user_id, classroom_id), status in zip(students, statuses)
+        ])
+        attendance_rows += len(students)
+    session.commit()
+    for trigger_sql in ATTENDANCE_ROLLUP_TRIGGERS.values():
+        session.connection().exec_driver_sql(trigger_sql)
+    session.commit()
+    rebuild_attendance_rollups(session)
+
+    session.connection().exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    session.close()
+    engine.dispose()
+    return {'users': 1 + teacher_count + len(students), 'classrooms': size.classrooms, 'tasks': len(task_rows),
+            'submissions': len(submission_rows), 'attendance': attendance_rows}
@@ -0,0 +1,33 @@
+# bootstrap.py
+
+# One-time database setup: create the schema (tables, indexes, attendance rollup
+# triggers) and seed the Default Classroom and the default admin account.
+# Run it once per database with `python manage.py bootstrap`; serving never does this.
+
+from sqlalchemy import inspect
+from database import db, User, Classroom
+from passwords import hash_password
+
+def database_is_bootstrapped(engine):
+    """True when every table of the current schema exists (one catalog query, creates nothing)."""
+    return set(db.Model.metadata.tables) <= set(inspect(engine).get_table_names())
+
+def bootstrap_database(engine, session):
+    """
+    Create any missing tables and seed the default classroom and admin user.
+    Safe to run again: existing tables and rows are left alone.
+    """
+    db.Model.metadata.create_all(bind=engine)
+    
+    # Check if a default classroom exists
+    if not session.query(Classroom).filter_by(name='Default Classroom').first():
+        session.add(Classroom(name='Default Classroom', description='Default classroom for all students'))
+        session.commit()
+        print("Default classroom created.")
+    
+    # Check if an admin user already exists
+    if not session.query(User).filter_by(username='admin').first():
+        print("Creating default admin user...")
+        session.add(User(username='admin', password_hash=hash_password('admin_password'), role='admin'))
+        session.commit()
+        print("Default admin user created with username 'admin' and password 'admin_password'.")
@@ -0,0 +1,160 @@
+# cache.py
+
+# Small caches shared by the web application and the desktop client: LRUCache lives in
+# one process; SQLiteCache has the same interface but keeps its entries in a SQLite file,
+# so several web worker processes can share them.
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel for "not in cache" so None can be cached
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe in-process cache with a bounded size and least-recently-used eviction.
+    Entries optionally expire after ttl seconds. Hit and miss counters are kept so we
+    can check whether the cache is doing any good.
+    """
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry when full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def keys(self):
+        """Keys of the entries that have not expired (does not count as hits or misses)."""
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires_at, _) in self._entries.items() if expires_at is None or expires_at > now]
+
+    def invalidate(self, key):
+        """Drop a single entry if it is cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry (the counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size and hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class SQLiteCache:
+    """
+    Cache with LRUCache's interface whose entries live in a SQLite file shared by every
+    process that opens it. Values are pickled. Expired entries are skipped on read and
+    purged every purge_interval writes; maxsize is enforced at the same time by
+    dropping the entries that expire soonest.
+    """
+    def __init__(self, path, maxsize=1024, ttl=None, purge_interval=100):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()  # one connection per thread
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss or an expired entry."""
+        row = self._connection().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (repr(key), time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        """Store value under key (replacing any entry another process stored)."""
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                               (repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at))
+            self._writes += 1
+            if self._writes % self.purge_interval == 0:
+                self._purge(connection)
+
+    def _purge(self, connection):
+        connection.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (time.time(),))
+        connection.execute('DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry '
+                           'ORDER BY expires_at LIMIT max(0, (SELECT COUNT(*) FROM cache_entry) - ?))',
+                           (self.maxsize,))
+
+    def invalidate(self, key):
+        """Drop a single entry if it is cached."""
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache_entry WHERE key = ?', (repr(key),))
+
+    def clear(self):
+        """Drop every entry (the counters are kept)."""
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache_entry')
+
+    def stats(self):
+        """Size and this process's hit/miss counters for monitoring."""
+        size = self._connection().execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'path': self.path,
+        }
@@ -0,0 +1,45 @@
+# check_query_plans.py
+
+# Prints the SQLite EXPLAIN QUERY PLAN output for the hot attendance queries so we
+# can confirm they are served by the composite indexes instead of full table scans.
+# Run after migrate_db.py:  python check_query_plans.py
+
+from app import create_app
+from database import db, Attendance
+from attendance import attendance_today
+
+app = create_app()
+
+
+def explain(query):
+    """Return the EXPLAIN QUERY PLAN rows for an ORM query."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+
+
+with app.app_context():
+    today = attendance_today()
+
+    # Roster views: classroom_details, classroom_attendance, ClassroomDetailsDialog.load_students
+    roster_query = Attendance.query.filter_by(classroom_id=1, day=today)
+
+    # send_parent_notification / EmailSetupDialog lookup of a single student's record
+    # (mark_attendance itself is an upsert resolved through the same unique index)
+    mark_query = Attendance.query.filter_by(user_id=1, classroom_id=1, day=today)
+
+    all_indexed = True
+    for label, query in [('Roster attendance', roster_query), ('Student attendance lookup', mark_query)]:
+        print(f"{label}:")
+        for row in explain(query):
+            detail = row[-1]
+            print(f"    {detail}")
+            if detail.startswith('SCAN') and 'INDEX' not in detail:
+                all_indexed = False
+        print()
+
+    if all_indexed:
+        print("All attendance queries use an index.")
+    else:
+        print("WARNING: at least one attendance query is doing a full table scan. Run migrate_db.py.")
@@ -0,0 +1,107 @@
+# classroom_cache.py
+
+# Cached data behind the classroom page: the classroom, its tasks, its roster and today's
+# attendance marks, plus HTML fragments rendered from them. Entries are keyed by classroom
+# id, the classroom's version counter (ClassroomVersion) and the day. Every write that
+# changes any of them calls bump_classroom_version in its own transaction; the next page
+# view then reads one counter, misses, and rebuilds. Old entries are never invalidated,
+# only aged out.
+#
+# The entries live in this process's memory by default. Set
+# ENGAGE_CLASSROOM_CACHE=/path/to/cache.db to keep them in a SQLite file instead, so
+# every worker of `manage.py serve` shares them.
+
+import os
+from collections import namedtuple
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import joinedload
+from cache import LRUCache, SQLiteCache
+from database import Classroom, ClassroomTask, ClassroomMembership, ClassroomVersion, Attendance, User
+from roster import load_roster
+from attendance import attendance_today
+
+CLASSROOM_CACHE = os.environ.get('ENGAGE_CLASSROOM_CACHE', 'memory')
+CLASSROOM_CACHE_SIZE = int(os.environ.get('ENGAGE_CLASSROOM_CACHE_SIZE', 256))
+CLASSROOM_CACHE_TTL = int(os.environ.get('ENGAGE_CLASSROOM_CACHE_TTL', 3600))
+
+# Read-only snapshots (shaped like the models the template reads, and picklable)
+TeacherSnapshot = namedtuple('TeacherSnapshot', ['id', 'username'])
+ClassroomSnapshot = namedtuple('ClassroomSnapshot', ['id', 'name', 'description', 'teacher_id', 'teacher'])
+TaskSnapshot = namedtuple('TaskSnapshot', ['id', 'title', 'description', 'due_date', 'created_date', 'teacher_id'])
+ClassroomDetails = namedtuple('ClassroomDetails', ['key', 'classroom', 'tasks', 'students', 'attendance'])
+
+def make_cache(spec=None):
+    """'memory' for a per-process LRUCache, otherwise the path of a shared SQLiteCache file."""
+    spec = spec or CLASSROOM_CACHE
+    if spec == 'memory':
+        return LRUCache(maxsize=CLASSROOM_CACHE_SIZE, ttl=CLASSROOM_CACHE_TTL)
+    return SQLiteCache(spec, maxsize=CLASSROOM_CACHE_SIZE, ttl=CLASSROOM_CACHE_TTL)
+
+classroom_cache = make_cache()
+
+def classroom_version(session, classroom_id):
+    version = session.query(ClassroomVersion.version).filter_by(classroom_id=classroom_id).scalar()
+    return version or 0
+
+def bump_classroom_version(session, *classroom_ids):
+    """
+    Retire the cached data of the given classrooms (None and empty ids are ignored).
+    Runs in the caller's transaction, so other processes see the bump when it commits.
+    """
+    for classroom_id in {int(classroom_id) for classroom_id in classroom_ids if classroom_id}:
+        session.execute(
+            insert(ClassroomVersion.__table__)
+            .values(classroom_id=classroom_id, version=1)
+            .on_conflict_do_update(index_elements=['classroom_id'],
+                                   set_={'version': ClassroomVersion.__table__.c.version + 1})
+        )
+
+def bump_student_classrooms(session, user_id):
+    """Bump every classroom the student is on (e.g. after their parent email changes)."""
+    legacy_id = session.query(User.classroom_id).filter_by(id=user_id).scalar()
+    member_ids = [classroom_id for (classroom_id,) in
+                  session.query(ClassroomMembership.classroom_id).filter_by(user_id=user_id)]
+    bump_classroom_version(session, legacy_id, *member_ids)
+
+def load_classroom_details(session, classroom_id, day, key=None):
+    """Query the classroom page's data; None if the classroom does not exist."""
+    classroom = session.query(Classroom).options(joinedload(Classroom.teacher)).get(classroom_id)
+    if classroom is None:
+        return None
+    teacher = TeacherSnapshot(classroom.teacher.id, classroom.teacher.username) if classroom.teacher else None
+    tasks = session.query(ClassroomTask.id, ClassroomTask.title, ClassroomTask.description, ClassroomTask.due_date,
+                          ClassroomTask.created_date, ClassroomTask.teacher_id) \
+        .filter_by(classroom_id=classroom_id).order_by(ClassroomTask.created_date.desc()).all()
+    attendance = dict(session.query(Attendance.user_id, Attendance.status)
+                      .filter_by(classroom_id=classroom_id, day=day))
+    return ClassroomDetails(
+        key=key,
+        classroom=ClassroomSnapshot(classroom.id, classroom.name, classroom.description, classroom.teacher_id, teacher),
+        tasks=tuple(TaskSnapshot(*task) for task in tasks),
+        students=load_roster(session, classroom_id),
+        attendance=attendance,
+    )
+
+def get_classroom_details(session, classroom_id):
+    """Cached ClassroomDetails for today (one counter lookup on a hit), or None if there is no such classroom."""
+    classroom_id = int(classroom_id)
+    day = attendance_today()
+    key = ('classroom', classroom_id, classroom_version(session, classroom_id), day.isoformat())
+    details = classroom_cache.get(key)
+    if details is None:
+        details = load_classroom_details(session, classroom_id, day, key)
+        if details is not None:
+            classroom_cache.set(key, details)
+    return details
+
+def get_fragment(details, name, render):
+    """
+    HTML rendered from a ClassroomDetails, cached under the same version: render() is
+    called on a miss. name must cover everything else the HTML depends on (e.g. the viewer's role).
+    """
+    key = details.key + (name,)
+    html = classroom_cache.get(key)
+    if html is None:
+        html = str(render())
+        classroom_cache.set(key, html)
+    return html
@@ -0,0 +1,55 @@
+# config.py
+
+# Configuration classes for create_app(). Pick one by class or by name
+# ('development', 'production', 'testing'); ENGAGE_CONFIG sets the default.
+
+import os
+from database import BASE_DIR, DATABASE_URI, SQLITE_PRAGMAS
+
+class Config:
+    SECRET_KEY = os.environ.get('ENGAGE_SECRET_KEY', 'your_super_secret_key') # Set ENGAGE_SECRET_KEY in production
+    SQLALCHEMY_DATABASE_URI = DATABASE_URI # Shared SQLite database (instance/site.db)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = SQLITE_PRAGMAS # WAL, synchronous, busy_timeout, cache/mmap sizes, temp_store
+    ENFORCE_QUERY_BUDGETS = None # None: enforce only when app.testing is set
+    SQL_RECENT_REQUESTS = 50 # Per-request SQL summaries kept for /debug/sql
+
+    # File upload configuration
+    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
+    ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('ENGAGE_UPLOAD_CACHE_MAX_AGE', 86400)) # Seconds browsers may reuse a downloaded upload (files never change)
+    THUMBNAIL_CACHE_MAX_AGE = int(os.environ.get('ENGAGE_THUMBNAIL_CACHE_MAX_AGE', 365 * 86400)) # Same for image thumbnails
+    # Who streams /uploads bytes: '' the web worker, 'x-sendfile' Apache/lighttpd, 'x-accel-redirect' nginx
+    UPLOAD_SENDFILE = os.environ.get('ENGAGE_UPLOAD_SENDFILE', '')
+    UPLOAD_ACCEL_PREFIX = os.environ.get('ENGAGE_UPLOAD_ACCEL_PREFIX', '/protected-uploads/') # nginx internal location aliased to UPLOAD_FOLDER
+    USE_X_SENDFILE = UPLOAD_SENDFILE == 'x-sendfile'
+
+    # Admin dashboard rows per page (classrooms and users are paged separately)
+    DASHBOARD_PAGE_SIZE = 50
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+class ProductionConfig(Config):
+    DEBUG = False
+
+class TestingConfig(Config):
+    TESTING = True
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+def get_config(config=None):
+    """Resolve a config class, name or None (ENGAGE_CONFIG, default 'development')."""
+    if config is None:
+        config = os.environ.get('ENGAGE_CONFIG', 'development')
+    if isinstance(config, str):
+        try:
+            return CONFIGS[config]
+        except KeyError:
+            raise ValueError(f"Unknown config '{config}' (expected one of: {', '.join(CONFIGS)})")
+    return config
@@ -2,7 +2,8 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdi
                              QTextEdit, QPushButton, QMessageBox, QDateEdit, QCheckBox)
 from PyQt5.QtCore import Qt, QDate
 from datetime import datetime
-from database import ClassroomTask, db_session
+from database import ClassroomTask, session_scope
+from classroom_cache import bump_classroom_version
 from session import get, set
 
 class CreateClassroomTaskDialog(QDialog):
@@ -83,10 +84,10 @@ class CreateClassroomTaskDialog(QDialog):
         )
 
         try:
-            db_session.add(new_task)
-            db_session.commit()
+            with session_scope() as session:
+                session.add(new_task)
+                bump_classroom_version(session, self.classroom_id)
             QMessageBox.information(self, 'Success', 'Task created successfully')
             self.accept()
         except Exception as e:
-            db_session.rollback()
             QMessageBox.warning(self, 'Error', f'Failed to create task: {str(e)}')
\ No newline at end of file
@@ -1,18 +1,273 @@
 # database.py
 
+import os
+import re
+import time
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import wraps
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, Session as OrmSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+# Database location shared by the web app, the desktop app and the maintenance scripts
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.environ.get('ENGAGE_DATABASE_PATH', os.path.join(BASE_DIR, 'instance', 'site.db'))
+DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
+
+# SQLite tuning applied to every new connection; each setting can be overridden from the environment.
+# Use ENGAGE_SQLITE_JOURNAL_MODE=DELETE if the database lives on a network share (WAL needs local shared memory).
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.environ.get('ENGAGE_SQLITE_BUSY_TIMEOUT', 5000)),  # ms to wait on a lock before "database is locked"
+    'journal_mode': os.environ.get('ENGAGE_SQLITE_JOURNAL_MODE', 'WAL'),  # readers keep reading while a writer commits
+    'synchronous': os.environ.get('ENGAGE_SQLITE_SYNCHRONOUS', 'NORMAL'),  # safe with WAL, far fewer fsyncs than FULL
+    'cache_size': int(os.environ.get('ENGAGE_SQLITE_CACHE_SIZE', -65536)),  # negative means KiB, so 64 MB per connection
+    'mmap_size': int(os.environ.get('ENGAGE_SQLITE_MMAP_SIZE', 268435456)),  # bytes of the file to memory-map (256 MB)
+    'temp_store': os.environ.get('ENGAGE_SQLITE_TEMP_STORE', 'MEMORY'),  # sorts and temp tables stay in RAM
+}
+SQLITE_POOL_SIZE = int(os.environ.get('ENGAGE_SQLITE_POOL_SIZE', 5))
+
+def make_engine(uri=None, pragmas=None, **options):
+    """
+    Create a SQLAlchemy engine for the application database.
+    Every entry point (Flask, desktop app, dialogs, scripts) builds its engine here so
+    they all share the same file, connection pooling and PRAGMA settings.
+    """
+    url = make_url(uri or DATABASE_URI)
+    settings = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        # Keep connections (and their page cache) open instead of reconnecting per checkout
+        options.setdefault('poolclass', QueuePool)
+        options.setdefault('pool_size', SQLITE_POOL_SIZE)
+        options.setdefault('connect_args', {}).setdefault('check_same_thread', False)
+
+    engine = create_engine(url, **options)
+
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in settings.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.close()
+
+    return engine
+
+class TunedSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension whose engines are built by make_engine, so the web app
+    gets the same SQLite settings as the desktop app. The PRAGMAs come from the
+    SQLITE_PRAGMAS app config key.
+    """
+    def apply_driver_hacks(self, app, sa_url, options):
+        # Skip Flask-SQLAlchemy's SQLite defaults (NullPool, paths relative to app.root_path)
+        if sa_url.drivername.startswith('sqlite'):
+            options['pragmas'] = app.config.get('SQLITE_PRAGMAS')
+            return sa_url, options
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        return make_engine(sa_url, **engine_opts)
 
 # Initialize SQLAlchemy
-db = SQLAlchemy()
+db = TunedSQLAlchemy()
+
+# Every Session made by the factory below, so session_report() can size their identity maps
+_live_sessions = weakref.WeakSet()
+_live_sessions_lock = threading.Lock()
+
+class TrackedSession(OrmSession):
+    """A Session that registers itself for session_report()."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with _live_sessions_lock:
+            _live_sessions.add(self)
+
+# Create database engine and session factory (the desktop app and scripts open one
+# session per unit of work through session_scope; there is no long-lived shared session)
+engine = make_engine()
+Session = sessionmaker(bind=engine, class_=TrackedSession)
+
+@contextmanager
+def session_scope(expire_on_commit=True):
+    """
+    A unit of work: a new session that is committed when the block ends, rolled back if it
+    raises, and closed either way, so its identity map never outlives the operation.
+    Objects loaded in the block are detached afterwards; pass expire_on_commit=False to keep
+    reading their loaded attributes (e.g. a new row's id) once the block has committed.
+    """
+    session = Session(expire_on_commit=expire_on_commit)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _resident_memory_kb():
+    # Current resident set size where /proc is available (Linux), else None
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def session_report():
+    """
+    Sizes of every Session still alive in this process: how many there are, how many hold
+    objects or an open transaction, and how many objects their identity maps hold in total
+    and at most. A long-running desktop app should keep these flat.
+    """
+    with _live_sessions_lock:
+        sessions = list(_live_sessions)
+    sizes = [len(session.identity_map) for session in sessions]
+    return {
+        'sessions': len(sessions),
+        'open_sessions': sum(1 for session, size in zip(sessions, sizes) if size or session.in_transaction()),
+        'identity_map_objects': sum(sizes),
+        'largest_identity_map': max(sizes, default=0),
+        'resident_kb': _resident_memory_kb(),
+    }
+
+def format_session_report(report=None):
+    report = report or session_report()
+    resident = f"{report['resident_kb'] / 1024:.1f} MB" if report['resident_kb'] is not None else 'n/a'
+    return (f"[Sessions] {report['sessions']} alive, {report['open_sessions']} open, "
+            f"{report['identity_map_objects']} objects in identity maps (largest {report['largest_identity_map']}), "
+            f"resident {resident}")
+
+# --- SQL instrumentation ---
+
+# Print a per-load SQL summary line in the desktop app (ENGAGE_SQL_LOG=1)
+SQL_LOG = os.environ.get('ENGAGE_SQL_LOG', '0') == '1'
+# Number of slowest normalized statements kept in each summary
+SQL_STATS_TOP_N = int(os.environ.get('ENGAGE_SQL_STATS_TOP_N', 5))
+
+# Per-thread stack of active QueryStats collectors (see track_queries)
+_query_tracking = threading.local()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+def normalize_statement(statement):
+    """Collapse literals, IN lists and whitespace so repeats of one query group together."""
+    statement = _WHITESPACE_RE.sub(' ', statement).strip()
+    statement = _STRING_LITERAL_RE.sub('?', statement)
+    statement = _NUMBER_LITERAL_RE.sub('?', statement)
+    return _PLACEHOLDER_LIST_RE.sub('(?, ...)', statement)
+
+class QueryStats:
+    """
+    SQL statements executed while a track_queries() block is active:
+    how many, how long in total, and time per normalized statement.
+    """
+    def __init__(self, label=None):
+        self.label = label
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = {}  # normalized statement -> [calls, total seconds, slowest seconds]
+
+    def record(self, statement, elapsed):
+        self.total_time += elapsed
+        entry = self.statements.setdefault(normalize_statement(statement), [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def slowest(self, top_n=SQL_STATS_TOP_N):
+        """The top_n normalized statements by total time spent in them."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:top_n]
+        return [
+            {'statement': statement, 'calls': calls, 'total_ms': round(total * 1000, 3), 'max_ms': round(slowest * 1000, 3)}
+            for statement, (calls, total, slowest) in ranked
+        ]
+
+    def as_dict(self, top_n=SQL_STATS_TOP_N):
+        return {
+            'label': self.label,
+            'queries': self.count,
+            'db_time_ms': round(self.total_time * 1000, 3),
+            'slowest': self.slowest(top_n),
+        }
+
+    def summary(self):
+        """One-line summary for logs."""
+        line = f'[SQL] {self.label}: {self.count} queries in {self.total_time * 1000:.1f} ms'
+        slowest = self.slowest(1)
+        if slowest:
+            line += f' (slowest: {slowest[0]["total_ms"]} ms x{slowest[0]["calls"]} {slowest[0]["statement"][:120]})'
+        return line
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+    for stats in getattr(_query_tracking, 'stack', ()):
+        stats.count += 1
 
-# Create database engine and session
-engine = create_engine('sqlite:///instance/site.db')
-Session = sessionmaker(bind=engine)
-db_session = Session()
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    for stats in getattr(_query_tracking, 'stack', ()):
+        stats.record(statement, elapsed)
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_failed_start_time(exception_context):
+    # after_cursor_execute never runs for a failed statement
+    start_times = exception_context.connection.info.get('query_start_time') if exception_context.connection else None
+    if start_times:
+        start_times.pop()
+
+def start_query_tracking(label=None):
+    """Start collecting SQL statements run by the current thread; returns the QueryStats."""
+    stack = getattr(_query_tracking, 'stack', None)
+    if stack is None:
+        stack = _query_tracking.stack = []
+    stats = QueryStats(label)
+    stack.append(stats)
+    return stats
+
+def stop_query_tracking(stats):
+    """Stop collecting into stats (safe to call twice)."""
+    stack = getattr(_query_tracking, 'stack', [])
+    if stats in stack:
+        stack.remove(stats)
+
+@contextmanager
+def track_queries(label=None):
+    """
+    Collect the SQL statements executed by the current thread on any engine.
+    Blocks can be nested; each collector sees every statement run inside it.
+    """
+    stats = start_query_tracking(label)
+    try:
+        yield stats
+    finally:
+        stop_query_tracking(stats)
+
+def logged_queries(label):
+    """Decorator for desktop loaders: track their SQL and print a summary line when SQL_LOG is on."""
+    def decorator(function):
+        @wraps(function)
+        def wrapped(*args, **kwargs):
+            if not SQL_LOG:
+                return function(*args, **kwargs)
+            with track_queries(label) as stats:
+                result = function(*args, **kwargs)
+            print(stats.summary())
+            return result
+        return wrapped
+    return decorator
 
 # Define the database models
 class User(db.Model, UserMixin):
@@ -50,7 +305,20 @@ class ClassroomMembership(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=False)
-    __table_args__ = (db.UniqueConstraint('user_id', 'classroom_id', name='uq_user_classroom'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'classroom_id', name='uq_user_classroom'),
+        db.Index('ix_classroom_membership_classroom_user', 'classroom_id', 'user_id'),  # roster lookups
+    )
+
+class ClassroomVersion(db.Model):
+    """
+    Per-classroom counter bumped by every write that changes what the classroom page
+    shows (tasks, roster, today's attendance). Cached classroom data is keyed by it,
+    so a bump committed by any process (web worker or desktop app) retires the old entries.
+    """
+    __tablename__ = 'classroom_version'
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 # Define relationships after all models are defined to avoid circular dependencies
 User.classroom = db.relationship('Classroom', foreign_keys=[User.classroom_id], backref=db.backref('legacy_students', lazy=True))
@@ -71,15 +339,97 @@ class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=False)
-    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.now) # Local time of the last mark
+    day = db.Column(db.Date, nullable=False, default=lambda: datetime.now().date()) # Local calendar day bucket
     status = db.Column(db.String(10), nullable=False) # 'present', 'absent', or 'late'
     
+    # One row per student, classroom and day; the unique index also serves the per-student lookup
+    __table_args__ = (
+        db.Index('ix_attendance_classroom_day', 'classroom_id', 'day'),
+        db.Index('uq_attendance_user_classroom_day', 'user_id', 'classroom_id', 'day', unique=True),
+    )
+    
     # Relationships
     user = db.relationship('User', backref=db.backref('attendances', lazy=True))
     classroom = db.relationship('Classroom', backref=db.backref('attendances', lazy=True))
     
     def __repr__(self):
         return f'<Attendance {self.user_id} in {self.classroom_id} on {self.date.strftime("%Y-%m-%d")}>'
+
+class AttendanceDailyRollup(db.Model):
+    """
+    Present/absent/late counts per classroom and day, kept current by the
+    attendance triggers below. Reports read these instead of raw attendance rows.
+    """
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Date-range reports across every classroom
+    __table_args__ = (
+        db.Index('ix_attendance_daily_rollup_day', 'day'),
+    )
+
+class StudentAttendanceRollup(db.Model):
+    """
+    Present/absent/late counts per student, classroom and month ('YYYY-MM'),
+    kept current by the attendance triggers below.
+    """
+    __tablename__ = 'student_attendance_rollup'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_student_attendance_rollup_month', 'month'),
+    )
+
+def _rollup_delta_sql(row, sign):
+    """Statements adding (sign '+') or removing (sign '-') one attendance row from both rollups."""
+    counts = f"({row}.status = 'present'), ({row}.status = 'absent'), ({row}.status = 'late')"
+    if sign == '-':
+        return f"""
+    UPDATE attendance_daily_rollup
+       SET present = present - ({row}.status = 'present'), absent = absent - ({row}.status = 'absent'), late = late - ({row}.status = 'late')
+     WHERE classroom_id = {row}.classroom_id AND day = {row}.day;
+    UPDATE student_attendance_rollup
+       SET present = present - ({row}.status = 'present'), absent = absent - ({row}.status = 'absent'), late = late - ({row}.status = 'late')
+     WHERE user_id = {row}.user_id AND classroom_id = {row}.classroom_id AND month = strftime('%Y-%m', {row}.day);"""
+    return f"""
+    INSERT INTO attendance_daily_rollup (classroom_id, day, present, absent, late)
+    VALUES ({row}.classroom_id, {row}.day, {counts})
+    ON CONFLICT (classroom_id, day) DO UPDATE
+       SET present = present + excluded.present, absent = absent + excluded.absent, late = late + excluded.late;
+    INSERT INTO student_attendance_rollup (user_id, classroom_id, month, present, absent, late)
+    VALUES ({row}.user_id, {row}.classroom_id, strftime('%Y-%m', {row}.day), {counts})
+    ON CONFLICT (user_id, classroom_id, month) DO UPDATE
+       SET present = present + excluded.present, absent = absent + excluded.absent, late = late + excluded.late;"""
+
+# Triggers keeping both rollups in step with the attendance table. They run inside the
+# statement that changes attendance, so a mark and its rollup update commit (or roll back)
+# together however the row is written: upsert, executemany roll call, ORM or raw SQL.
+# An upsert that hits an existing row fires the UPDATE trigger, moving the count between statuses.
+ATTENDANCE_ROLLUP_TRIGGERS = {
+    'trg_attendance_rollup_insert':
+        f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_insert AFTER INSERT ON attendance BEGIN{_rollup_delta_sql('NEW', '+')}\nEND",
+    'trg_attendance_rollup_update':
+        f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_update AFTER UPDATE OF status, day, classroom_id, user_id ON attendance BEGIN"
+        f"{_rollup_delta_sql('OLD', '-')}{_rollup_delta_sql('NEW', '+')}\nEND",
+    'trg_attendance_rollup_delete':
+        f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_delete AFTER DELETE ON attendance BEGIN{_rollup_delta_sql('OLD', '-')}\nEND",
+}
+
+@event.listens_for(db.Model.metadata, 'after_create')
+def _create_attendance_rollup_triggers(target, connection, **kw):
+    # After create_all, so the attendance and rollup tables all exist
+    if connection.dialect.name == 'sqlite':
+        for trigger_sql in ATTENDANCE_ROLLUP_TRIGGERS.values():
+            connection.exec_driver_sql(trigger_sql)
         
 class ClassroomTask(db.Model):
     """
@@ -110,6 +460,8 @@ class Task(db.Model):
     content = db.Column(db.Text, nullable=False)  # Task content/message
     file_path = db.Column(db.String(255), nullable=True)  # Path to uploaded file
     file_type = db.Column(db.String(50), nullable=True)  # Type of file (document, image, etc.)
+    # Set for files in the content-addressed store (upload_store.py); file_path is then relative to UPLOAD_FOLDER
+    file_hash = db.Column(db.String(64), db.ForeignKey('upload_blob.hash'), nullable=True, index=True)
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Relationships
@@ -117,4 +469,48 @@ class Task(db.Model):
     classroom_task = db.relationship('ClassroomTask', backref=db.backref('submissions', lazy=True))
     
     def __repr__(self):
-        return f'<Task by {self.user_id}>'
\ No newline at end of file
+        return f'<Task by {self.user_id}>'
+
+class UploadBlob(db.Model):
+    """
+    A file in the content-addressed upload store, kept once however many
+    submissions contain it. refcount is the number of Task rows pointing at it.
+    """
+    __tablename__ = 'upload_blob'
+    hash = db.Column(db.String(64), primary_key=True)  # sha256 of the contents, hex
+    path = db.Column(db.String(255), nullable=False)  # relative to UPLOAD_FOLDER, e.g. ab/cd/abcd....pdf
+    size = db.Column(db.Integer, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    
+    def __repr__(self):
+        return f'<UploadBlob {self.hash[:12]} x{self.refcount}>'
+
+class OutboxMessage(db.Model):
+    """
+    Parent notification waiting to be sent (or already sent) by the background
+    sender in outbox.py. SMTP credentials are never stored here, only the sender address.
+    """
+    __tablename__ = 'outbox_message'
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(120), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='queued') # 'queued', 'sending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_next_attempt', 'status', 'next_attempt_at'),  # sender's due-message scan
+        db.Index('ix_outbox_message_classroom_created', 'classroom_id', 'created_at'),  # status shown per classroom
+    )
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} to {self.recipient} ({self.status})>'
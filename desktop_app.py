@@ -2,18 +2,15 @@
 
 import sys
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QLineEdit, QComboBox, QTableWidget,
                              QTableWidgetItem, QMessageBox, QTabWidget, QFormLayout,
                              QTextEdit, QGroupBox, QStackedWidget, QDialog, QDialogButtonBox,
-                             QFileDialog, QCheckBox, QProgressDialog, QListWidget, QListWidgetItem)
-from PyQt5.QtCore import Qt, pyqtSignal, QDate
+                             QFileDialog, QCheckBox, QListWidget, QListWidgetItem,
+                             QDateEdit, QTableView, QHeaderView)
+from PyQt5.QtCore import Qt, pyqtSignal, QDate, QTimer
 from PyQt5.QtGui import QFont, QColor
-from flask_bcrypt import Bcrypt
-from datetime import datetime, date
+from datetime import datetime
 
 # Import the dialog classes
 from create_classroom_task_dialog import CreateClassroomTaskDialog
@@ -21,10 +18,22 @@ from task_submissions_dialog import TaskSubmissionsDialog
 from submit_task_dialog import SubmitTaskDialog
 
 # Import database models
-from database import db, User, Classroom, Attendance, Task, ClassroomTask, ClassroomMembership
-
-# Initialize SQLAlchemy and Bcrypt
-bcrypt = Bcrypt()
+from database import User, Classroom, Task, ClassroomMembership
+from roster import invalidate_roster, invalidate_student_rosters
+from classroom_cache import bump_classroom_version, bump_student_classrooms
+from user_cache import invalidate_user
+from attendance import mark_roll_call, ATTENDANCE_STATUSES
+from passwords import hash_password, password_verifier, PasswordCheckRejected
+from bootstrap import database_is_bootstrapped, bootstrap_database
+from outbox import outbox, queue_notification, send_queued
+from outbox_panel import OutboxPanel, outbox_bridge, outbox_status_item
+from notifications import default_notification, absent_late_recipients
+from roster_table import RosterTableModel, AttendanceButtonsDelegate
+from desktop_loader import (DataLoader, fetch, all_classrooms, staff_users, teacher_classrooms, student_submissions,
+                            classroom_students, classroom_tasks, classroom_tasks_for_student,
+                            attendance_report, classroom_attendance_report, login_account, signed_in_user,
+                            user_classrooms, classroom_choices, teacher_choices, classroom_info,
+                            attendance_status_today)
 
 # For file uploads
 import os
@@ -35,25 +44,28 @@ from werkzeug.utils import secure_filename
 # Create uploads directory if it doesn't exist
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
+# Attendance clicks made within this many milliseconds of each other are saved in one write
+MARK_SAVE_DELAY_MS = int(os.environ.get('ENGAGE_DESKTOP_MARK_DELAY', 800))
+# The desktop keeps its SMTP connection open between notifications for this many idle seconds
+DESKTOP_SMTP_IDLE_TIMEOUT = int(os.environ.get('ENGAGE_DESKTOP_SMTP_IDLE_TIMEOUT', 1800))
+# Print the session/identity-map report every this many seconds (0 = never)
+SESSION_REPORT_INTERVAL = int(os.environ.get('ENGAGE_DESKTOP_SESSION_REPORT', 0))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Helper functions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Configure SQLAlchemy
-import sqlalchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-# Create database engine and session
-engine = create_engine('sqlite:///instance/site.db')
-Session = sessionmaker(bind=engine)
-db_session = Session()
+# Configure SQLAlchemy using the shared, tuned engine from database.py. Each read or write
+# opens its own short session (session_scope, or fetch for plain-row reads), and widgets
+# keep only plain rows, so nothing grows or goes stale over a long teaching day.
+from database import engine, session_scope, format_session_report
 
 # Login Window
 class LoginWindow(QWidget):
-    login_successful = pyqtSignal(User)
+    login_successful = pyqtSignal(object)  # SignedInUser
+    # Emitted from a password pool thread; delivered on the GUI thread
+    password_checked = pyqtSignal(object, object)
     
     def __init__(self):
         super().__init__()
@@ -92,24 +104,54 @@ class LoginWindow(QWidget):
         layout.addWidget(self.error_label)
         
         self.setLayout(layout)
+        self.password_checked.connect(self.finish_login)
         
     def login(self):
         username = self.username_input.text()
         password = self.password_input.text()
         
         # Find user in database
-        user = db_session.query(User).filter_by(username=username).first()
+        account = fetch('LoginWindow.login', login_account, username)
+        if not account:
+            self.error_label.setText('Invalid username or password')
+            return
+        user_id, password_hash = account
         
-        if user and bcrypt.check_password_hash(user.password_hash, password):
-            self.login_successful.emit(user)
-        else:
+        # Verify the password on the password pool so the window stays responsive
+        try:
+            future = password_verifier.submit(password_hash, password)
+        except PasswordCheckRejected:
+            self.error_label.setText('Busy, please try again in a moment')
+            return
+        self.login_button.setEnabled(False)
+        self.error_label.setText('')
+        future.add_done_callback(lambda done, checked_id=user_id: self.password_checked.emit(checked_id, done))
+    
+    def finish_login(self, user_id, future):
+        self.login_button.setEnabled(True)
+        try:
+            valid, new_hash = future.result()
+        except Exception as e:
+            # e.g. a malformed or legacy hash in the database; bcrypt raises instead of answering
+            print(f"Login error for user {user_id}: {str(e)}")
+            self.error_label.setText('Could not check the password. Please contact an administrator.')
+            return
+        if not valid:
             self.error_label.setText('Invalid username or password')
+            return
+        
+        # Hash made with an older work factor: store one at the current factor
+        if new_hash:
+            with session_scope() as session:
+                session.query(User).filter_by(id=user_id).update({'password_hash': new_hash})
+        self.login_successful.emit(fetch('LoginWindow.finish_login', signed_in_user, user_id))
 
 # Admin Dashboard
 class AdminDashboard(QWidget):
     def __init__(self, user):
         super().__init__()
         self.user = user
+        self.loader = DataLoader(self)
         self.init_ui()
         
     def init_ui(self):
@@ -162,15 +204,63 @@ class AdminDashboard(QWidget):
         self.load_users()
         users_layout.addWidget(self.users_table)
         
+        # Reports tab (attendance rates from the rollup tables)
+        reports_tab = QWidget()
+        reports_layout = QVBoxLayout(reports_tab)
+        
+        range_layout = QHBoxLayout()
+        today = QDate.currentDate()
+        self.report_start = QDateEdit(today.addDays(-29))
+        self.report_start.setCalendarPopup(True)
+        self.report_end = QDateEdit(today)
+        self.report_end.setCalendarPopup(True)
+        report_button = QPushButton('Show')
+        report_button.clicked.connect(lambda: self.load_report())  # not the bare slot: clicked passes checked
+        range_layout.addWidget(QLabel('From:'))
+        range_layout.addWidget(self.report_start)
+        range_layout.addWidget(QLabel('To:'))
+        range_layout.addWidget(self.report_end)
+        range_layout.addWidget(report_button)
+        reports_layout.addLayout(range_layout)
+        reports_layout.addWidget(QLabel('Attendance rate is the share of marks that were present or late. '
+                                        'Select a classroom for its weekly and per-student rates.'))
+        
+        rate_headers = ['Present', 'Late', 'Absent', 'Rate']
+        self.report_classrooms_table = QTableWidget()
+        self.report_classrooms_table.setColumnCount(5)
+        self.report_classrooms_table.setHorizontalHeaderLabels(['Classroom'] + rate_headers)
+        self.report_classrooms_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.report_classrooms_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.report_classrooms_table.itemSelectionChanged.connect(self.load_classroom_report)
+        reports_layout.addWidget(self.report_classrooms_table)
+        
+        breakdown_layout = QHBoxLayout()
+        self.report_weeks_table = QTableWidget()
+        self.report_weeks_table.setColumnCount(5)
+        self.report_weeks_table.setHorizontalHeaderLabels(['Week'] + rate_headers)
+        self.report_weeks_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        breakdown_layout.addWidget(self.report_weeks_table)
+        self.report_students_table = QTableWidget()
+        self.report_students_table.setColumnCount(5)
+        self.report_students_table.setHorizontalHeaderLabels(['Student (whole months)'] + rate_headers)
+        self.report_students_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        breakdown_layout.addWidget(self.report_students_table)
+        reports_layout.addLayout(breakdown_layout)
+        self.report_classroom_ids = []
+        self.load_report()
+        
         # Add tabs to tab widget
         tabs.addTab(classrooms_tab, 'Classrooms')
         tabs.addTab(users_tab, 'Users')
+        tabs.addTab(reports_tab, 'Reports')
         
         layout.addWidget(tabs)
         self.setLayout(layout)
         
     def load_classrooms(self):
-        classrooms = db_session.query(Classroom).all()
+        self.loader.load('classrooms', all_classrooms, on_done=self.show_classrooms, label='AdminDashboard.load_classrooms')
+    
+    def show_classrooms(self, classrooms):
         self.classrooms_table.setRowCount(len(classrooms))
         
         for row, classroom in enumerate(classrooms):
@@ -179,8 +269,7 @@ class AdminDashboard(QWidget):
             self.classrooms_table.setItem(row, 0, name_item)
             
             # Teacher
-            teacher_name = classroom.teacher.username if classroom.teacher else 'No teacher assigned'
-            teacher_item = QTableWidgetItem(teacher_name)
+            teacher_item = QTableWidgetItem(classroom.teacher_name)
             self.classrooms_table.setItem(row, 1, teacher_item)
             
             # Actions
@@ -191,7 +280,9 @@ class AdminDashboard(QWidget):
         self.classrooms_table.resizeColumnsToContents()
     
     def load_users(self):
-        users = db_session.query(User).filter(User.role.in_(['student', 'teacher'])).all()
+        self.loader.load('users', staff_users, on_done=self.show_users, label='AdminDashboard.load_users')
+    
+    def show_users(self, users):
         self.users_table.setRowCount(len(users))
         
         for row, user in enumerate(users):
@@ -204,8 +295,7 @@ class AdminDashboard(QWidget):
             self.users_table.setItem(row, 1, role_item)
             
             # Classroom
-            classroom_name = user.classroom.name if user.classroom else 'Not assigned'
-            classroom_item = QTableWidgetItem(classroom_name)
+            classroom_item = QTableWidgetItem(user.classroom_name)
             self.users_table.setItem(row, 2, classroom_item)
             
             # Actions
@@ -215,6 +305,44 @@ class AdminDashboard(QWidget):
         
         self.users_table.resizeColumnsToContents()
     
+    def report_range(self):
+        start = self.report_start.date().toPyDate()
+        end = self.report_end.date().toPyDate()
+        return (start, end) if start <= end else (end, start)
+    
+    def fill_rate_table(self, table, rates):
+        table.setRowCount(len(rates))
+        for row, rate in enumerate(rates):
+            values = [rate.label, rate.present, rate.late, rate.absent,
+                      f'{rate.rate * 100:.1f}%' if rate.rate is not None else '-']
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+    
+    def load_report(self):
+        self.loader.cancel('classroom_report')
+        self.loader.load('report', attendance_report, *self.report_range(),
+                         on_done=self.show_report, label='AdminDashboard.load_report')
+    
+    def show_report(self, rates):
+        self.report_classroom_ids = [rate.key for rate in rates]
+        self.fill_rate_table(self.report_classrooms_table, rates)
+        self.fill_rate_table(self.report_weeks_table, [])
+        self.fill_rate_table(self.report_students_table, [])
+    
+    def load_classroom_report(self):
+        row = self.report_classrooms_table.currentRow()
+        if row < 0 or row >= len(self.report_classroom_ids):
+            return
+        classroom_id = self.report_classroom_ids[row]
+        self.loader.load('classroom_report', classroom_attendance_report, classroom_id, *self.report_range(),
+                         on_done=self.show_classroom_report, label='AdminDashboard.load_classroom_report')
+    
+    def show_classroom_report(self, report):
+        weeks, students = report
+        self.fill_rate_table(self.report_weeks_table, weeks)
+        self.fill_rate_table(self.report_students_table, students)
+    
     def show_create_classroom_dialog(self):
         dialog = CreateClassroomDialog()
         if dialog.exec_() == QDialog.Accepted:
@@ -235,6 +363,7 @@ class AdminDashboard(QWidget):
         dialog.exec_()
     
     def logout(self):
+        self.loader.cancel()
         # Clear session
         from session import clear
         clear()
@@ -245,6 +374,7 @@ class TeacherDashboard(QWidget):
     def __init__(self, user):
         super().__init__()
         self.user = user
+        self.loader = DataLoader(self)
         self.init_ui()
         
     def init_ui(self):
@@ -279,7 +409,10 @@ class TeacherDashboard(QWidget):
         self.setLayout(layout)
         
     def load_classrooms(self):
-        classrooms = db_session.query(Classroom).filter_by(teacher_id=self.user.id).all()
+        self.loader.load('classrooms', teacher_classrooms, self.user.id,
+                         on_done=self.show_classrooms, label='TeacherDashboard.load_classrooms')
+    
+    def show_classrooms(self, classrooms):
         self.classrooms_table.setRowCount(len(classrooms))
         
         for row, classroom in enumerate(classrooms):
@@ -299,6 +432,7 @@ class TeacherDashboard(QWidget):
         dialog.exec_()
     
     def logout(self):
+        self.loader.cancel()
         # Clear session
         from session import clear
         clear()
@@ -309,6 +443,7 @@ class StudentDashboard(QWidget):
     def __init__(self, user):
         super().__init__()
         self.user = user
+        self.loader = DataLoader(self)
         self.init_ui()
         
     def init_ui(self):
@@ -330,12 +465,12 @@ class StudentDashboard(QWidget):
         classroom_group = QGroupBox('Your Classroom')
         classroom_layout = QVBoxLayout()
         
-        if self.user.classroom:
-            classroom_name = QLabel(f'Name: {self.user.classroom.name}')
+        if self.user.classroom_id:
+            classroom_name = QLabel(f'Name: {self.user.classroom_name}')
             classroom_layout.addWidget(classroom_name)
             
-            if self.user.classroom.teacher:
-                teacher_name = QLabel(f'Teacher: {self.user.classroom.teacher.username}')
+            if self.user.teacher_name:
+                teacher_name = QLabel(f'Teacher: {self.user.teacher_name}')
                 classroom_layout.addWidget(teacher_name)
         else:
             not_assigned = QLabel('You are not assigned to any classroom')
@@ -372,7 +507,9 @@ class StudentDashboard(QWidget):
         self.setLayout(layout)
         
     def load_tasks(self):
-        tasks = db_session.query(Task).filter_by(user_id=self.user.id).all()
+        self.loader.load('tasks', student_submissions, self.user.id, on_done=self.show_tasks, label='StudentDashboard.load_tasks')
+    
+    def show_tasks(self, tasks):
         self.tasks_table.setRowCount(len(tasks))
         
         for row, task in enumerate(tasks):
@@ -393,15 +530,15 @@ class StudentDashboard(QWidget):
             QMessageBox.warning(self, 'Error', 'Task content cannot be empty')
             return
         
-        new_task = Task(user_id=self.user.id, content=content)
-        db_session.add(new_task)
-        db_session.commit()
+        with session_scope() as session:
+            session.add(Task(user_id=self.user.id, content=content))
         
         QMessageBox.information(self, 'Success', 'Task submitted successfully')
         self.task_content.clear()
         self.load_tasks()
     
     def logout(self):
+        self.loader.cancel()
         # Clear session
         from session import clear
         clear()
@@ -434,9 +571,8 @@ class CreateClassroomDialog(QDialog):
         self.teacher_combo = QComboBox()
         self.teacher_combo.addItem('No teacher', None)
         
-        teachers = db_session.query(User).filter_by(role='teacher').all()
-        for teacher in teachers:
-            self.teacher_combo.addItem(teacher.username, teacher.id)
+        for teacher_id, username in fetch('CreateClassroomDialog.teachers', teacher_choices):
+            self.teacher_combo.addItem(username, teacher_id)
         
         form_layout.addRow('Teacher:', self.teacher_combo)
         
@@ -464,8 +600,8 @@ class CreateClassroomDialog(QDialog):
         if teacher_id:
             new_classroom.teacher_id = teacher_id
         
-        db_session.add(new_classroom)
-        db_session.commit()
+        with session_scope() as session:
+            session.add(new_classroom)
         
         QMessageBox.information(self, 'Success', f'Classroom "{name}" created successfully')
         self.accept()
@@ -514,9 +650,8 @@ class CreateUserDialog(QDialog):
         self.classroom_combo = QComboBox()
         self.classroom_combo.addItem('No classroom', None)
         
-        classrooms = db_session.query(Classroom).all()
-        for classroom in classrooms:
-            self.classroom_combo.addItem(classroom.name, classroom.id)
+        for classroom_id, name in fetch('CreateUserDialog.classrooms', classroom_choices):
+            self.classroom_combo.addItem(name, classroom_id)
         
         form_layout.addRow('Classroom:', self.classroom_combo)
         
@@ -552,8 +687,7 @@ class CreateUserDialog(QDialog):
             return
         
         # Check if username already exists
-        existing_user = db_session.query(User).filter_by(username=username).first()
-        if existing_user:
+        if fetch('CreateUserDialog.create_user', login_account, username):
             QMessageBox.warning(self, 'Error', f'Username {username} already exists')
             return
         
@@ -562,26 +696,30 @@ class CreateUserDialog(QDialog):
             QMessageBox.warning(self, 'Error', 'Please enter a valid parent email address')
             return
         
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hash_password(password)
         
-        new_user = User(username=username, password_hash=hashed_password, role=role, parent_email=parent_email)
-        db_session.add(new_user)
-        db_session.commit()  # ensure new_user.id is available
-
-        if classroom_id:
-            new_user.classroom_id = classroom_id
+        # The user and their classroom assignment are written in one transaction
+        with session_scope() as session:
+            new_user = User(username=username, password_hash=hashed_password, role=role, parent_email=parent_email,
+                            classroom_id=classroom_id)
+            session.add(new_user)
+            session.flush()  # assigns new_user.id
+            new_user_id = new_user.id
             
-            # If role is teacher, also set as classroom teacher
-            if role == 'teacher':
-                classroom = db_session.query(Classroom).get(classroom_id)
-                if classroom:
-                    classroom.teacher_id = new_user.id
-            else:
-                # Add many-to-many membership for students
-                if not db_session.query(ClassroomMembership).filter_by(user_id=new_user.id, classroom_id=classroom_id).first():
-                    db_session.add(ClassroomMembership(user_id=new_user.id, classroom_id=classroom_id))
-        
-        db_session.commit()
+            if classroom_id:
+                # If role is teacher, also set as classroom teacher
+                if role == 'teacher':
+                    classroom = session.query(Classroom).get(classroom_id)
+                    if classroom:
+                        classroom.teacher_id = new_user_id
+                else:
+                    # Add many-to-many membership for students
+                    session.add(ClassroomMembership(user_id=new_user_id, classroom_id=classroom_id))
+                bump_classroom_version(session, classroom_id)
+        
+        if role == 'student':
+            invalidate_roster(classroom_id)
+        invalidate_user(new_user_id)
         
         QMessageBox.information(self, 'Success', f'User {username} created successfully')
         self.accept()
@@ -591,7 +729,7 @@ class AssignClassroomDialog(QDialog):
     def __init__(self, user_id):
         super().__init__()
         self.user_id = user_id
-        self.user = db_session.query(User).get(user_id)
+        self.user, self.current_ids, self.classrooms = fetch('AssignClassroomDialog', user_classrooms, user_id)
         self.init_ui()
         
     def init_ui(self):
@@ -610,17 +748,11 @@ class AssignClassroomDialog(QDialog):
         # Multi-select list of classrooms
         self.class_list = QListWidget()
         self.class_list.setSelectionMode(QListWidget.MultiSelection)
-        classrooms = db_session.query(Classroom).all()
-        current_ids = set()
-        if self.user.classroom_id:
-            current_ids.add(self.user.classroom_id)
-        for m in db_session.query(ClassroomMembership).filter_by(user_id=self.user.id).all():
-            current_ids.add(m.classroom_id)
-        for classroom in classrooms:
-            item = QListWidgetItem(classroom.name)
-            item.setData(Qt.UserRole, classroom.id)
+        for classroom_id, name in self.classrooms:
+            item = QListWidgetItem(name)
+            item.setData(Qt.UserRole, classroom_id)
             self.class_list.addItem(item)
-            if classroom.id in current_ids:
+            if classroom_id in self.current_ids:
                 item.setSelected(True)
         form_layout.addRow('Classrooms:', self.class_list)
         
@@ -637,26 +769,36 @@ class AssignClassroomDialog(QDialog):
     def assign_classroom(self):
         selected_ids = [self.class_list.item(i).data(Qt.UserRole) for i in range(self.class_list.count()) if self.class_list.item(i).isSelected()]
         
-        # Primary/legacy classroom is first selected (if any)
-        self.user.classroom_id = selected_ids[0] if selected_ids else None
-        
-        # Teachers: set as teacher in selected classrooms
-        if self.user.role == 'teacher':
+        with session_scope() as session:
+            user = session.query(User).get(self.user_id)
+            
+            # Rosters the user leaves or joins must be reloaded
+            affected_ids = set(selected_ids)
+            affected_ids.add(user.classroom_id)
+            
+            # Primary/legacy classroom is first selected (if any)
+            user.classroom_id = selected_ids[0] if selected_ids else None
+            
+            # Teachers: set as teacher in selected classrooms
+            if user.role == 'teacher':
+                for cid in selected_ids:
+                    classroom = session.query(Classroom).get(cid)
+                    if classroom:
+                        classroom.teacher_id = user.id
+            
+            # Sync memberships
+            existing = {m.classroom_id: m for m in session.query(ClassroomMembership).filter_by(user_id=user.id).all()}
+            for cid, membership in list(existing.items()):
+                if cid not in selected_ids:
+                    session.delete(membership)
             for cid in selected_ids:
-                classroom = db_session.query(Classroom).get(cid)
-                if classroom:
-                    classroom.teacher_id = self.user.id
-        
-        # Sync memberships
-        existing = {m.classroom_id: m for m in db_session.query(ClassroomMembership).filter_by(user_id=self.user.id).all()}
-        for cid, membership in list(existing.items()):
-            if cid not in selected_ids:
-                db_session.delete(membership)
-        for cid in selected_ids:
-            if cid not in existing:
-                db_session.add(ClassroomMembership(user_id=self.user.id, classroom_id=cid))
-        
-        db_session.commit()
+                if cid not in existing:
+                    session.add(ClassroomMembership(user_id=user.id, classroom_id=cid))
+            
+            affected_ids.update(existing)
+            bump_classroom_version(session, *affected_ids)
+        invalidate_roster(*affected_ids)
+        invalidate_user(self.user.id)
         
         QMessageBox.information(self, 'Success', f'Classrooms updated for {self.user.username}')
         self.accept()
@@ -666,8 +808,13 @@ class ClassroomDetailsDialog(QDialog):
     def __init__(self, classroom_id, current_user):
         super().__init__()
         self.classroom_id = classroom_id
-        self.classroom = db_session.query(Classroom).get(classroom_id)
+        self.classroom = fetch('ClassroomDetailsDialog', classroom_info, classroom_id)
         self.current_user = current_user
+        self.loader = DataLoader(self)
+        # Filled in by show_students once the roster has loaded
+        self.students = ()
+        self.attendance_dict = {}
+        self.pending_marks = {}  # student id -> attendance status clicked but not yet written
         self.init_ui()
         
     def init_ui(self):
@@ -681,7 +828,7 @@ class ClassroomDetailsDialog(QDialog):
         info_layout.addRow('Name:', QLabel(self.classroom.name))
         info_layout.addRow('Description:', QLabel(self.classroom.description or 'No description'))
         
-        teacher_name = self.classroom.teacher.username if self.classroom.teacher else 'No teacher assigned'
+        teacher_name = self.classroom.teacher_name or 'No teacher assigned'
         info_layout.addRow('Teacher:', QLabel(teacher_name))
         
         layout.addLayout(info_layout)
@@ -726,17 +873,54 @@ class ClassroomDetailsDialog(QDialog):
         students_layout = QVBoxLayout()
         
         # Students table
-        self.students_table = QTableWidget()
-        self.students_table.setColumnCount(4)
-        self.students_table.setHorizontalHeaderLabels(['Username', 'Attendance', 'Email', 'Actions'])
+        self.students_model = RosterTableModel(self.current_user.role in ['admin', 'teacher'], self)
+        self.students_table = QTableView()
+        self.students_table.setModel(self.students_model)
         # Make sure the table is not editable
-        self.students_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.students_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.students_table.setSelectionMode(QTableView.NoSelection)
+        # Buttons are painted by the delegate; only visible rows are drawn
+        self.attendance_delegate = AttendanceButtonsDelegate(self.students_table)
+        self.attendance_delegate.action_clicked.connect(self.roster_action)
+        self.students_table.setItemDelegateForColumn(RosterTableModel.ACTIONS_COLUMN, self.attendance_delegate)
+        # Fixed sizes, so nothing has to measure every row
+        header = self.students_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(2, QHeaderView.Stretch)
+        header.setSectionResizeMode(RosterTableModel.ACTIONS_COLUMN, QHeaderView.Fixed)
+        header.resizeSection(0, 150)
+        header.resizeSection(1, 120)
+        header.resizeSection(RosterTableModel.ACTIONS_COLUMN, AttendanceButtonsDelegate.ACTIONS_WIDTH)
+        self.students_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.students_table.verticalHeader().setDefaultSectionSize(36)
         self.load_students()
         students_layout.addWidget(self.students_table)
         
+        # Attendance clicks update their row at once and are saved together shortly after
+        self.mark_timer = QTimer(self)
+        self.mark_timer.setSingleShot(True)
+        self.mark_timer.setInterval(MARK_SAVE_DELAY_MS)
+        self.mark_timer.timeout.connect(self.save_marks)
+        self.mark_status_label = QLabel('')
+        students_layout.addWidget(self.mark_status_label)
+        
+        # Roll call button to mark the whole classroom in one transaction
+        if self.current_user.role in ['admin', 'teacher']:
+            roll_call_button = QPushButton('Submit Roll Call')
+            roll_call_button.clicked.connect(self.submit_roll_call)
+            students_layout.addWidget(roll_call_button)
+            
+            notify_button = QPushButton('Notify Absent/Late Parents')
+            notify_button.clicked.connect(self.notify_absent_parents)
+            students_layout.addWidget(notify_button)
+        
         students_group.setLayout(students_layout)
         layout.addWidget(students_group)
         
+        # Recent and queued parent notifications, updated as the background sender reports
+        self.outbox_panel = OutboxPanel(self.classroom_id)
+        layout.addWidget(self.outbox_panel)
+        
         # Buttons
         buttons = QDialogButtonBox(QDialogButtonBox.Close)
         buttons.rejected.connect(self.reject)
@@ -745,88 +929,33 @@ class ClassroomDetailsDialog(QDialog):
         self.setLayout(layout)
         
     def load_students(self):
-        # Students via legacy classroom_id or membership
-        legacy = db_session.query(User).filter_by(classroom_id=self.classroom_id, role='student')
-        member = db_session.query(User).join(ClassroomMembership, ClassroomMembership.user_id == User.id) \
-            .filter(ClassroomMembership.classroom_id == self.classroom_id, User.role == 'student')
-        students = legacy.union(member).all()
-        self.students_table.setRowCount(len(students))
-        
-        # Get today's attendance records
-        today = date.today()
-        attendance_records = db_session.query(Attendance).filter(
-            Attendance.classroom_id == self.classroom_id,
-            Attendance.date >= today
-        ).all()
-        
-        # Create a dictionary of user_id -> attendance status for easy lookup
-        attendance_dict = {record.user_id: record.status for record in attendance_records}
-        
-        for row, student in enumerate(students):
-            # Username
-            username_item = QTableWidgetItem(student.username)
-            self.students_table.setItem(row, 0, username_item)
-            
-            # Attendance status
-            status = attendance_dict.get(student.id, 'Not marked')
-            status_item = QTableWidgetItem(status)
-            
-            if status == 'present':
-                status_item.setBackground(QColor(200, 255, 200))  # Light green
-            elif status == 'absent':
-                status_item.setBackground(QColor(255, 200, 200))  # Light red
-            elif status == 'late':
-                status_item.setBackground(QColor(255, 255, 200))  # Light yellow
-                
-            self.students_table.setItem(row, 1, status_item)
-            
-            # Email column - Display parent email if available
-            parent_email = student.parent_email or 'Not set'
-            email_item = QTableWidgetItem(parent_email)
-            self.students_table.setItem(row, 2, email_item)
-            
-            # Actions column with attendance buttons and notification
-            actions_widget = QWidget()
-            actions_layout = QHBoxLayout(actions_widget)
-            actions_layout.setContentsMargins(2, 2, 2, 2)
-            
-            if self.current_user.role in ['admin', 'teacher']:
-                # Add attendance buttons
-                present_button = QPushButton('Present')
-                present_button.clicked.connect(lambda _, s_id=student.id: self.mark_attendance(s_id, 'present'))
-                present_button.setMaximumWidth(70)
-                actions_layout.addWidget(present_button)
-                
-                absent_button = QPushButton('Absent')
-                absent_button.clicked.connect(lambda _, s_id=student.id: self.mark_attendance(s_id, 'absent'))
-                absent_button.setMaximumWidth(70)
-                actions_layout.addWidget(absent_button)
-                
-                late_button = QPushButton('Late')
-                late_button.clicked.connect(lambda _, s_id=student.id: self.mark_attendance(s_id, 'late'))
-                late_button.setMaximumWidth(70)
-                actions_layout.addWidget(late_button)
-                
-                # Add notify button if student is marked absent or late
-                if status in ['absent', 'late']:
-                    notify_button = QPushButton('Notify')
-                    notify_button.clicked.connect(lambda _, s_id=student.id: self.send_absence_notification(s_id))
-                    notify_button.setMaximumWidth(70)
-                    actions_layout.addWidget(notify_button)
-            else:
-                actions_label = QLabel('No actions available')
-                actions_layout.addWidget(actions_label)
-                
-            actions_widget.setLayout(actions_layout)
-            self.students_table.setCellWidget(row, 3, actions_widget)
-            
-            # Actions are now handled in the combined actions column above
-        
-        self.students_table.resizeColumnsToContents()
+        # Students via legacy classroom_id or membership, with today's attendance (user_id -> status)
+        self.loader.load('students', classroom_students, self.classroom_id,
+                         on_done=self.show_students, label='ClassroomDetailsDialog.load_students')
+    
+    def show_students(self, roster):
+        students, attendance_dict = roster
+        attendance_dict = {**attendance_dict, **self.pending_marks}  # a reload must not undo unsaved clicks
+        
+        # Keep the roster for the roll call dialog
+        self.students = students
+        self.attendance_dict = attendance_dict
+        self.students_model.set_roster(students, attendance_dict)
+    
+    def roster_action(self, row, action):
+        # A Present/Absent/Late/Notify button painted in the students table was clicked
+        student = self.students_model.student(row)
+        if action == 'notify':
+            self.send_absence_notification(student)
+        else:
+            self.mark_attendance(student.id, action)
     
     def load_tasks(self):
         # Load classroom tasks for teachers/admins
-        tasks = db_session.query(ClassroomTask).filter_by(classroom_id=self.classroom_id).order_by(ClassroomTask.created_date.desc()).all()
+        self.loader.load('tasks', classroom_tasks, self.classroom_id,
+                         on_done=self.show_tasks, label='ClassroomDetailsDialog.load_tasks')
+    
+    def show_tasks(self, tasks):
         self.tasks_table.setRowCount(len(tasks))
         
         for row, task in enumerate(tasks):
@@ -863,14 +992,14 @@ class ClassroomDetailsDialog(QDialog):
         self.tasks_table.resizeColumnsToContents()
     
     def load_student_tasks(self):
-        # Load classroom tasks for students
-        tasks = db_session.query(ClassroomTask).filter_by(classroom_id=self.classroom_id).order_by(ClassroomTask.created_date.desc()).all()
+        # Load classroom tasks for students, with the ids of the ones this student has submitted
+        self.loader.load('tasks', classroom_tasks_for_student, self.classroom_id, self.current_user.id,
+                         on_done=self.show_student_tasks, label='ClassroomDetailsDialog.load_student_tasks')
+    
+    def show_student_tasks(self, student_tasks):
+        tasks, submitted_ids = student_tasks
         self.tasks_table.setRowCount(len(tasks))
         
-        # Get student's submissions
-        submissions = db_session.query(Task).filter_by(user_id=self.current_user.id).all()
-        submission_dict = {submission.classroom_task_id: submission for submission in submissions if submission.classroom_task_id}
-        
         for row, task in enumerate(tasks):
             # Title
             title_item = QTableWidgetItem(task.title)
@@ -887,7 +1016,7 @@ class ClassroomDetailsDialog(QDialog):
             self.tasks_table.setItem(row, 2, due_date_item)
             
             # Status
-            status = 'Submitted' if task.id in submission_dict else 'Not submitted'
+            status = 'Submitted' if task.id in submitted_ids else 'Not submitted'
             status_item = QTableWidgetItem(status)
             
             if status == 'Submitted':
@@ -910,6 +1039,24 @@ class ClassroomDetailsDialog(QDialog):
         
         self.tasks_table.resizeColumnsToContents()
     
+    def done(self, result):
+        # Closing the dialog saves the last clicks and drops loads still running for it
+        while not self.save_marks():
+            count = len(self.pending_marks)
+            answer = QMessageBox.warning(self, 'Attendance Not Saved',
+                                         f'{count} attendance mark{"s" if count != 1 else ""} could not be saved. '
+                                         'Retry, discard them and close, or cancel to keep the dialog open.',
+                                         QMessageBox.Retry | QMessageBox.Discard | QMessageBox.Cancel,
+                                         QMessageBox.Retry)
+            if answer == QMessageBox.Discard:
+                self.pending_marks = {}
+                break
+            if answer != QMessageBox.Retry:
+                return
+        self.loader.cancel()
+        self.outbox_panel.cancel()
+        super().done(result)
+    
     def create_task(self):
         dialog = CreateClassroomTaskDialog(self.classroom_id)
         if dialog.exec_():
@@ -925,29 +1072,73 @@ class ClassroomDetailsDialog(QDialog):
             self.load_student_tasks()
     
     def mark_attendance(self, student_id, status):
-        # Check if attendance already marked today
-        today = date.today()
-        existing_record = db_session.query(Attendance).filter(
-            Attendance.user_id == student_id,
-            Attendance.classroom_id == self.classroom_id,
-            Attendance.date >= today
-        ).first()
-        
-        if existing_record:
-            existing_record.status = status
-        else:
-            new_attendance = Attendance(user_id=student_id, classroom_id=self.classroom_id, status=status)
-            db_session.add(new_attendance)
+        # Show the mark in its row now; the write waits for a pause in the clicking
+        self.students_model.set_status(student_id, status)
+        self.attendance_dict[student_id] = status
+        self.pending_marks[student_id] = status
+        count = len(self.pending_marks)
+        self.show_mark_status(f'{count} attendance mark{"s" if count != 1 else ""} waiting to be saved...')
+        self.mark_timer.start()
+    
+    def save_marks(self):
+        """Write every pending mark in one transaction. Returns False if the write failed."""
+        self.mark_timer.stop()
+        statuses, self.pending_marks = self.pending_marks, {}
+        if not statuses:
+            return True
+        try:
+            with session_scope() as session:
+                marked_ids, rejected_ids = mark_roll_call(session, self.classroom_id, statuses)
+                bump_classroom_version(session, self.classroom_id)
+        except Exception as e:
+            # Keep them for the next attempt, unless the student has been clicked again since
+            self.pending_marks = {**statuses, **self.pending_marks}
+            self.show_mark_status(f'Failed to save {len(statuses)} attendance marks: {str(e)}. '
+                                  f'They will be saved with the next mark.', error=True)
+            return False
+        
+        text = f'Saved {len(marked_ids)} attendance mark{"s" if len(marked_ids) != 1 else ""} at {datetime.now():%H:%M:%S}'
+        if rejected_ids:
+            text += f'; {len(rejected_ids)} skipped because they do not belong to this classroom'
+        self.show_mark_status(text, error=bool(rejected_ids))
+        return True
+    
+    def show_mark_status(self, text, error=False):
+        self.mark_status_label.setText(text)
+        self.mark_status_label.setStyleSheet('color: #f04747;' if error else '')
+        
+    def submit_roll_call(self):
+        # Clicks not yet saved are part of what the roll call starts from
+        self.save_marks()
+        dialog = RollCallDialog(self.students, self.attendance_dict)
+        if not dialog.exec_():
+            return
         
-        db_session.commit()
+        statuses = dialog.statuses
+        if not statuses:
+            QMessageBox.information(self, 'Roll Call', 'No attendance statuses were selected')
+            return
+        
+        # Check membership once for the whole set and write every row in one transaction
+        try:
+            with session_scope() as session:
+                marked_ids, rejected_ids = mark_roll_call(session, self.classroom_id, statuses)
+                bump_classroom_version(session, self.classroom_id)
+        except Exception as e:
+            QMessageBox.warning(self, 'Error', f'Failed to save roll call: {str(e)}')
+            return
         
-        student = db_session.query(User).get(student_id)
-        QMessageBox.information(self, 'Success', f'Attendance marked for {student.username} as {status}')
+        message = f'Roll call saved for {len(marked_ids)} students'
+        if rejected_ids:
+            message += f'\n{len(rejected_ids)} students were skipped because they do not belong to this classroom'
+        QMessageBox.information(self, 'Success', message)
         
-        self.load_students()
+        for student_id in marked_ids:
+            self.students_model.set_status(student_id, statuses[student_id])
+            self.attendance_dict[student_id] = statuses[student_id]
         
-    def send_absence_notification(self, student_id):
-        student = db_session.query(User).get(student_id)
+    def send_absence_notification(self, student):
+        self.save_marks()
         if not student.parent_email:
             QMessageBox.information(self, 'Parent Email Required', 
                                   f'No parent email is set for {student.username}. Please add a parent email first.')
@@ -958,7 +1149,7 @@ class ClassroomDetailsDialog(QDialog):
             
         try:
             # Create email setup dialog
-            email_dialog = EmailSetupDialog(student, self.classroom_id)
+            email_dialog = EmailSetupDialog(student, self.classroom)
             if not email_dialog.exec_():
                 return
                 
@@ -967,50 +1158,86 @@ class ClassroomDetailsDialog(QDialog):
             subject = email_dialog.subject
             message_body = email_dialog.message_body
             
-            # Show sending status
-            progress = QProgressDialog(f"Sending email to parent of {student.username}...", None, 0, 0, self)
-            progress.setWindowTitle("Sending Email")
-            progress.setWindowModality(Qt.WindowModal)
-            progress.show()
-            QApplication.processEvents()
-            
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = student.parent_email
-            msg['Subject'] = subject
+            # Queued for the background sender; the dialog does not wait on SMTP
+            with session_scope() as session:
+                queue_notification(session, sender_email, sender_password, student.parent_email, subject, message_body,
+                                   student_id=student.id, classroom_id=self.classroom_id)
+            send_queued(engine)
             
-            # Attach message body
-            msg.attach(MIMEText(message_body, 'plain'))
-            
-            try:
-                # Connect to Gmail SMTP server
-                server = smtplib.SMTP('smtp.gmail.com', 587)
-                server.starttls()
-                server.login(sender_email, sender_password)
-                
-                # Send email
-                server.send_message(msg)
-                server.quit()
-                
-                progress.close()
-                QMessageBox.information(self, 'Success', 
-                                      f'Absence notification sent to parent of {student.username} at {student.parent_email}')
-            except smtplib.SMTPAuthenticationError:
-                progress.close()
-                QMessageBox.critical(self, 'Authentication Error', 
-                                   'Email login failed. If using Gmail, make sure you are using an App Password, not your regular password.')
-            except smtplib.SMTPException as smtp_error:
-                progress.close()
-                QMessageBox.critical(self, 'SMTP Error', f'Email server error: {str(smtp_error)}')
-            except Exception as e:
-                progress.close()
-                QMessageBox.critical(self, 'Error', f'Failed to send email: {str(e)}')
-                print(f"Email error: {str(e)}")
+            self.outbox_panel.reload()
         except Exception as e:
             QMessageBox.critical(self, 'Error', f'Failed to prepare email: {str(e)}')
             print(f"Email setup error: {str(e)}")
 
+    def notify_absent_parents(self):
+        # The batch is built from today's saved marks
+        self.save_marks()
+        dialog = BatchNotificationDialog(self.classroom)
+        dialog.exec_()
+
+# Roll Call Dialog
+class RollCallDialog(QDialog):
+    def __init__(self, students, attendance_dict):
+        super().__init__()
+        self.students = students
+        self.attendance_dict = attendance_dict
+        self.statuses = {}
+        self.init_ui()
+        
+    def init_ui(self):
+        self.setWindowTitle('Roll Call')
+        self.setGeometry(300, 300, 450, 500)
+        
+        layout = QVBoxLayout()
+        
+        # Mark all button for the common case
+        all_present_button = QPushButton('Mark All Present')
+        all_present_button.clicked.connect(self.mark_all_present)
+        layout.addWidget(all_present_button)
+        
+        # One status dropdown per student, preselected with today's status
+        self.roll_call_table = QTableWidget()
+        self.roll_call_table.setColumnCount(2)
+        self.roll_call_table.setHorizontalHeaderLabels(['Username', 'Status'])
+        self.roll_call_table.setRowCount(len(self.students))
+        self.status_combos = {}
+        
+        for row, student in enumerate(self.students):
+            self.roll_call_table.setItem(row, 0, QTableWidgetItem(student.username))
+            
+            status_combo = QComboBox()
+            status_combo.addItem('No change', None)
+            for status in ATTENDANCE_STATUSES:
+                status_combo.addItem(status.capitalize(), status)
+            current_status = self.attendance_dict.get(student.id)
+            if current_status in ATTENDANCE_STATUSES:
+                status_combo.setCurrentIndex(ATTENDANCE_STATUSES.index(current_status) + 1)
+            self.roll_call_table.setCellWidget(row, 1, status_combo)
+            self.status_combos[student.id] = status_combo
+        
+        self.roll_call_table.resizeColumnsToContents()
+        layout.addWidget(self.roll_call_table)
+        
+        # Buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.collect_statuses)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        
+        self.setLayout(layout)
+        
+    def mark_all_present(self):
+        for status_combo in self.status_combos.values():
+            status_combo.setCurrentIndex(ATTENDANCE_STATUSES.index('present') + 1)
+        
+    def collect_statuses(self):
+        self.statuses = {
+            student_id: status_combo.currentData()
+            for student_id, status_combo in self.status_combos.items()
+            if status_combo.currentData()
+        }
+        self.accept()
+
 # Parent Email Dialog
 class ParentEmailDialog(QDialog):
     def __init__(self, student):
@@ -1055,18 +1282,22 @@ class ParentEmailDialog(QDialog):
             QMessageBox.warning(self, 'Error', 'Please enter a valid email address')
             return
         
-        self.student.parent_email = email
-        db_session.commit()
+        with session_scope() as session:
+            session.query(User).filter_by(id=self.student.id).update({'parent_email': email})
+            bump_student_classrooms(session, self.student.id)
+        with session_scope() as session:
+            invalidate_student_rosters(session, self.student.id)
+        invalidate_user(self.student.id)
         
         QMessageBox.information(self, 'Success', f'Parent email for {self.student.username} saved successfully')
         self.accept()
 
 # Email Setup Dialog
 class EmailSetupDialog(QDialog):
-    def __init__(self, student, classroom_id):
+    def __init__(self, student, classroom):
         super().__init__()
         self.student = student
-        self.classroom_id = classroom_id
+        self.classroom = classroom
         self.sender_email = ''
         self.sender_password = ''
         self.subject = ''
@@ -1104,45 +1335,8 @@ class EmailSetupDialog(QDialog):
         form_layout.addRow('Password/App Password:', self.password_input)
         
         # Get today's attendance status
-        today = date.today()
-        attendance_record = db_session.query(Attendance).filter(
-            Attendance.user_id == self.student.id,
-            Attendance.classroom_id == self.classroom_id,
-            Attendance.date >= today
-        ).first()
-        
-        attendance_status = attendance_record.status if attendance_record else 'Not marked'
-        
-        if attendance_status == 'absent':
-            default_subject = f'Absence Notification for {self.student.username}'
-            default_message = f"""Dear Parent/Guardian,
-
-This is to inform you that {self.student.username} was marked absent today in class.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
-        elif attendance_status == 'late':
-            default_subject = f'Late Arrival Notification for {self.student.username}'
-            default_message = f"""Dear Parent/Guardian,
-
-This is to inform you that {self.student.username} was marked late today in class.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
-        else:
-            default_subject = f'Attendance Notification for {self.student.username}'
-            default_message = f"""Dear Parent/Guardian,
-
-This is to inform you about {self.student.username}'s attendance status in class.
-
-Please contact the school for more information.
-
-Regards,
-School Administration"""
+        attendance_status = fetch('EmailSetupDialog', attendance_status_today, self.student.id, self.classroom.id) or 'Not marked'
+        default_subject, default_message = default_notification(self.student.username, self.classroom.name, attendance_status)
         
         # Subject field
         self.subject_input = QLineEdit()
@@ -1195,6 +1389,116 @@ School Administration"""
             
         self.accept()
 
+# Notify every parent of a student marked absent/late today, with one set of credentials
+class BatchNotificationDialog(QDialog):
+    def __init__(self, classroom):
+        super().__init__()
+        self.classroom = classroom
+        self.recipients, self.missing_email = fetch('BatchNotificationDialog', absent_late_recipients, classroom)
+        self.message_rows = {}  # outbox message id -> table row
+        self.message_status = {}  # outbox message id -> latest status
+        self.init_ui()
+        outbox_bridge().message_updated.connect(self.message_updated)
+        
+    def init_ui(self):
+        self.setWindowTitle(f'Notify Absent/Late Parents: {self.classroom.name}')
+        self.setGeometry(300, 300, 700, 450)
+        
+        layout = QVBoxLayout()
+        
+        # One row per parent, with the delivery result filled in after sending
+        self.recipients_table = QTableWidget()
+        self.recipients_table.setColumnCount(5)
+        self.recipients_table.setHorizontalHeaderLabels(['Student', 'Attendance', 'Parent Email', 'Subject', 'Status'])
+        self.recipients_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.recipients_table.setRowCount(len(self.recipients))
+        for row, recipient in enumerate(self.recipients):
+            self.recipients_table.setItem(row, 0, QTableWidgetItem(recipient.username))
+            self.recipients_table.setItem(row, 1, QTableWidgetItem(recipient.status))
+            self.recipients_table.setItem(row, 2, QTableWidgetItem(recipient.parent_email))
+            self.recipients_table.setItem(row, 3, QTableWidgetItem(recipient.subject))
+            self.recipients_table.setItem(row, 4, QTableWidgetItem('Not sent'))
+        layout.addWidget(self.recipients_table)
+        
+        if not self.recipients:
+            layout.addWidget(QLabel('No student with a parent email is marked absent or late today.'))
+        if self.missing_email:
+            missing_label = QLabel('Not notified (no parent email on file): ' +
+                                   ', '.join(student.username for student in self.missing_email))
+            missing_label.setWordWrap(True)
+            missing_label.setStyleSheet('color: #666;')
+            layout.addWidget(missing_label)
+        
+        # Credentials, entered once for the whole batch
+        form_layout = QFormLayout()
+        self.email_input = QLineEdit()
+        form_layout.addRow('Your Email:', self.email_input)
+        self.password_input = QLineEdit()
+        self.password_input.setEchoMode(QLineEdit.Password)
+        form_layout.addRow('Password/App Password:', self.password_input)
+        layout.addLayout(form_layout)
+        
+        self.summary_label = QLabel('')
+        layout.addWidget(self.summary_label)
+        
+        # Buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        self.send_button = buttons.addButton(f'Send {len(self.recipients)} Email(s)', QDialogButtonBox.AcceptRole)
+        self.send_button.setEnabled(bool(self.recipients))
+        buttons.accepted.connect(self.send_all)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        
+        self.setLayout(layout)
+        
+    def send_all(self):
+        sender_email = self.email_input.text()
+        sender_password = self.password_input.text()
+        if not sender_email or not sender_password:
+            QMessageBox.warning(self, 'Error', 'Email and password are required')
+            return
+        if '@' not in sender_email or '.' not in sender_email:
+            QMessageBox.warning(self, 'Error', 'Please enter a valid email address')
+            return
+        
+        try:
+            # The background sender delivers the whole batch over one SMTP connection.
+            # Not expired on commit, so the new messages' ids can still be read afterwards.
+            with session_scope(expire_on_commit=False) as session:
+                messages = [
+                    queue_notification(session, sender_email, sender_password, recipient.parent_email,
+                                       recipient.subject, recipient.body, student_id=recipient.student_id,
+                                       classroom_id=self.classroom.id)
+                    for recipient in self.recipients
+                ]
+        except Exception as e:
+            QMessageBox.critical(self, 'Error', f'Failed to queue notifications: {str(e)}')
+            return
+        send_queued(engine)
+        
+        # Results arrive through message_updated as the sender works through the batch
+        self.message_rows = {message.id: row for row, message in enumerate(messages)}
+        self.message_status = {message.id: 'queued' for message in messages}
+        for row in self.message_rows.values():
+            self.recipients_table.setItem(row, 4, QTableWidgetItem('queued'))
+        self.send_button.setEnabled(False)
+        self.email_input.setEnabled(False)
+        self.password_input.setEnabled(False)
+        self.show_summary()
+        
+    def message_updated(self, update):
+        row = self.message_rows.get(update['id'])
+        if row is None:
+            return
+        self.message_status[update['id']] = update['status']
+        self.recipients_table.setItem(row, 4, outbox_status_item(update))
+        self.show_summary()
+        
+    def show_summary(self):
+        statuses = list(self.message_status.values())
+        pending = statuses.count('queued') + statuses.count('sending')
+        self.summary_label.setText(f"{statuses.count('sent')} sent, {statuses.count('failed')} failed, {pending} pending")
+
 # Main Application Window
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -1245,39 +1549,15 @@ class MainWindow(QMainWindow):
 
 # Main function
 def main():
-    # Create database tables if they don't exist
-    from sqlalchemy import inspect
-    inspector = inspect(engine)
-    
-    # Ensure all required tables (including new ones) exist
-    if not (inspector.has_table('classroom') and inspector.has_table('classroom_task') and inspector.has_table('classroom_membership')):
-        from database import db
-        import app
-        with app.app.app_context():
-            db.create_all()
-            
-            # Check if a default classroom exists
-            default_classroom = db_session.query(Classroom).filter_by(name='Default Classroom').first()
-            if not default_classroom:
-                # Create a default classroom
-                default_classroom = Classroom(name='Default Classroom', description='Default classroom for all students')
-                db_session.add(default_classroom)
-                db_session.commit()
-                print("Default classroom created.")
-            
-            # Check if an admin user already exists
-            admin = db_session.query(User).filter_by(username='admin').first()
-            if not admin:
-                # Create a default admin user if one doesn't exist
-                print("Creating default admin user...")
-                hashed_password = bcrypt.generate_password_hash('admin_password').decode('utf-8')
-                admin_user = User(username='admin', password_hash=hashed_password, role='admin')
-                db_session.add(admin_user)
-                db_session.commit()
-                print("Default admin user created with username 'admin' and password 'admin_password'.")
+    # First run against a new database: create the schema and seed data (one cheap check otherwise)
+    if not database_is_bootstrapped(engine):
+        with session_scope() as session:
+            bootstrap_database(engine, session)
     
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Use Fusion style for a modern look
+    # Keep the sender's authenticated SMTP connection for the session rather than reconnecting per notification
+    outbox.pool.idle_timeout = DESKTOP_SMTP_IDLE_TIMEOUT
     
     # Set application stylesheet for dark theme
     app.setStyleSheet("""
@@ -1352,6 +1632,12 @@ def main():
     
     window = MainWindow()
     window.show()
+    
+    if SESSION_REPORT_INTERVAL:
+        report_timer = QTimer(window)
+        report_timer.timeout.connect(lambda: print(format_session_report()))
+        report_timer.start(SESSION_REPORT_INTERVAL * 1000)
+    
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,237 @@
+# desktop_loader.py
+
+# Background data loading for the desktop client. A table's query runs on a QThreadPool
+# worker with a session of its own, returns plain rows (named tuples, never ORM objects
+# that belong to a session), and the rows are handed to the widget on the GUI thread
+# through a queued signal. The window keeps repainting while a slow file share answers.
+# The same queries serve the small synchronous reads of dialogs through fetch(), so no
+# widget ever holds an object attached to a session.
+#
+# Each widget owns a DataLoader. Starting a load supersedes any earlier load of the same
+# name, and cancel() (called when the widget is closed or left) drops every pending load:
+# loads not yet started are taken off the pool, and results of running ones are ignored.
+
+import os
+import threading
+from collections import namedtuple
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QMessageBox
+from sqlalchemy.orm import aliased
+from database import session_scope, User, Classroom, ClassroomMembership, ClassroomTask, Task, Attendance, logged_queries
+from roster import get_roster
+from attendance import attendance_today
+from reports import classroom_attendance_rates, weekly_attendance_rates, student_attendance_rates
+
+DESKTOP_LOAD_WORKERS = int(os.environ.get('ENGAGE_DESKTOP_LOAD_WORKERS', 4))
+
+# Plain rows handed to the widgets
+ClassroomRow = namedtuple('ClassroomRow', ['id', 'name', 'teacher_name'])
+UserRow = namedtuple('UserRow', ['id', 'username', 'role', 'classroom_name'])
+StudentTaskRow = namedtuple('StudentTaskRow', ['content', 'date'])
+ClassroomTaskRow = namedtuple('ClassroomTaskRow', ['id', 'title', 'description', 'due_date', 'created_date'])
+SubmissionRow = namedtuple('SubmissionRow', ['id', 'username', 'date', 'content', 'file_path', 'file_type'])
+SignedInUser = namedtuple('SignedInUser', ['id', 'username', 'role', 'classroom_id', 'classroom_name', 'teacher_name'])
+AccountRow = namedtuple('AccountRow', ['id', 'username', 'role', 'classroom_id'])
+ClassroomInfoRow = namedtuple('ClassroomInfoRow', ['id', 'name', 'description', 'teacher_name'])
+
+_pool = None
+_in_flight = set()  # jobs handed to the pool; a job drops itself when it has run
+
+def load_pool():
+    """The thread pool every DataLoader runs on (created on first use)."""
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+        _pool.setMaxThreadCount(DESKTOP_LOAD_WORKERS)
+    return _pool
+
+def fetch(label, query, *args):
+    """Run query(session, *args) in a new session and return its rows (SQL logged under label)."""
+    with session_scope() as session:
+        return logged_queries(label)(query)(session, *args)
+
+# Queries, one per table or dialog; each takes the session first and returns plain rows
+
+def login_account(session, username):
+    """(user id, password hash) of the username, or None."""
+    return session.query(User.id, User.password_hash).filter_by(username=username).first()
+
+def signed_in_user(session, user_id):
+    """The user the desktop session runs as, with their classroom and its teacher."""
+    teacher = aliased(User)
+    row = session.query(User.id, User.username, User.role, User.classroom_id, Classroom.name, teacher.username) \
+        .outerjoin(Classroom, User.classroom_id == Classroom.id) \
+        .outerjoin(teacher, Classroom.teacher_id == teacher.id).filter(User.id == user_id).first()
+    return SignedInUser(*row) if row else None
+
+def user_classrooms(session, user_id):
+    """The user, the ids of the classrooms they belong to, and every classroom as (id, name)."""
+    row = session.query(User.id, User.username, User.role, User.classroom_id).filter(User.id == user_id).first()
+    if row is None:
+        return None, set(), []
+    current_ids = {classroom_id for (classroom_id,) in
+                   session.query(ClassroomMembership.classroom_id).filter_by(user_id=user_id)}
+    if row.classroom_id:
+        current_ids.add(row.classroom_id)
+    return AccountRow(*row), current_ids, session.query(Classroom.id, Classroom.name).order_by(Classroom.name).all()
+
+def classroom_choices(session):
+    return session.query(Classroom.id, Classroom.name).order_by(Classroom.name).all()
+
+def teacher_choices(session):
+    return session.query(User.id, User.username).filter_by(role='teacher').order_by(User.username).all()
+
+def classroom_info(session, classroom_id):
+    teacher = aliased(User)
+    row = session.query(Classroom.id, Classroom.name, Classroom.description, teacher.username) \
+        .outerjoin(teacher, Classroom.teacher_id == teacher.id).filter(Classroom.id == classroom_id).first()
+    return ClassroomInfoRow(*row) if row else None
+
+def classroom_task(session, task_id):
+    row = session.query(ClassroomTask.id, ClassroomTask.title, ClassroomTask.description, ClassroomTask.due_date,
+                        ClassroomTask.created_date).filter(ClassroomTask.id == task_id).first()
+    return ClassroomTaskRow(*row) if row else None
+
+def task_for_student(session, task_id, user_id):
+    """The classroom task and the student's submission to it (None if not yet submitted)."""
+    submission = session.query(Task.id, User.username, Task.date, Task.content, Task.file_path, Task.file_type) \
+        .join(User, Task.user_id == User.id).filter(Task.classroom_task_id == task_id, Task.user_id == user_id).first()
+    return classroom_task(session, task_id), SubmissionRow(*submission) if submission else None
+
+def all_classrooms(session):
+    teacher = aliased(User)
+    rows = session.query(Classroom.id, Classroom.name, teacher.username) \
+        .outerjoin(teacher, Classroom.teacher_id == teacher.id).order_by(Classroom.name).all()
+    return [ClassroomRow(classroom_id, name, teacher_name or 'No teacher assigned') for classroom_id, name, teacher_name in rows]
+
+def staff_users(session):
+    rows = session.query(User.id, User.username, User.role, Classroom.name) \
+        .outerjoin(Classroom, User.classroom_id == Classroom.id) \
+        .filter(User.role.in_(['student', 'teacher'])).order_by(User.username).all()
+    return [UserRow(user_id, username, role, classroom_name or 'Not assigned') for user_id, username, role, classroom_name in rows]
+
+def teacher_classrooms(session, teacher_id):
+    return [ClassroomRow(classroom_id, name, None) for classroom_id, name in
+            session.query(Classroom.id, Classroom.name).filter_by(teacher_id=teacher_id).order_by(Classroom.name)]
+
+def student_submissions(session, user_id):
+    return [StudentTaskRow(*row) for row in
+            session.query(Task.content, Task.date).filter_by(user_id=user_id).order_by(Task.date)]
+
+def classroom_students(session, classroom_id):
+    """The roster and today's attendance marks (user id -> status)."""
+    attendance = dict(session.query(Attendance.user_id, Attendance.status)
+                      .filter_by(classroom_id=classroom_id, day=attendance_today()))
+    return get_roster(session, classroom_id), attendance
+
+def attendance_status_today(session, user_id, classroom_id):
+    return session.query(Attendance.status) \
+        .filter_by(user_id=user_id, classroom_id=classroom_id, day=attendance_today()).scalar()
+
+def classroom_tasks(session, classroom_id):
+    return [ClassroomTaskRow(*row) for row in
+            session.query(ClassroomTask.id, ClassroomTask.title, ClassroomTask.description, ClassroomTask.due_date,
+                          ClassroomTask.created_date)
+            .filter_by(classroom_id=classroom_id).order_by(ClassroomTask.created_date.desc())]
+
+def classroom_tasks_for_student(session, classroom_id, user_id):
+    """The classroom's tasks and the ids of those the student has submitted."""
+    submitted = {task_id for (task_id,) in
+                 session.query(Task.classroom_task_id).filter(Task.user_id == user_id, Task.classroom_task_id.isnot(None))}
+    return classroom_tasks(session, classroom_id), submitted
+
+def task_submissions(session, task_id):
+    rows = session.query(Task.id, User.username, Task.date, Task.content, Task.file_path, Task.file_type) \
+        .outerjoin(User, Task.user_id == User.id).filter(Task.classroom_task_id == task_id).order_by(Task.date).all()
+    return [SubmissionRow(*row) for row in rows]
+
+def attendance_report(session, start, end):
+    return classroom_attendance_rates(session, start, end)
+
+def classroom_attendance_report(session, classroom_id, start, end):
+    """Weekly rates and per-student rates of one classroom."""
+    return (weekly_attendance_rates(session, classroom_id, start, end),
+            student_attendance_rates(session, start, end, [classroom_id]))
+
+class _LoadSignals(QObject):
+    # Emitted on the worker thread; DataLoader's slots run on the GUI thread
+    finished = pyqtSignal(object, object)  # job, rows
+    failed = pyqtSignal(object, str)  # job, error message
+
+class _LoadJob(QRunnable):
+    def __init__(self, name, label, query, args, on_done, on_error):
+        super().__init__()
+        self.setAutoDelete(False)  # _in_flight and the queued signal keep it alive
+        self.name = name
+        self.label = label
+        self.query = query
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = threading.Event()
+        self.signals = _LoadSignals()
+
+    def run(self):
+        try:
+            if self.cancelled.is_set():
+                return
+            try:
+                rows = fetch(self.label, self.query, *self.args)
+            except Exception as e:
+                self.signals.failed.emit(self, str(e))
+            else:
+                self.signals.finished.emit(self, rows)
+        finally:
+            _in_flight.discard(self)
+
+class DataLoader(QObject):
+    """Runs a widget's queries on the load pool and passes their rows back on the GUI thread."""
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or load_pool()
+        self._jobs = {}  # name -> latest _LoadJob
+
+    def load(self, name, query, *args, on_done, on_error=None, label=None):
+        """
+        Run query(session, *args) in the background and call on_done(rows) with its result,
+        or on_error(message) if it raised. A later load of the same name replaces this one.
+        """
+        self.cancel(name)
+        job = _LoadJob(name, label or name, query, args, on_done, on_error)
+        job.signals.finished.connect(self._finished)
+        job.signals.failed.connect(self._failed)
+        self._jobs[name] = job
+        _in_flight.add(job)
+        self.pool.start(job)
+        return job
+
+    def cancel(self, name=None):
+        """Drop the pending load of that name, or every pending load."""
+        for job_name in ([name] if name is not None else list(self._jobs)):
+            job = self._jobs.pop(job_name, None)
+            if job is not None:
+                job.cancelled.set()
+                if self.pool.tryTake(job):
+                    _in_flight.discard(job)
+
+    def is_loading(self, name=None):
+        return name in self._jobs if name is not None else bool(self._jobs)
+
+    def _take(self, job):
+        # Results of superseded or cancelled jobs are ignored
+        if job.cancelled.is_set() or self._jobs.get(job.name) is not job:
+            return False
+        del self._jobs[job.name]
+        return True
+
+    def _finished(self, job, rows):
+        if self._take(job):
+            job.on_done(rows)
+
+    def _failed(self, job, message):
+        if self._take(job):
+            print(f"Load error ({job.label}): {message}")
+            if job.on_error is not None:
+                job.on_error(message)
+            else:
+                QMessageBox.warning(self.parent(), 'Error', f'Failed to load data: {message}')
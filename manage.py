@@ -0,0 +1,144 @@
+# manage.py
+
+# Command-line entry points for running the web application.
+#   python manage.py bootstrap                  create the schema and seed data (once per database)
+#   python manage.py serve --workers 4          production server: N worker processes, no reloader
+#   python manage.py prune-uploads              delete stored upload files no submission refers to
+#   python manage.py thumbnails                 make the missing thumbnails of stored images
+
+import os
+import sys
+import signal
+import socket
+import argparse
+from werkzeug.serving import make_server
+from app import create_app
+from config import get_config
+from database import db, make_engine, UploadBlob
+from bootstrap import bootstrap_database, database_is_bootstrapped
+from upload_store import prune_uploads
+from thumbnails import backfill_thumbnails, thumbnails_enabled
+
+def bootstrap(args):
+    app = create_app(args.config)
+    with app.app_context():
+        bootstrap_database(db.engine, db.session)
+    print("Bootstrap complete.")
+
+def prune(args):
+    app = create_app(args.config)
+    with app.app_context():
+        removed = prune_uploads(db.session, app.config['UPLOAD_FOLDER'])
+    print(f"Removed {removed} unreferenced upload(s).")
+
+def thumbnails(args):
+    if not thumbnails_enabled():
+        sys.exit("Thumbnails need Pillow: pip install Pillow")
+    app = create_app(args.config)
+    with app.app_context():
+        paths = [path for (path,) in db.session.query(UploadBlob.path)]
+    made, failed = backfill_thumbnails(app.config['UPLOAD_FOLDER'], paths)
+    print(f"Made {made} thumbnail(s), {failed} failed.")
+
+def run_worker(config, listener):
+    """Serve requests (a thread each) from the shared listening socket until interrupted."""
+    app = create_app(config)
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def serve(args):
+    # The schema is checked once here, not by every worker
+    engine = make_engine(get_config(args.config).SQLALCHEMY_DATABASE_URI)
+    bootstrapped = database_is_bootstrapped(engine)
+    engine.dispose()
+    if not bootstrapped:
+        sys.exit("The database has not been bootstrapped. Run: python manage.py bootstrap")
+
+    # One listening socket, bound before forking, shared by every worker
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+    print(f"Serving on http://{args.host}:{args.port}/ with {args.workers} worker process(es)")
+
+    if args.workers <= 1 or not hasattr(os, 'fork'):
+        if args.workers > 1:
+            print("This platform cannot fork; serving from a single threaded process instead.")
+        run_worker(args.config, listener)
+        return
+
+    workers = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            run_worker(args.config, listener)
+            os._exit(0)
+        workers.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(args.workers):
+        spawn()
+
+    # Replace workers that die; exit once every worker has stopped after a shutdown signal
+    try:
+        while workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            workers.discard(pid)
+            if not stopping:
+                print(f"Worker {pid} exited (status {status}); starting a replacement")
+                spawn()
+    except KeyboardInterrupt:
+        stop(signal.SIGINT, None)
+        for pid in list(workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+    print("Server stopped.")
+
+parser = argparse.ArgumentParser(description='Engage Portal web application commands.')
+parser.add_argument('--config', default=None,
+                    help="config name from config.py (default: ENGAGE_CONFIG, else 'development' for bootstrap "
+                         "and 'production' for serve)")
+commands = parser.add_subparsers(dest='command', required=True)
+
+bootstrap_parser = commands.add_parser('bootstrap', help='create the database schema and seed data')
+bootstrap_parser.set_defaults(handler=bootstrap)
+
+prune_parser = commands.add_parser('prune-uploads', help='delete stored upload files no submission refers to')
+prune_parser.set_defaults(handler=prune)
+
+thumbnails_parser = commands.add_parser('thumbnails', help='make the missing thumbnails of stored images')
+thumbnails_parser.set_defaults(handler=thumbnails)
+
+serve_parser = commands.add_parser('serve', help='serve the web application with several worker processes')
+serve_parser.add_argument('--host', default='127.0.0.1')
+serve_parser.add_argument('--port', type=int, default=8000)
+serve_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                          help='worker processes (default: CPU count)')
+serve_parser.set_defaults(handler=serve)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.command == 'serve' and args.config is None and 'ENGAGE_CONFIG' not in os.environ:
+        args.config = 'production'
+    args.handler(args)
@@ -2,8 +2,71 @@
 
 import os
 import sqlite3
-from app import app, db
-from database import User, Classroom, Attendance, Task
+import argparse
+from app import create_app
+from database import db, User, Classroom, Attendance, Task, SQLITE_PRAGMAS, ATTENDANCE_ROLLUP_TRIGGERS
+from reports import rebuild_attendance_rollups
+from upload_store import import_legacy_uploads
+
+app = create_app()
+
+parser = argparse.ArgumentParser(description='Upgrade an existing Engage Portal database in place.')
+parser.add_argument('--batch-size', type=int, default=1000,
+                    help='users copied into classroom_membership per transaction (default: 1000)')
+args = parser.parse_args()
+
+def backfill_memberships(conn, batch_size):
+    """
+    Copy legacy User.classroom_id assignments into classroom_membership, batch_size
+    users per transaction. The last processed user id is checkpointed in the same
+    transaction as each batch, so an interrupted run resumes where it stopped and
+    the database is never locked for longer than one batch.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS migration_checkpoint (
+        name VARCHAR(100) PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.commit()
+
+    cursor.execute("SELECT last_id FROM migration_checkpoint WHERE name = 'membership_backfill'")
+    row = cursor.fetchone()
+    last_id = row[0] if row else 0
+    if last_id:
+        print(f"Resuming membership backfill after user id {last_id}")
+
+    cursor.execute("SELECT COUNT(*) FROM user WHERE id > ?", (last_id,))
+    remaining = cursor.fetchone()[0]
+    processed = 0
+    copied = 0
+
+    while True:
+        cursor.execute("SELECT id, classroom_id FROM user WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+
+        assignments = [(user_id, classroom_id) for user_id, classroom_id in batch if classroom_id is not None]
+        cursor.executemany(
+            "INSERT OR IGNORE INTO classroom_membership (user_id, classroom_id) VALUES (?, ?)",
+            assignments
+        )
+        copied += cursor.rowcount if cursor.rowcount > 0 else 0
+        last_id = batch[-1][0]
+        cursor.execute("""
+        INSERT INTO migration_checkpoint (name, last_id, updated_at) VALUES ('membership_backfill', ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at
+        """, (last_id,))
+        conn.commit()
+
+        processed += len(batch)
+        remaining = max(remaining, processed)  # users created while the backfill runs
+        print(f"Membership backfill: {processed}/{remaining} users ({processed * 100 // remaining}%), {copied} memberships added")
+
+    print(f"Membership backfill complete ({copied} memberships added)")
 
 # Get the database path from the app config
 db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
@@ -12,15 +75,16 @@ db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
 if os.path.exists(db_path):
     print(f"Database found at {db_path}")
     
-    # Create a backup of the existing database
+    # Connect to the database, waiting for other writers instead of failing with "database is locked"
+    conn = sqlite3.connect(db_path, timeout=SQLITE_PRAGMAS['busy_timeout'] / 1000)
+    cursor = conn.cursor()
+    
+    # Create a backup of the existing database (the backup API includes pages still in the WAL file)
     backup_path = db_path + '.backup'
     print(f"Creating backup at {backup_path}")
-    with open(db_path, 'rb') as src, open(backup_path, 'wb') as dst:
-        dst.write(src.read())
-    
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    backup_conn = sqlite3.connect(backup_path)
+    conn.backup(backup_conn)
+    backup_conn.close()
     
     # Check if classroom table exists
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='classroom'")
@@ -64,6 +128,168 @@ if os.path.exists(db_path):
         cursor.execute("ALTER TABLE attendance ADD COLUMN classroom_id INTEGER NOT NULL DEFAULT 1 REFERENCES classroom(id)")
     else:
         print("classroom_id column already exists in attendance table")
+
+    # Add the local day bucket used for the one-row-per-day attendance upsert
+    if 'day' not in columns:
+        print("Adding day column to attendance table...")
+        cursor.execute("ALTER TABLE attendance ADD COLUMN day DATE")
+        # Existing rows were stamped with utcnow; bucket them by the local calendar day
+        cursor.execute("UPDATE attendance SET day = date(date, 'localtime')")
+    else:
+        print("day column already exists in attendance table")
+        cursor.execute("UPDATE attendance SET day = date(date, 'localtime') WHERE day IS NULL")
+
+    # Merge duplicate rows for the same student, classroom and day, keeping the latest mark
+    cursor.execute("""
+    DELETE FROM attendance
+    WHERE EXISTS (
+        SELECT 1 FROM attendance AS newer
+        WHERE newer.user_id = attendance.user_id
+          AND newer.classroom_id = attendance.classroom_id
+          AND newer.day = attendance.day
+          AND (newer.date > attendance.date OR (newer.date = attendance.date AND newer.id > attendance.id))
+    )
+    """)
+    if cursor.rowcount:
+        print(f"Merged {cursor.rowcount} duplicate attendance rows")
+
+    # Replace the date-based indexes with the day-based ones
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='attendance'")
+    existing_indexes = {row[0] for row in cursor.fetchall()}
+    for index_name in ('ix_attendance_classroom_date', 'ix_attendance_user_classroom_date'):
+        if index_name in existing_indexes:
+            print(f"Dropping obsolete index {index_name}...")
+            cursor.execute(f"DROP INDEX {index_name}")
+    attendance_indexes = {
+        'ix_attendance_classroom_day': 'INDEX ix_attendance_classroom_day ON attendance (classroom_id, day)',
+        'uq_attendance_user_classroom_day': 'UNIQUE INDEX uq_attendance_user_classroom_day ON attendance (user_id, classroom_id, day)',
+    }
+    for index_name, index_definition in attendance_indexes.items():
+        if index_name not in existing_indexes:
+            print(f"Creating {index_definition}...")
+            cursor.execute(f"CREATE {index_definition}")
+        else:
+            print(f"Index {index_name} already exists")
+    cursor.execute("ANALYZE attendance")
+
+    # Check if classroom_membership table exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='classroom_membership'")
+    if not cursor.fetchone():
+        print("Creating classroom_membership table...")
+        cursor.execute("""
+        CREATE TABLE classroom_membership (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            classroom_id INTEGER NOT NULL,
+            CONSTRAINT uq_user_classroom UNIQUE (user_id, classroom_id),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (classroom_id) REFERENCES classroom (id)
+        )
+        """)
+    else:
+        print("classroom_membership table already exists")
+    
+    # Index used by the membership-only roster join
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_classroom_membership_classroom_user ON classroom_membership (classroom_id, user_id)")
+    
+    # Attendance rollup tables, kept current by triggers on the attendance table
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='attendance_daily_rollup'")
+    rollups_missing = not cursor.fetchone()
+    if rollups_missing:
+        print("Creating attendance rollup tables...")
+        cursor.execute("""
+        CREATE TABLE attendance_daily_rollup (
+            classroom_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (classroom_id, day),
+            FOREIGN KEY (classroom_id) REFERENCES classroom (id)
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS student_attendance_rollup (
+            user_id INTEGER NOT NULL,
+            classroom_id INTEGER NOT NULL,
+            month VARCHAR(7) NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, classroom_id, month),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (classroom_id) REFERENCES classroom (id)
+        )
+        """)
+    else:
+        print("Attendance rollup tables already exist")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_attendance_daily_rollup_day ON attendance_daily_rollup (day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_attendance_rollup_month ON student_attendance_rollup (month)")
+    for trigger_sql in ATTENDANCE_ROLLUP_TRIGGERS.values():
+        cursor.execute(trigger_sql)
+    
+    # Outbox of parent notifications delivered by the background sender (outbox.py)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='outbox_message'")
+    if not cursor.fetchone():
+        print("Creating outbox_message table...")
+        cursor.execute("""
+        CREATE TABLE outbox_message (
+            id INTEGER PRIMARY KEY,
+            sender VARCHAR(120) NOT NULL,
+            recipient VARCHAR(120) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            student_id INTEGER,
+            classroom_id INTEGER,
+            status VARCHAR(10) NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error VARCHAR(255),
+            created_at DATETIME NOT NULL,
+            next_attempt_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            sent_at DATETIME,
+            FOREIGN KEY (student_id) REFERENCES user (id),
+            FOREIGN KEY (classroom_id) REFERENCES classroom (id)
+        )
+        """)
+    else:
+        print("outbox_message table already exists")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_outbox_message_status_next_attempt ON outbox_message (status, next_attempt_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_outbox_message_classroom_created ON outbox_message (classroom_id, created_at)")
+    
+    # Version counters keying the cached classroom page data (classroom_cache.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS classroom_version (
+        classroom_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        FOREIGN KEY (classroom_id) REFERENCES classroom (id)
+    )
+    """)
+    
+    # Content-addressed upload store (upload_store.py)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='upload_blob'")
+    if not cursor.fetchone():
+        print("Creating upload_blob table...")
+        cursor.execute("""
+        CREATE TABLE upload_blob (
+            hash VARCHAR(64) PRIMARY KEY,
+            path VARCHAR(255) NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL,
+            created_at DATETIME NOT NULL
+        )
+        """)
+    else:
+        print("upload_blob table already exists")
+    
+    cursor.execute("PRAGMA table_info(task)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'file_hash' not in columns:
+        print("Adding file_hash column to task table...")
+        cursor.execute("ALTER TABLE task ADD COLUMN file_hash VARCHAR(64) REFERENCES upload_blob(hash)")
+    else:
+        print("file_hash column already exists in task table")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_task_file_hash ON task (file_hash)")
     
     # Create a default classroom if none exists
     cursor.execute("SELECT COUNT(*) FROM classroom")
@@ -72,9 +298,26 @@ if os.path.exists(db_path):
         cursor.execute("INSERT INTO classroom (name, description) VALUES (?, ?)", 
                        ("Default Classroom", "Default classroom for all students"))
     
-    # Commit changes and close connection
+    # Commit schema changes
     conn.commit()
+    
+    # Fold legacy User.classroom_id assignments into classroom_membership in small batches
+    backfill_memberships(conn, args.batch_size)
+    
+    # Close connection
     conn.close()
+    
+    # Fill the new rollup tables from the existing attendance history
+    if rollups_missing:
+        with app.app_context():
+            daily_rows, student_rows = rebuild_attendance_rollups(db.session)
+        print(f"Attendance rollups built ({daily_rows} classroom-day, {student_rows} student-month rows)")
+    
+    # Move files uploaded before the store existed into it, merging duplicates
+    with app.app_context():
+        imported, missing = import_legacy_uploads(db.session, app.config['UPLOAD_FOLDER'])
+    if imported or missing:
+        print(f"Moved {imported} uploaded files into the upload store ({missing} referenced files were not found)")
     print("Database migration completed successfully!")
     
 else:
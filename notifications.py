@@ -0,0 +1,54 @@
+# notifications.py
+
+# Parent notification content shared by the web application and the desktop client:
+# the default subject/body for a student's attendance status and the list of parents
+# to notify after roll call.
+
+from collections import namedtuple
+from database import Attendance
+from roster import get_roster
+from attendance import attendance_today
+
+# A student marked absent/late today, with the default message for their parent
+NotificationRecipient = namedtuple('NotificationRecipient', ['student_id', 'username', 'parent_email', 'status', 'subject', 'body'])
+
+_SIGNATURE = """
+
+Please contact the school for more information.
+
+Regards,
+School Administration"""
+
+def default_notification(student_name, classroom_name, status):
+    """Default (subject, body) of a parent notification for the given attendance status."""
+    if status == 'absent':
+        subject = f'Absence Notification for {student_name}'
+        opening = f'This is to inform you that {student_name} was marked absent today in {classroom_name}.'
+    elif status == 'late':
+        subject = f'Late Arrival Notification for {student_name}'
+        opening = f'This is to inform you that {student_name} was marked late today in {classroom_name}.'
+    else:
+        subject = f'Attendance Notification for {student_name}'
+        opening = f"This is to inform you about {student_name}'s attendance status in {classroom_name}."
+    return subject, f'Dear Parent/Guardian,\n\n{opening}{_SIGNATURE}'
+
+def absent_late_recipients(session, classroom, statuses=('absent', 'late')):
+    """
+    Students of the classroom marked absent or late today, each with the default message.
+    Returns (recipients, missing_email): students without a parent email are listed
+    separately so the caller can report them.
+    """
+    marks = dict(session.query(Attendance.user_id, Attendance.status)
+                 .filter(Attendance.classroom_id == classroom.id, Attendance.day == attendance_today(),
+                         Attendance.status.in_(statuses)))
+    recipients, missing_email = [], []
+    for student in get_roster(session, classroom.id):
+        status = marks.get(student.id)
+        if status is None:
+            continue
+        if not student.parent_email:
+            missing_email.append(student)
+            continue
+        subject, body = default_notification(student.username, classroom.name, status)
+        recipients.append(NotificationRecipient(student.id, student.username, student.parent_email, status, subject, body))
+    return recipients, missing_email
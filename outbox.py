@@ -0,0 +1,316 @@
+# outbox.py
+
+# Parent notifications are written to the outbox_message table and delivered by a
+# background sender thread, so neither an HTTP request nor the desktop UI waits on
+# SMTP. The sender keeps one authenticated connection per sender address open and
+# reuses it, retries transient failures with exponential backoff, and records the
+# delivery status on each row for the UI to show.
+#
+# SMTP passwords are held in this process's memory only (never in the database) and
+# forgotten after ENGAGE_OUTBOX_CREDENTIAL_TTL seconds. A message whose sender has no
+# credentials in memory stays queued until that sender queues another message.
+
+import os
+import time
+import random
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from sqlalchemy.orm import sessionmaker
+from cache import LRUCache
+from database import OutboxMessage
+
+# SMTP server; point these at a local stand-in (e.g. `python -m aiosmtpd -n -l localhost:8025`
+# with ENGAGE_SMTP_STARTTLS=0) to try notifications without a real mailbox.
+SMTP_HOST = os.environ.get('ENGAGE_SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('ENGAGE_SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('ENGAGE_SMTP_STARTTLS', '1') == '1'
+SMTP_TIMEOUT = int(os.environ.get('ENGAGE_SMTP_TIMEOUT', 30))
+# Open connections are closed after this many idle seconds (servers drop them eventually anyway)
+SMTP_IDLE_TIMEOUT = int(os.environ.get('ENGAGE_SMTP_IDLE_TIMEOUT', 120))
+
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('ENGAGE_OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_BASE = int(os.environ.get('ENGAGE_OUTBOX_RETRY_BASE', 30)) # seconds; doubles per attempt
+OUTBOX_RETRY_MAX = int(os.environ.get('ENGAGE_OUTBOX_RETRY_MAX', 3600))
+OUTBOX_CREDENTIAL_TTL = int(os.environ.get('ENGAGE_OUTBOX_CREDENTIAL_TTL', 8 * 3600))
+OUTBOX_POLL_INTERVAL = 5 # seconds between checks for retries that have come due
+OUTBOX_BATCH_SIZE = 50
+# A row left 'sending' this long belonged to a sender that died mid-send
+OUTBOX_STALE_SENDING = timedelta(minutes=10)
+
+OUTBOX_STATUSES = ('queued', 'sending', 'sent', 'failed')
+
+def build_message(sender, recipient, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def describe_smtp_error(error):
+    """Short, user-facing explanation of a failed send."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return 'Email login failed. If using Gmail, make sure you are using an App Password, not your regular password.'
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return 'The recipient address was refused by the email server.'
+    if isinstance(error, smtplib.SMTPException):
+        return f'Email server error: {error}'
+    return f'Failed to send email: {error}'
+
+def _is_permanent(error):
+    # Retrying cannot fix a wrong password or a rejected address
+    return isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError))
+
+def retry_delay(attempts):
+    """Backoff before retry number attempts: base * 2^(attempts-1), capped, with +/-20% jitter."""
+    delay = min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+class SMTPConnectionPool:
+    """
+    One authenticated SMTP connection per sender address, reused across messages.
+    Only the sender thread touches it, so it needs no locking.
+    """
+    def __init__(self, host=None, port=None, starttls=None, idle_timeout=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.idle_timeout = idle_timeout or SMTP_IDLE_TIMEOUT
+        self._connections = {}  # sender -> [smtplib.SMTP, last used (monotonic)]
+        self.opened = 0
+
+    def _open(self, sender, password):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.starttls:
+                server.starttls()
+            server.ehlo_or_helo_if_needed()
+            # A local relay or test server may not offer AUTH at all
+            if server.has_extn('auth'):
+                server.login(sender, password)
+        except Exception:
+            server.close()
+            raise
+        self.opened += 1
+        return server
+
+    def send(self, sender, password, msg):
+        """Send msg over the sender's open connection, reconnecting once if the server dropped it."""
+        entry = self._connections.get(sender)
+        if entry is None:
+            entry = self._connections[sender] = [self._open(sender, password), 0.0]
+        try:
+            entry[0].send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            entry[0] = self._open(sender, password)
+            entry[0].send_message(msg)
+        entry[1] = time.monotonic()
+
+    def discard(self, sender):
+        entry = self._connections.pop(sender, None)
+        if entry is not None:
+            try:
+                entry[0].quit()
+            except Exception:
+                entry[0].close()
+
+    def close_idle(self, idle_timeout=None):
+        idle_timeout = idle_timeout or self.idle_timeout
+        now = time.monotonic()
+        for sender, (_, last_used) in list(self._connections.items()):
+            if now - last_used > idle_timeout:
+                self.discard(sender)
+
+    def close(self):
+        for sender in list(self._connections):
+            self.discard(sender)
+
+class OutboxSender:
+    """
+    Background thread delivering queued OutboxMessage rows. Started on first use
+    (so a forked web worker starts its own) and woken whenever a message is queued.
+    """
+    def __init__(self, connection_pool=None):
+        self.credentials = LRUCache(maxsize=256, ttl=OUTBOX_CREDENTIAL_TTL)  # sender -> password
+        self.pool = connection_pool or SMTPConnectionPool()
+        self.sent = 0
+        self.failed = 0
+        self._session_factory = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def start(self, engine):
+        """Start the sender thread for engine's database (no-op if already running)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._session_factory = sessionmaker(bind=engine)
+            self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+            self._thread.start()
+
+    def remember_credentials(self, sender, password):
+        self.credentials.set(sender, password)
+
+    def add_listener(self, callback):
+        """
+        Call callback(update) whenever a message changes status, with update a dict holding
+        the message's id, classroom_id, recipient, status, attempts, last_error and sent_at.
+        It runs on the sender thread, so it must be quick and hand the update off (e.g. via a Qt signal).
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, message):
+        update = {'id': message.id, 'classroom_id': message.classroom_id, 'recipient': message.recipient,
+                  'status': message.status, 'attempts': message.attempts, 'last_error': message.last_error,
+                  'sent_at': message.sent_at.isoformat(timespec='seconds') if message.sent_at else None}
+        for callback in list(self._listeners):
+            try:
+                callback(update)
+            except Exception as e:
+                print(f"Outbox listener error: {e}")
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(OUTBOX_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self.process_due()
+            except Exception as e:
+                print(f"Outbox sender error: {e}")
+            self.pool.close_idle()
+
+    def process_due(self):
+        """Deliver every due message whose sender's credentials are in memory. Returns how many were tried."""
+        session = self._session_factory()
+        tried = 0
+        try:
+            now = datetime.now()
+            session.query(OutboxMessage) \
+                .filter(OutboxMessage.status == 'sending', OutboxMessage.updated_at < now - OUTBOX_STALE_SENDING) \
+                .update({'status': 'queued', 'updated_at': now}, synchronize_session=False)
+            session.commit()
+
+            while True:
+                senders = self.credentials.keys()
+                if not senders:
+                    break
+                due = session.query(OutboxMessage.id) \
+                    .filter(OutboxMessage.status == 'queued', OutboxMessage.next_attempt_at <= datetime.now(),
+                            OutboxMessage.sender.in_(senders)) \
+                    .order_by(OutboxMessage.next_attempt_at).limit(OUTBOX_BATCH_SIZE).all()
+                if not due:
+                    break
+                for (message_id,) in due:
+                    if self._claim(session, message_id):
+                        message = session.query(OutboxMessage).get(message_id)
+                        self._notify(message)
+                        self._deliver(session, message)
+                        self._notify(message)
+                        tried += 1
+        finally:
+            session.close()
+        return tried
+
+    def _claim(self, session, message_id):
+        # Another worker process may be racing for the same row; only one UPDATE wins
+        claimed = session.query(OutboxMessage) \
+            .filter(OutboxMessage.id == message_id, OutboxMessage.status == 'queued') \
+            .update({'status': 'sending', 'updated_at': datetime.now()}, synchronize_session=False)
+        session.commit()
+        return claimed == 1
+
+    def _deliver(self, session, message):
+        password = self.credentials.get(message.sender)
+        now = datetime.now()
+        message.attempts += 1
+        message.updated_at = now
+        try:
+            if password is None:
+                raise smtplib.SMTPAuthenticationError(535, b'Sign-in expired; queue the message again to re-enter the password')
+            self.pool.send(message.sender, password,
+                           build_message(message.sender, message.recipient, message.subject, message.body))
+        except Exception as e:
+            # smtplib resets the session after a per-message refusal, so the connection stays usable
+            if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+                self.pool.discard(message.sender)
+            message.last_error = describe_smtp_error(e)[:255]
+            if isinstance(e, smtplib.SMTPAuthenticationError):
+                self.credentials.invalidate(message.sender)
+            if _is_permanent(e) or message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                message.status = 'failed'
+                self.failed += 1
+            else:
+                message.status = 'queued'
+                message.next_attempt_at = now + retry_delay(message.attempts)
+        else:
+            message.status = 'sent'
+            message.sent_at = now
+            message.last_error = None
+            self.sent += 1
+        session.commit()
+
+    def stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'connections_opened': self.pool.opened,
+            'senders_signed_in': len(self.credentials.keys()),
+        }
+
+# One sender per process
+outbox = OutboxSender()
+
+def queue_notification(session, sender, password, recipient, subject, body, student_id=None, classroom_id=None):
+    """
+    Add a message to the outbox and keep the sender's password in memory for the
+    sender thread. The caller commits, then calls send_queued() to wake the sender.
+    """
+    outbox.remember_credentials(sender, password)
+    message = OutboxMessage(sender=sender, recipient=recipient, subject=subject, body=body,
+                            student_id=student_id, classroom_id=classroom_id)
+    session.add(message)
+    return message
+
+def send_queued(engine):
+    """Start the sender thread if needed and wake it to deliver newly committed messages."""
+    outbox.start(engine)
+    outbox.wake()
+
+def outbox_status(session, classroom_id, limit=20, message_ids=None):
+    """
+    Most recent notifications for a classroom (or just message_ids of it), newest first, as plain dicts for the UI.
+    Reads columns rather than OutboxMessage objects so a long-lived session never
+    shows a status cached before the sender thread updated it.
+    """
+    columns = (OutboxMessage.id, OutboxMessage.recipient, OutboxMessage.subject, OutboxMessage.status,
+               OutboxMessage.attempts, OutboxMessage.last_error, OutboxMessage.created_at, OutboxMessage.sent_at)
+    query = session.query(*columns).filter(OutboxMessage.classroom_id == classroom_id)
+    if message_ids is not None:
+        query = query.filter(OutboxMessage.id.in_(message_ids))
+    rows = query.order_by(OutboxMessage.created_at.desc()).limit(limit).all()
+    return [
+        {
+            'id': row.id,
+            'recipient': row.recipient,
+            'subject': row.subject,
+            'status': row.status,
+            'attempts': row.attempts,
+            'last_error': row.last_error,
+            'created_at': row.created_at.isoformat(timespec='seconds'),
+            'sent_at': row.sent_at.isoformat(timespec='seconds') if row.sent_at else None,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,117 @@
+# outbox_panel.py
+
+# Desktop view of the outbox. Parent emails are delivered by the outbox's background
+# sender thread (see outbox.py), which keeps one authenticated SMTP connection per sender
+# open for the session. OutboxBridge relays each status change from that thread to the
+# GUI thread as a Qt signal, so widgets update when a send finishes instead of polling
+# the database. OutboxPanel lists a classroom's recent and queued notifications.
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (QGroupBox, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView)
+from outbox import outbox, outbox_status
+from attendance import attendance_today
+from desktop_loader import DataLoader
+
+STATUS_COLORS = {
+    'sent': QColor('#43b581'),
+    'failed': QColor('#f04747'),
+}
+
+class OutboxBridge(QObject):
+    """Re-emits the sender thread's status changes; connected slots run on the GUI thread."""
+    message_updated = pyqtSignal(object)  # update dict, see OutboxSender.add_listener
+
+    def __init__(self):
+        super().__init__()
+        outbox.add_listener(self.message_updated.emit)
+
+_bridge = None
+
+def outbox_bridge():
+    """The process's OutboxBridge (created on first use, which must be on the GUI thread)."""
+    global _bridge
+    if _bridge is None:
+        _bridge = OutboxBridge()
+    return _bridge
+
+def outbox_status_item(message):
+    """Table item showing a message's status, and its last error if any."""
+    text = message['status']
+    if message['last_error']:
+        text += f": {message['last_error']}"
+    item = QTableWidgetItem(text)
+    if message['status'] in STATUS_COLORS:
+        item.setForeground(STATUS_COLORS[message['status']])
+    return item
+
+class OutboxPanel(QGroupBox):
+    """A classroom's latest parent notifications, kept current from the sender's signals."""
+    LIMIT = 50
+
+    def __init__(self, classroom_id, parent=None):
+        super().__init__('Parent Notifications', parent)
+        self.classroom_id = classroom_id
+        self.loader = DataLoader(self)
+        self.messages = []  # newest first, as returned by outbox_status
+        self._rows = {}  # message id -> table row
+
+        layout = QVBoxLayout()
+        self.summary_label = QLabel('Loading...')
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+        self.table = QTableWidget()
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels(['Recipient', 'Subject', 'Queued', 'Status'])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setMaximumHeight(140)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        outbox_bridge().message_updated.connect(self.message_updated)
+        self.reload()
+
+    def reload(self):
+        self.loader.load('notifications', outbox_status, self.classroom_id, self.LIMIT,
+                         on_done=self.show_messages, label='desktop.outbox_status')
+
+    def show_messages(self, messages):
+        self.messages = messages
+        self._rows = {message['id']: row for row, message in enumerate(messages)}
+        self.table.setRowCount(len(messages))
+        for row, message in enumerate(messages):
+            self.table.setItem(row, 0, QTableWidgetItem(message['recipient']))
+            self.table.setItem(row, 1, QTableWidgetItem(message['subject']))
+            self.table.setItem(row, 2, QTableWidgetItem(message['created_at'].replace('T', ' ')))
+            self.table.setItem(row, 3, outbox_status_item(message))
+        self.show_summary()
+
+    def message_updated(self, update):
+        if update['classroom_id'] != self.classroom_id:
+            return
+        row = self._rows.get(update['id'])
+        if row is None:
+            # Queued after the last load (e.g. from the batch dialog)
+            self.reload()
+            return
+        message = self.messages[row]
+        message.update(status=update['status'], attempts=update['attempts'], last_error=update['last_error'],
+                       sent_at=update['sent_at'])
+        self.table.setItem(row, 3, outbox_status_item(message))
+        self.show_summary()
+
+    def show_summary(self):
+        pending = sum(1 for message in self.messages if message['status'] in ('queued', 'sending'))
+        sent_today = sum(1 for message in self.messages if message['status'] == 'sent'
+                         and message['sent_at'] and message['sent_at'][:10] == attendance_today().isoformat())
+        failed = [message for message in self.messages if message['status'] == 'failed']
+
+        text = f'{pending} waiting to send, {sent_today} sent today'
+        if failed:
+            text += f", {len(failed)} failed (latest: {failed[0]['recipient']}: {failed[0]['last_error']})"
+        self.summary_label.setText(text)
+        self.summary_label.setStyleSheet('color: #f04747;' if failed else '')
+
+    def cancel(self):
+        self.loader.cancel()
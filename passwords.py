@@ -0,0 +1,82 @@
+# passwords.py
+
+# Password hashing shared by the web application, the desktop client and the scripts.
+# bcrypt is deliberately slow, so logins verify on a small bounded worker pool: a burst
+# of logins waits in a short queue instead of tying up every web worker, and once the
+# queue is full further attempts are turned away at once instead of piling up.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# bcrypt work factor for new hashes; each +1 doubles the cost. Existing hashes made
+# with a different factor are rehashed the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.environ.get('ENGAGE_BCRYPT_ROUNDS', 12))
+
+# Hashes verified at once (bcrypt releases the GIL, so threads use every core)
+PASSWORD_WORKERS = int(os.environ.get('ENGAGE_PASSWORD_WORKERS', os.cpu_count() or 1))
+# Logins allowed to wait for a worker before new ones are rejected
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('ENGAGE_PASSWORD_QUEUE_LIMIT', PASSWORD_WORKERS * 16))
+
+class PasswordCheckRejected(Exception):
+    """Raised when the verification queue is full; the caller should ask the user to retry."""
+
+def hash_password(password, rounds=None):
+    """bcrypt hash of password (str) as a str, using BCRYPT_ROUNDS unless rounds is given."""
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+def hash_rounds(password_hash):
+    """The work factor a bcrypt hash was made with ('$2b$12$...' -> 12)."""
+    return int(password_hash.split('$')[2])
+
+def check_password(password_hash, password, rounds=None):
+    """
+    Verify password against password_hash on the calling thread.
+    Returns (valid, new_hash): new_hash is a fresh hash at the configured work
+    factor when the password is valid but was hashed with a different one, else None.
+    """
+    if not password_hash or password is None:
+        return False, None
+    try:
+        valid = bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False, None  # not a bcrypt hash
+    rounds = rounds or BCRYPT_ROUNDS
+    if valid and hash_rounds(password_hash) != rounds:
+        return True, hash_password(password, rounds)
+    return valid, None
+
+class PasswordVerifier:
+    """
+    Bounded pool for check_password. At most workers checks run at once and at
+    most queue_limit more wait; beyond that submit() raises PasswordCheckRejected.
+    """
+    def __init__(self, workers=PASSWORD_WORKERS, queue_limit=PASSWORD_QUEUE_LIMIT, rounds=None):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.rejected = 0
+
+    def submit(self, password_hash, password):
+        """Queue a check and return a Future of (valid, new_hash)."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordCheckRejected('Too many logins in progress')
+        try:
+            future = self._executor.submit(check_password, password_hash, password, self.rounds)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def verify(self, password_hash, password):
+        """Queue a check and wait for its (valid, new_hash) result."""
+        return self.submit(password_hash, password).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+password_verifier = PasswordVerifier()
@@ -0,0 +1,20 @@
+# rebuild_rollups.py
+
+# Recomputes the attendance rollup tables (per classroom-day and per student-month)
+# from the raw attendance rows. The triggers keep the rollups current from then on;
+# run this once after migrate_db.py, or again if the rollups are ever suspected stale.
+# Usage:  python rebuild_rollups.py
+
+import time
+from app import create_app
+from database import db
+from reports import rebuild_attendance_rollups
+
+app = create_app()
+
+with app.app_context():
+    db.create_all()  # rollup tables and their triggers, if this database predates them
+    started = time.perf_counter()
+    daily_rows, student_rows = rebuild_attendance_rollups(db.session)
+    print(f"Rebuilt {daily_rows} classroom-day and {student_rows} student-month rollup rows "
+          f"in {time.perf_counter() - started:.2f}s")
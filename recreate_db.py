@@ -3,29 +3,29 @@
 import os
 import sqlite3
 from flask import Flask
-from database import db, User, Classroom, Attendance, ClassroomTask, Task
-from flask_bcrypt import Bcrypt
+from database import db, User, Classroom, Attendance, ClassroomTask, Task, ClassroomMembership
+from database import DATABASE_PATH, DATABASE_URI, SQLITE_PRAGMAS
+from passwords import hash_password
 
-# Remove existing database
-db_path = 'instance/site.db'
-if os.path.exists(db_path):
-    print(f"Removing existing database at {db_path}")
-    os.remove(db_path)
+# Remove existing database (and any WAL/shared-memory files left next to it)
+db_path = DATABASE_PATH
+for path in (db_path, db_path + '-wal', db_path + '-shm'):
+    if os.path.exists(path):
+        print(f"Removing existing database file at {path}")
+        os.remove(path)
 
 # Create directory if it doesn't exist
-instance_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+instance_dir = os.path.dirname(db_path)
 os.makedirs(instance_dir, exist_ok=True)
 print(f"Created instance directory at {instance_dir}")
 
 # Create a Flask app and initialize the database
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = SQLITE_PRAGMAS
 db.init_app(app)
 
-# Initialize Bcrypt
-bcrypt = Bcrypt(app)
-
 # Create application context
 with app.app_context():
     # Create all tables
@@ -34,7 +34,7 @@ with app.app_context():
 
     # Create default admin user
     print("Creating default admin user...")
-    admin = User(username='admin', password_hash=bcrypt.generate_password_hash('admin').decode('utf-8'), role='admin')
+    admin = User(username='admin', password_hash=hash_password('admin'), role='admin')
     db.session.add(admin)
 
     # Create default classroom
@@ -44,14 +44,14 @@ with app.app_context():
 
     # Create test teacher
     print("Creating test teacher...")
-    teacher = User(username='test_teacher', password_hash=bcrypt.generate_password_hash('password').decode('utf-8'), role='teacher')
+    teacher = User(username='test_teacher', password_hash=hash_password('password'), role='teacher')
     db.session.add(teacher)
 
     # Create test student
     print("Creating test student...")
     student = User(
         username='student1', 
-        password_hash=bcrypt.generate_password_hash('password').decode('utf-8'), 
+        password_hash=hash_password('password'), 
         role='student',
         parent_email='parent@example.com'
     )
@@ -66,6 +66,7 @@ with app.app_context():
 
     # Assign student to classroom
     student.classroom_id = classroom.id
+    db.session.add(ClassroomMembership(user_id=student.id, classroom_id=classroom.id))
 
     # Commit changes
     db.session.commit()
@@ -0,0 +1,80 @@
+# reports.py
+
+# Attendance rate reports shared by the web application and the desktop client.
+# Every report reads the rollup tables, which the attendance triggers keep current,
+# so its cost depends on the number of classrooms and days in the range,
+# not on how many attendance rows have ever been recorded.
+
+from collections import namedtuple
+from sqlalchemy import func
+from database import User, Classroom, Attendance, AttendanceDailyRollup, StudentAttendanceRollup
+
+# One report line; rate is the share of marks that were present or late
+AttendanceRate = namedtuple('AttendanceRate', ['key', 'label', 'present', 'absent', 'late', 'total', 'rate'])
+
+def _rate_row(key, label, present, absent, late):
+    present, absent, late = present or 0, absent or 0, late or 0
+    total = present + absent + late
+    return AttendanceRate(key, label, present, absent, late, total, (present + late) / total if total else None)
+
+def _sums(model):
+    return (func.sum(model.present), func.sum(model.absent), func.sum(model.late))
+
+def classroom_attendance_rates(session, start, end, classroom_ids=None):
+    """Attendance rate of each classroom between start and end (inclusive dates)."""
+    query = session.query(AttendanceDailyRollup.classroom_id, Classroom.name, *_sums(AttendanceDailyRollup)) \
+        .join(Classroom, Classroom.id == AttendanceDailyRollup.classroom_id) \
+        .filter(AttendanceDailyRollup.day.between(start, end))
+    if classroom_ids is not None:
+        query = query.filter(AttendanceDailyRollup.classroom_id.in_(classroom_ids))
+    rows = query.group_by(AttendanceDailyRollup.classroom_id, Classroom.name).order_by(Classroom.name).all()
+    return [_rate_row(*row) for row in rows]
+
+def weekly_attendance_rates(session, classroom_id, start, end):
+    """Attendance rate of one classroom for each week (Monday-based, 'YYYY-WW') between start and end."""
+    week = func.strftime('%Y-%W', AttendanceDailyRollup.day)
+    rows = session.query(week, func.min(AttendanceDailyRollup.day), *_sums(AttendanceDailyRollup)) \
+        .filter(AttendanceDailyRollup.classroom_id == classroom_id, AttendanceDailyRollup.day.between(start, end)) \
+        .group_by(week).order_by(week).all()
+    return [_rate_row(week_key, f'Week of {first_day}', *counts) for week_key, first_day, *counts in rows]
+
+def student_attendance_rates(session, start, end, classroom_ids=None):
+    """
+    Attendance rate of each student for the calendar months overlapping start..end.
+    Student counts are kept per month, so partial months are reported whole.
+    """
+    query = session.query(StudentAttendanceRollup.user_id, User.username, *_sums(StudentAttendanceRollup)) \
+        .join(User, User.id == StudentAttendanceRollup.user_id) \
+        .filter(StudentAttendanceRollup.month.between(start.strftime('%Y-%m'), end.strftime('%Y-%m')))
+    if classroom_ids is not None:
+        query = query.filter(StudentAttendanceRollup.classroom_id.in_(classroom_ids))
+    rows = query.group_by(StudentAttendanceRollup.user_id, User.username).order_by(User.username).all()
+    return [_rate_row(*row) for row in rows]
+
+def rebuild_attendance_rollups(session):
+    """
+    Recompute both rollup tables from the raw attendance rows (backfill or repair).
+    Runs as one transaction, so readers see either the old or the new rollups.
+    Returns (daily_rows, student_rows).
+    """
+    status_counts = (
+        func.sum(Attendance.status == 'present'),
+        func.sum(Attendance.status == 'absent'),
+        func.sum(Attendance.status == 'late'),
+    )
+    month = func.strftime('%Y-%m', Attendance.day)
+    daily = session.query(Attendance.classroom_id, Attendance.day, *status_counts) \
+        .group_by(Attendance.classroom_id, Attendance.day)
+    student = session.query(Attendance.user_id, Attendance.classroom_id, month, *status_counts) \
+        .group_by(Attendance.user_id, Attendance.classroom_id, month)
+    columns = ('present', 'absent', 'late')
+    try:
+        session.query(AttendanceDailyRollup).delete(synchronize_session=False)
+        session.query(StudentAttendanceRollup).delete(synchronize_session=False)
+        session.execute(AttendanceDailyRollup.__table__.insert().from_select(('classroom_id', 'day') + columns, daily))
+        session.execute(StudentAttendanceRollup.__table__.insert().from_select(('user_id', 'classroom_id', 'month') + columns, student))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return session.query(AttendanceDailyRollup).count(), session.query(StudentAttendanceRollup).count()
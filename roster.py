@@ -0,0 +1,57 @@
+# roster.py
+
+# Classroom roster service shared by the web application and the desktop client.
+# A student belongs to a classroom through the legacy User.classroom_id column or
+# through a ClassroomMembership row; the roster is the union of both.
+
+import os
+from collections import namedtuple
+from cache import LRUCache
+from database import User, ClassroomMembership
+
+# Read-only snapshot of a student on a roster (safe to share across sessions and threads)
+RosterStudent = namedtuple('RosterStudent', ['id', 'username', 'parent_email'])
+
+# Rosters are invalidated explicitly on every membership change made in this process;
+# the TTL only bounds staleness from changes made by another process (e.g. the desktop app).
+ROSTER_CACHE_SIZE = int(os.environ.get('ENGAGE_ROSTER_CACHE_SIZE', 256))
+ROSTER_CACHE_TTL = int(os.environ.get('ENGAGE_ROSTER_CACHE_TTL', 300))
+
+# Once migrate_db.py has folded every legacy User.classroom_id into classroom_membership,
+# set ENGAGE_ROSTER_MEMBERSHIP_ONLY=1 to read rosters with the single indexed membership join.
+ROSTER_MEMBERSHIP_ONLY = os.environ.get('ENGAGE_ROSTER_MEMBERSHIP_ONLY', '0') == '1'
+
+roster_cache = LRUCache(maxsize=ROSTER_CACHE_SIZE, ttl=ROSTER_CACHE_TTL)
+
+def load_roster(session, classroom_id):
+    """Query the students of a classroom (legacy classroom_id or membership), ordered by username."""
+    columns = (User.id, User.username, User.parent_email)
+    member = session.query(*columns).join(ClassroomMembership, ClassroomMembership.user_id == User.id) \
+        .filter(ClassroomMembership.classroom_id == classroom_id, User.role == 'student')
+    if ROSTER_MEMBERSHIP_ONLY:
+        rows = member.order_by(User.username).all()
+    else:
+        legacy = session.query(*columns).filter(User.classroom_id == classroom_id, User.role == 'student')
+        rows = legacy.union(member).order_by(User.username).all()
+    return tuple(RosterStudent(*row) for row in rows)
+
+def get_roster(session, classroom_id):
+    """Return the cached roster for a classroom, loading it on a miss."""
+    classroom_id = int(classroom_id)
+    roster = roster_cache.get(classroom_id)
+    if roster is None:
+        roster = load_roster(session, classroom_id)
+        roster_cache.set(classroom_id, roster)
+    return roster
+
+def invalidate_roster(*classroom_ids):
+    """Forget the cached rosters of the given classrooms (None and empty ids are ignored)."""
+    for classroom_id in classroom_ids:
+        if classroom_id:
+            roster_cache.invalidate(int(classroom_id))
+
+def invalidate_student_rosters(session, user_id):
+    """Forget every cached roster the given student appears on."""
+    user = session.query(User).get(user_id)
+    classroom_ids = [m.classroom_id for m in session.query(ClassroomMembership).filter_by(user_id=user_id)]
+    invalidate_roster(user.classroom_id if user else None, *classroom_ids)
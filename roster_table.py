@@ -0,0 +1,150 @@
+# roster_table.py
+
+# Model and delegate for the desktop classroom roster. The table is a QTableView over
+# RosterTableModel, and the Present/Absent/Late/Notify buttons of each row are painted
+# by AttendanceButtonsDelegate instead of being real widgets. Only the visible rows are
+# ever drawn, and new roster data just replaces the model's rows.
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QRect, QEvent, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionButton, QStyle, QPushButton
+
+STATUS_COLORS = {
+    'present': QColor(200, 255, 200),  # Light green
+    'absent': QColor(255, 200, 200),  # Light red
+    'late': QColor(255, 255, 200),  # Light yellow
+}
+
+# Row actions, in the order their buttons are painted
+ACTION_LABELS = {'present': 'Present', 'absent': 'Absent', 'late': 'Late', 'notify': 'Notify'}
+ACTIONS_ROLE = Qt.UserRole  # data role holding a row's action names
+
+class RosterTableModel(QAbstractTableModel):
+    """Students of a classroom with today's attendance; staff rows carry attendance actions."""
+    HEADERS = ('Username', 'Attendance', 'Email', 'Actions')
+    ACTIONS_COLUMN = 3
+
+    def __init__(self, staff_view, parent=None):
+        super().__init__(parent)
+        self.staff_view = staff_view
+        self.students = ()
+        self.attendance = {}  # student id -> status
+        self._rows = {}  # student id -> row
+
+    def set_roster(self, students, attendance):
+        self.beginResetModel()
+        self.students = tuple(students)
+        self.attendance = dict(attendance)
+        self._rows = {student.id: row for row, student in enumerate(self.students)}
+        self.endResetModel()
+
+    def set_status(self, student_id, status):
+        """Change one student's mark and repaint just their row."""
+        row = self._rows.get(student_id)
+        if row is None:
+            return
+        self.attendance[student_id] = status
+        self.dataChanged.emit(self.index(row, 1), self.index(row, self.ACTIONS_COLUMN))
+
+    def student(self, row):
+        return self.students[row]
+
+    def status(self, student_id):
+        return self.attendance.get(student_id, 'Not marked')
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.students)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        student = self.students[index.row()]
+        column = index.column()
+        status = self.status(student.id)
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return student.username
+            if column == 1:
+                return status
+            if column == 2:
+                return student.parent_email or 'Not set'
+            if column == self.ACTIONS_COLUMN and not self.staff_view:
+                return 'No actions available'
+        elif role == Qt.BackgroundRole and column == 1:
+            return STATUS_COLORS.get(status)
+        elif role == ACTIONS_ROLE and column == self.ACTIONS_COLUMN and self.staff_view:
+            actions = ('present', 'absent', 'late')
+            return actions + ('notify',) if status in ('absent', 'late') else actions
+        return None
+
+class AttendanceButtonsDelegate(QStyledItemDelegate):
+    """Paints a row's action buttons and emits action_clicked(row, action) when one is clicked."""
+    action_clicked = pyqtSignal(int, str)
+
+    BUTTON_WIDTH = 70
+    SPACING = 4
+    MARGIN = 2
+    ACTIONS_WIDTH = len(ACTION_LABELS) * (BUTTON_WIDTH + SPACING) + 2 * MARGIN  # room for every button
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Drawn through a real (never shown) button so the application stylesheet applies
+        self._button = QPushButton()
+        self._pressed = None  # (row, action) under a held mouse button
+
+    def _button_rects(self, rect, actions):
+        rects = []
+        x = rect.left() + self.MARGIN
+        for action in actions:
+            rects.append((action, QRect(x, rect.top() + self.MARGIN, self.BUTTON_WIDTH, rect.height() - 2 * self.MARGIN)))
+            x += self.BUTTON_WIDTH + self.SPACING
+        return rects
+
+    def _action_at(self, index, rect, pos):
+        for action, button_rect in self._button_rects(rect, index.data(ACTIONS_ROLE) or ()):
+            if button_rect.contains(pos):
+                return action
+        return None
+
+    def paint(self, painter, option, index):
+        actions = index.data(ACTIONS_ROLE)
+        if not actions:
+            super().paint(painter, option, index)
+            return
+        style = self._button.style()
+        for action, rect in self._button_rects(option.rect, actions):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = ACTION_LABELS[action]
+            button.state = QStyle.State_Enabled | (QStyle.State_Sunken if self._pressed == (index.row(), action) else QStyle.State_Raised)
+            style.drawControl(QStyle.CE_PushButton, button, painter, self._button)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        actions = index.data(ACTIONS_ROLE)
+        if actions:
+            size.setWidth(self.ACTIONS_WIDTH)
+        return size
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.MouseButtonPress, QEvent.MouseButtonRelease) or event.button() != Qt.LeftButton:
+            return False
+        action = self._action_at(index, option.rect, event.pos())
+        if option.widget is not None:
+            option.widget.viewport().update(option.rect)  # show or clear the pressed look
+        if event.type() == QEvent.MouseButtonPress:
+            self._pressed = (index.row(), action) if action else None
+            return action is not None
+        pressed, self._pressed = self._pressed, None
+        if action and pressed == (index.row(), action):
+            self.action_clicked.emit(index.row(), action)
+            return True
+        return False
@@ -2,10 +2,11 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdi
                              QTextEdit, QPushButton, QMessageBox, QFileDialog,
                              QGroupBox, QGridLayout)
 import os
-import time
-import shutil
 from datetime import datetime
-from database import ClassroomTask, Task, db_session
+from database import ClassroomTask, Task, session_scope
+from desktop_loader import fetch, task_for_student
+from upload_store import store_file, release_upload
+from thumbnails import queue_thumbnail
 
 # Define UPLOAD_FOLDER for file uploads
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
@@ -27,18 +28,13 @@ class SubmitTaskDialog(QDialog):
         layout = QVBoxLayout()
 
         # Task information
-        task = db_session.query(ClassroomTask).filter_by(id=self.task_id).first()
+        # The task and the student's earlier submission to it, if any
+        task, existing_submission = fetch('SubmitTaskDialog', task_for_student, self.task_id, self.user_id)
         if not task:
             QMessageBox.warning(self, 'Error', 'Task not found')
             self.reject()
             return
 
-        # Check if already submitted
-        existing_submission = db_session.query(Task).filter_by(
-            user_id=self.user_id, 
-            classroom_task_id=self.task_id
-        ).first()
-
         # Task details
         task_info_layout = QGridLayout()
         task_info_layout.addWidget(QLabel('Title:'), 0, 0)
@@ -115,69 +111,70 @@ class SubmitTaskDialog(QDialog):
             QMessageBox.warning(self, 'Error', 'Please provide either a text response or attach a file')
             return
 
-        # Check if already submitted
-        existing_submission = db_session.query(Task).filter_by(
-            user_id=self.user_id, 
-            classroom_task_id=self.task_id
-        ).first()
-
         try:
-            # Get classroom ID from the task
-            task = db_session.query(ClassroomTask).filter_by(id=self.task_id).first()
-            if not task:
-                QMessageBox.warning(self, 'Error', 'Task not found')
-                return
+            # One unit of work for the stored file, the submission and its blob references
+            with session_scope() as session:
+                # Check if already submitted
+                existing_submission = session.query(Task).filter_by(
+                    user_id=self.user_id, 
+                    classroom_task_id=self.task_id
+                ).first()
+
+                # Get classroom ID from the task
+                task = session.query(ClassroomTask).filter_by(id=self.task_id).first()
+                if not task:
+                    QMessageBox.warning(self, 'Error', 'Task not found')
+                    return
+                    
+                # Process file if provided (unless it is the attachment already stored for this submission)
+                stored = None
+                file_type = None
                 
-            # Process file if provided
-            saved_file_path = None
-            file_type = None
-            
-            if self.file_path:
-                # Create upload folder if it doesn't exist
-                os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+                if self.file_path and not (existing_submission and self.file_path == existing_submission.file_path):
+                    _, file_extension = os.path.splitext(self.file_path)
+                    
+                    # Determine file type
+                    if file_extension.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
+                        file_type = 'image'
+                    elif file_extension.lower() in ['.pdf', '.doc', '.docx', '.txt', '.rtf']:
+                        file_type = 'document'
+                    else:
+                        file_type = 'file'
+                    
+                    # Streamed into the shared store; a file already stored is not written again
+                    stored = store_file(session, self.file_path, UPLOAD_FOLDER)
                 
-                # Get file extension and generate secure filename
-                _, file_extension = os.path.splitext(self.file_path)
-                secure_filename = f"{self.user_id}_{self.task_id}_{int(time.time())}{file_extension}"
-                saved_file_path = secure_filename
-                
-                # Determine file type
-                if file_extension.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                    file_type = 'image'
-                elif file_extension.lower() in ['.pdf', '.doc', '.docx', '.txt', '.rtf']:
-                    file_type = 'document'
+                if existing_submission:
+                    # Update existing submission
+                    existing_submission.content = content
+                    if stored:
+                        # The replaced attachment loses a reference; prune_uploads removes it once unused
+                        release_upload(session, existing_submission.file_hash)
+                        existing_submission.file_path = stored.path
+                        existing_submission.file_type = file_type
+                        existing_submission.file_hash = stored.file_hash
+                    existing_submission.date = datetime.now()
+                    message = 'Task response updated successfully'
                 else:
-                    file_type = 'file'
-                
-                # Copy file to upload folder
-                shutil.copy2(self.file_path, os.path.join(UPLOAD_FOLDER, secure_filename))
+                    # Create new submission
+                    new_submission = Task(
+                        user_id=self.user_id,
+                        classroom_task_id=self.task_id,
+                        content=content,
+                        file_path=stored.path if stored else None,
+                        file_type=file_type,
+                        file_hash=stored.file_hash if stored else None,
+                        date=datetime.now()
+                    )
+                    session.add(new_submission)
+                    message = 'Task response submitted successfully'
+            QMessageBox.information(self, 'Success', message)
             
-            if existing_submission:
-                # Update existing submission
-                existing_submission.content = content
-                if saved_file_path:
-                    # If there was a previous file, we could delete it here
-                    existing_submission.file_path = saved_file_path
-                    existing_submission.file_type = file_type
-                existing_submission.date = datetime.now()
-                db_session.commit()
-                QMessageBox.information(self, 'Success', 'Task response updated successfully')
-            else:
-                # Create new submission
-                new_submission = Task(
-                    user_id=self.user_id,
-                    classroom_task_id=self.task_id,
-                    content=content,
-                    file_path=saved_file_path,
-                    file_type=file_type,
-                    date=datetime.now()
-                )
-                db_session.add(new_submission)
-                db_session.commit()
-                QMessageBox.information(self, 'Success', 'Task response submitted successfully')
+            # Preview for the submissions page, made in the background
+            if stored:
+                queue_thumbnail(UPLOAD_FOLDER, stored.path)
             
             self.accept()
             
         except Exception as e:
-            db_session.rollback()
             QMessageBox.warning(self, 'Error', f'Failed to submit response: {str(e)}')
\ No newline at end of file
@@ -2,7 +2,7 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTextEdi
                              QPushButton, QMessageBox, QTableWidget, QTableWidgetItem,
                              QHeaderView, QGroupBox, QGridLayout, QWidget)
 import os
-from database import ClassroomTask, Task, User, db_session
+from desktop_loader import DataLoader, fetch, classroom_task, task_submissions
 
 # Define UPLOAD_FOLDER for file access
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
@@ -11,6 +11,7 @@ class TaskSubmissionsDialog(QDialog):
     def __init__(self, task_id):
         super().__init__()
         self.task_id = task_id
+        self.loader = DataLoader(self)
         self.setWindowTitle('Task Submissions')
         self.setGeometry(300, 300, 800, 600)
         self.setup_ui()
@@ -19,7 +20,7 @@ class TaskSubmissionsDialog(QDialog):
         layout = QVBoxLayout()
 
         # Task information
-        task = db_session.query(ClassroomTask).filter_by(id=self.task_id).first()
+        task = fetch('TaskSubmissionsDialog', classroom_task, self.task_id)
         if not task:
             QMessageBox.warning(self, 'Error', 'Task not found')
             self.reject()
@@ -56,13 +57,16 @@ class TaskSubmissionsDialog(QDialog):
         self.setLayout(layout)
 
     def load_submissions(self):
-        submissions = db_session.query(Task).filter_by(classroom_task_id=self.task_id).all()
+        # Each submission's student name comes from the same query, on a worker thread
+        self.loader.load('submissions', task_submissions, self.task_id,
+                         on_done=self.show_submissions, label='TaskSubmissionsDialog.load_submissions')
+
+    def show_submissions(self, submissions):
         self.submissions_table.setRowCount(len(submissions))
 
         for row, submission in enumerate(submissions):
             # Get student info
-            student = db_session.query(User).filter_by(id=submission.user_id).first()
-            student_name = student.username if student else 'Unknown'
+            student_name = submission.username or 'Unknown'
             student_item = QTableWidgetItem(student_name)
             self.submissions_table.setItem(row, 0, student_item)
 
@@ -98,6 +102,11 @@ class TaskSubmissionsDialog(QDialog):
             actions_widget.setLayout(actions_layout)
             self.submissions_table.setCellWidget(row, 4, actions_widget)
 
+    def done(self, result):
+        # Closing the dialog drops a load still running for it
+        self.loader.cancel()
+        super().done(result)
+
     def view_file(self, file_path):
         # Open the file with the default application
         try:
@@ -113,9 +122,7 @@ class TaskSubmissionsDialog(QDialog):
         layout = QVBoxLayout()
 
         # Student info
-        student = db_session.query(User).filter_by(id=submission.user_id).first()
-        student_name = student.username if student else 'Unknown'
-        layout.addWidget(QLabel(f'Student: {student_name}'))
+        layout.addWidget(QLabel(f'Student: {submission.username or "Unknown"}'))
         layout.addWidget(QLabel(f'Submitted: {submission.date.strftime("%Y-%m-%d %H:%M")}'))
 
         # Content
@@ -0,0 +1,46 @@
+# tests/test_classroom_pages.py
+
+# What the classroom pages show: the attendance page is the classroom page, whose students
+# table (a cached fragment) must list the whole roster before and after attendance is marked.
+
+from database import db
+from roster import load_roster
+from conftest import TEACHER, CLASSROOM_ID
+
+def roster(app):
+    with app.app_context():
+        return load_roster(db.session, CLASSROOM_ID)
+
+def assert_roster_listed(html, students):
+    missing = [student.username for student in students if f'<td>{student.username}</td>' not in html]
+    assert not missing, f'students missing from the classroom page: {missing}'
+
+def test_attendance_page_lists_the_roster(app, login):
+    students = roster(app)
+    assert len(students) > 1
+    client = login(TEACHER)
+
+    response = client.get(f'/classroom/{CLASSROOM_ID}/attendance')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/classroom/{CLASSROOM_ID}')
+
+    response = client.get(f'/classroom/{CLASSROOM_ID}/attendance', follow_redirects=True)
+    assert response.status_code == 200
+    assert_roster_listed(response.get_data(as_text=True), students)
+
+def test_roster_still_listed_after_marking_attendance(app, login):
+    students = roster(app)
+    absent = students[0]
+    client = login(TEACHER)
+    client.get(f'/classroom/{CLASSROOM_ID}/attendance')  # warm the students fragment first
+
+    response = client.get(f'/mark_attendance/{CLASSROOM_ID}/{absent.id}/absent', follow_redirects=True)
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert f'Attendance marked for {absent.username} as absent.' in html
+    assert_roster_listed(html, students)
+
+    html = client.get(f'/classroom/{CLASSROOM_ID}/attendance', follow_redirects=True).get_data(as_text=True)
+    assert_roster_listed(html, students)
+    row = html[html.index(f'<td>{absent.username}</td>'):]
+    assert row.index('attendance-absent') < row.index('</tr>')
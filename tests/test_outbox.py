@@ -0,0 +1,215 @@
+# tests/test_outbox.py
+
+# The outbox sender against a local SMTP stand-in (aiosmtpd) that requires a login.
+# process_due() is called on the test's thread instead of waiting for the sender thread,
+# with the same pool, claim and delivery code the thread runs.
+
+import socket
+from datetime import datetime, timedelta
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from sqlalchemy.orm import sessionmaker
+import outbox as outbox_module
+from outbox import OutboxSender, SMTPConnectionPool, queue_notification, outbox_status, OUTBOX_RETRY_BASE
+from database import db, make_engine, OutboxMessage
+
+SENDER = 'teacher@example.com'
+PASSWORD = 'app-password'
+CLASSROOM_ID = 7
+
+class RecordingHandler:
+    """Accepts mail, or answers with the next canned reply in refusals."""
+    def __init__(self):
+        self.messages = []  # (mail from, recipients) of every accepted message
+        self.data_replies = []  # replies to DATA, used up first to last
+        self.refused_recipients = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused_recipients:
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.data_replies:
+            return self.data_replies.pop(0)
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos)))
+        return '250 Message accepted for delivery'
+
+class CountingAuthenticator:
+    """Accepts SENDER/PASSWORD and counts the logins."""
+    def __init__(self):
+        self.logins = 0
+
+    def __call__(self, server, session, envelope, mechanism, auth_data):
+        valid = auth_data.login == SENDER.encode() and auth_data.password == PASSWORD.encode()
+        self.logins += valid
+        return AuthResult(success=valid)
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    authenticator = CountingAuthenticator()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port(),
+                            authenticator=authenticator, auth_require_tls=False)
+    controller.start()
+    yield controller, handler, authenticator
+    controller.stop()
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = make_engine(f'sqlite:///{tmp_path / "outbox.db"}')
+    db.Model.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+def sender(smtp_server, session_factory, monkeypatch):
+    controller, _, _ = smtp_server
+    sender = OutboxSender(SMTPConnectionPool(host=controller.hostname, port=controller.port, starttls=False))
+    sender._session_factory = session_factory  # process_due() runs here rather than on a sender thread
+    monkeypatch.setattr(outbox_module, 'outbox', sender)  # queue_notification remembers credentials with it
+    yield sender
+    sender.pool.close()
+
+def queue(session_factory, *recipients):
+    session = session_factory()
+    try:
+        messages = [queue_notification(session, SENDER, PASSWORD, recipient, 'Absence', f'Dear parent of {recipient}',
+                                       classroom_id=CLASSROOM_ID) for recipient in recipients]
+        session.commit()
+        return [message.id for message in messages]
+    finally:
+        session.close()
+
+def message_row(session_factory, message_id):
+    session = session_factory()
+    try:
+        return session.query(OutboxMessage).get(message_id)
+    finally:
+        session.close()
+
+def test_queued_message_is_delivered(sender, smtp_server, session_factory):
+    _, handler, _ = smtp_server
+    (message_id,) = queue(session_factory, 'parent1@example.com')
+
+    assert sender.process_due() == 1
+    assert handler.messages == [(SENDER, ['parent1@example.com'])]
+    message = message_row(session_factory, message_id)
+    assert message.status == 'sent'
+    assert message.attempts == 1
+    assert message.sent_at is not None and message.last_error is None
+
+def test_messages_share_one_authenticated_connection(sender, smtp_server, session_factory):
+    _, handler, authenticator = smtp_server
+    queue(session_factory, 'parent1@example.com', 'parent2@example.com', 'parent3@example.com')
+    assert sender.process_due() == 3
+    queue(session_factory, 'parent4@example.com')
+    assert sender.process_due() == 1
+
+    assert len(handler.messages) == 4
+    assert sender.pool.opened == 1
+    assert authenticator.logins == 1
+
+def test_temporary_failure_is_retried_with_backoff(sender, smtp_server, session_factory):
+    _, handler, _ = smtp_server
+    handler.data_replies.append('451 4.3.0 Try again later')
+    (message_id,) = queue(session_factory, 'parent1@example.com')
+
+    before = datetime.now()
+    sender.process_due()
+    message = message_row(session_factory, message_id)
+    assert message.status == 'queued'
+    assert message.attempts == 1
+    assert 'Try again later' in message.last_error
+    # First retry waits the base delay, give or take 20% jitter
+    assert before + timedelta(seconds=OUTBOX_RETRY_BASE * 0.8) - timedelta(seconds=1) <= message.next_attempt_at
+    assert message.next_attempt_at <= datetime.now() + timedelta(seconds=OUTBOX_RETRY_BASE * 1.2)
+
+    # Not due yet: nothing is tried
+    assert sender.process_due() == 0
+    assert handler.messages == []
+
+    # Once due, the retry goes out over the connection the refusal left open
+    session = session_factory()
+    session.query(OutboxMessage).filter_by(id=message_id).update({'next_attempt_at': datetime.now()})
+    session.commit()
+    session.close()
+    assert sender.process_due() == 1
+    message = message_row(session_factory, message_id)
+    assert message.status == 'sent'
+    assert message.attempts == 2
+    assert message.last_error is None
+    assert sender.pool.opened == 1
+
+def test_refused_recipient_fails_at_once(sender, smtp_server, session_factory):
+    _, handler, _ = smtp_server
+    handler.refused_recipients.add('nobody@example.com')
+    refused_id, delivered_id = queue(session_factory, 'nobody@example.com', 'parent1@example.com')
+
+    assert sender.process_due() == 2
+    refused = message_row(session_factory, refused_id)
+    assert refused.status == 'failed'
+    assert refused.attempts == 1
+    assert refused.last_error == 'The recipient address was refused by the email server.'
+    assert message_row(session_factory, delivered_id).status == 'sent'
+    assert sender.failed == 1 and sender.sent == 1
+
+def test_status_shown_to_the_ui(sender, smtp_server, session_factory):
+    _, handler, _ = smtp_server
+    handler.refused_recipients.add('nobody@example.com')
+    refused_id, delivered_id = queue(session_factory, 'nobody@example.com', 'parent1@example.com')
+    (waiting_id,) = queue(session_factory, 'parent2@example.com')
+
+    session = session_factory()
+    try:
+        statuses = {message['id']: message for message in outbox_status(session, CLASSROOM_ID)}
+        assert {message['status'] for message in statuses.values()} == {'queued'}
+
+        # Deliver only the first two; the third stays queued
+        session.query(OutboxMessage).filter_by(id=waiting_id).update({'next_attempt_at': datetime.now() + timedelta(hours=1)})
+        session.commit()
+        sender.process_due()
+
+        statuses = {message['id']: message for message in outbox_status(session, CLASSROOM_ID)}
+        assert statuses[delivered_id]['status'] == 'sent' and statuses[delivered_id]['sent_at']
+        assert statuses[refused_id]['status'] == 'failed'
+        assert statuses[refused_id]['last_error'] == 'The recipient address was refused by the email server.'
+        assert statuses[waiting_id]['status'] == 'queued' and statuses[waiting_id]['sent_at'] is None
+        assert [message['id'] for message in outbox_status(session, CLASSROOM_ID, message_ids=[refused_id])] == [refused_id]
+        assert outbox_status(session, CLASSROOM_ID + 1) == []
+    finally:
+        session.close()
+
+def test_listeners_hear_each_status_change(sender, smtp_server, session_factory):
+    _, handler, _ = smtp_server
+    handler.refused_recipients.add('nobody@example.com')
+    delivered_id, refused_id = queue(session_factory, 'parent1@example.com', 'nobody@example.com')
+    updates = []
+    sender.add_listener(updates.append)
+    sender.add_listener(lambda update: 1 / 0)  # a failing listener does not stop the others or the sender
+
+    assert sender.process_due() == 2
+    by_message = {}
+    for update in updates:
+        assert update['classroom_id'] == CLASSROOM_ID
+        by_message.setdefault(update['id'], []).append(update)
+    assert [update['status'] for update in by_message[delivered_id]] == ['sending', 'sent']
+    sent = by_message[delivered_id][-1]
+    assert sent['recipient'] == 'parent1@example.com' and sent['attempts'] == 1
+    assert sent['sent_at'] == message_row(session_factory, delivered_id).sent_at.isoformat(timespec='seconds')
+    assert [update['status'] for update in by_message[refused_id]] == ['sending', 'failed']
+    assert by_message[refused_id][-1]['last_error'] == 'The recipient address was refused by the email server.'
+
+    # A removed listener hears nothing more
+    sender.remove_listener(updates.append)
+    updates.clear()
+    queue(session_factory, 'parent2@example.com')
+    assert sender.process_due() == 1
+    assert updates == []
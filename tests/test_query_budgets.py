@@ -0,0 +1,56 @@
+# tests/test_query_budgets.py
+
+# Every route declaring a @query_budget is requested under TestingConfig, where the budget
+# is enforced: a route that issues more statements than declared raises QueryBudgetExceeded
+# out of the test client. Each page is requested twice, with cold and with warm caches.
+
+import pytest
+import app as web
+from conftest import ADMIN, TEACHER, STUDENT, CLASSROOM_ID
+
+TASK_ID = 1  # created by teacher0 in classroom 1
+
+BUDGETED_PAGES = [
+    ('main.dashboard', ADMIN, '/dashboard'),
+    ('main.dashboard', TEACHER, '/dashboard'),
+    ('main.dashboard', STUDENT, '/dashboard'),
+    ('main.classroom_details', ADMIN, f'/classroom/{CLASSROOM_ID}'),
+    ('main.classroom_details', TEACHER, f'/classroom/{CLASSROOM_ID}'),
+    ('main.classroom_details', STUDENT, f'/classroom/{CLASSROOM_ID}'),
+    ('main.view_task_submissions', TEACHER, f'/classroom_task/{TASK_ID}/submissions'),
+    ('main.view_task_submissions', ADMIN, f'/classroom_task/{TASK_ID}/submissions'),
+    ('main.classroom_attendance', TEACHER, f'/classroom/{CLASSROOM_ID}/attendance'),
+    ('main.attendance_report', ADMIN, '/reports/attendance'),
+    ('main.attendance_report', ADMIN, f'/reports/attendance?classroom_id={CLASSROOM_ID}'),
+    ('main.attendance_report', TEACHER, f'/reports/attendance?classroom_id={CLASSROOM_ID}'),
+]
+
+# Budgeted routes that answer with a redirect rather than a page
+REDIRECTING_ENDPOINTS = {'main.classroom_attendance'}
+
+def test_every_budgeted_route_is_covered(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted == {endpoint for endpoint, _, _ in BUDGETED_PAGES}
+
+@pytest.mark.parametrize('endpoint, username, url', BUDGETED_PAGES)
+def test_route_stays_within_query_budget(app, login, endpoint, username, url):
+    assert app.config['ENFORCE_QUERY_BUDGETS'] is None and app.testing  # enforced because we are testing
+    client = login(username)
+    expected_status = 302 if endpoint in REDIRECTING_ENDPOINTS else 200
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == expected_status, f'{url} as {username} returned {response.status_code}'
+    assert app.url_map.bind('localhost').match(url.split('?')[0])[0] == endpoint
+
+def test_extra_lazy_load_exceeds_budget(app, login, monkeypatch):
+    # Touching each submission's user relationship while rendering is one SELECT per submission
+    render_template = web.render_template
+    def render_with_lazy_loads(template, **context):
+        for submission in context.get('submission_dict', {}).values():
+            submission.user.username
+        return render_template(template, **context)
+    monkeypatch.setattr(web, 'render_template', render_with_lazy_loads)
+
+    client = login(TEACHER)
+    with pytest.raises(web.QueryBudgetExceeded, match='main.view_task_submissions issued'):
+        client.get(f'/classroom_task/{TASK_ID}/submissions')
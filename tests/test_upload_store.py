@@ -0,0 +1,81 @@
+# tests/test_upload_store.py
+
+# The content-addressed upload store against a scratch SQLite file, with a second session
+# standing in for another process uploading the same file while prune_uploads runs.
+
+import io
+import os
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from database import db, make_engine, UploadBlob
+from upload_store import store_upload, release_upload, prune_uploads
+
+WORKSHEET = b'Worksheet 3: fractions\n' * 100
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = make_engine(f'sqlite:///{tmp_path / "store.db"}')
+    db.Model.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    return str(tmp_path / 'uploads')
+
+def store(session, upload_folder, content=WORKSHEET):
+    stored = store_upload(session, io.BytesIO(content), 'worksheet.pdf', upload_folder)
+    session.commit()
+    return stored
+
+def refcount(session, file_hash):
+    session.expire_all()
+    return session.query(UploadBlob.refcount).filter_by(hash=file_hash).scalar()
+
+def test_same_file_is_stored_once(engine, upload_folder):
+    session = sessionmaker(bind=engine)()
+    first = store(session, upload_folder)
+    second = store(session, upload_folder)
+    assert first == second
+    assert refcount(session, first.file_hash) == 2
+    with open(os.path.join(upload_folder, first.path), 'rb') as stored_file:
+        assert stored_file.read() == WORKSHEET
+
+def test_prune_removes_unreferenced_files(engine, upload_folder):
+    session = sessionmaker(bind=engine)()
+    kept = store(session, upload_folder)
+    pruned = store(session, upload_folder, b'Handed back, then replaced')
+    release_upload(session, pruned.file_hash)
+    session.commit()
+
+    assert prune_uploads(session, upload_folder) == 1
+    assert not os.path.exists(os.path.join(upload_folder, pruned.path))
+    assert refcount(session, pruned.file_hash) is None
+    assert os.path.exists(os.path.join(upload_folder, kept.path))
+
+    # Uploading it again writes the file again
+    again = store(session, upload_folder, b'Handed back, then replaced')
+    assert os.path.exists(os.path.join(upload_folder, again.path))
+
+def test_prune_keeps_a_file_referenced_again_meanwhile(engine, upload_folder):
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    stored = store(session, upload_folder)
+    release_upload(session, stored.file_hash)
+    session.commit()
+
+    # Another upload of the same file commits between prune's SELECT and its DELETE
+    uploads = [WORKSHEET]
+    def upload_before_delete(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('DELETE FROM upload_blob') and uploads:
+            other = Session()
+            store(other, upload_folder, uploads.pop())
+            other.close()
+    event.listen(engine, 'before_cursor_execute', upload_before_delete)
+    try:
+        assert prune_uploads(session, upload_folder) == 0
+    finally:
+        event.remove(engine, 'before_cursor_execute', upload_before_delete)
+    assert refcount(session, stored.file_hash) == 1
+    assert os.path.exists(os.path.join(upload_folder, stored.path))
@@ -0,0 +1,90 @@
+# thumbnails.py
+
+# Fixed-size JPEG previews of submitted images, so a submissions page loads a few KB per
+# student instead of every full-size photo. Thumbnails are made on a small process pool
+# (Pillow releases the GIL only partly, and a resize would otherwise hold up a web worker
+# or the desktop UI) and stored next to the original as <hash>.thumb.jpg. Like the
+# originals they never change, so browsers may cache them for a long time.
+#
+# Pillow is optional: without it no thumbnails are made and pages show the originals.
+# This module must stay importable without the database, since pool workers import it.
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+THUMBNAIL_SIZE = int(os.environ.get('ENGAGE_THUMBNAIL_SIZE', 200)) # Longest side, in pixels
+THUMBNAIL_WORKERS = int(os.environ.get('ENGAGE_THUMBNAIL_WORKERS', 2))
+THUMBNAIL_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+
+_pool = None
+_pool_pid = None
+
+def thumbnails_enabled():
+    return Image is not None
+
+def has_thumbnail_source(path):
+    """Whether a stored file is an image we make thumbnails for."""
+    return os.path.splitext(path)[1].lower() in THUMBNAIL_EXTENSIONS
+
+def thumbnail_path(path):
+    """Thumbnail location for a stored file: ab/cd/<hash>.png -> ab/cd/<hash>.thumb.jpg"""
+    return os.path.splitext(path)[0] + THUMBNAIL_SUFFIX
+
+def make_thumbnail(source_path, target_path, size=THUMBNAIL_SIZE):
+    """Write a JPEG thumbnail of source_path (runs in a pool worker). Returns target_path."""
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size, size))  # JPEGs decode straight at a reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # Written under a temporary name first so a half-written thumbnail is never served
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                image.save(temp_file, 'JPEG', quality=80, optimize=True)
+            os.replace(temp_path, target_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    return target_path
+
+def _get_pool():
+    # Created on first use in each process, so forked web workers do not share one
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        _pool_pid = os.getpid()
+    return _pool
+
+def _report_failure(future):
+    error = future.exception()
+    if error is not None:
+        print(f"Thumbnail error: {error}")
+
+def queue_thumbnail(upload_folder, path):
+    """
+    Start making the thumbnail of a stored image in the background. Returns the
+    Future, or None when there is nothing to do (not an image, already made, or no Pillow).
+    """
+    if not thumbnails_enabled() or not has_thumbnail_source(path):
+        return None
+    target_path = os.path.join(upload_folder, thumbnail_path(path))
+    if os.path.exists(target_path):
+        return None
+    future = _get_pool().submit(make_thumbnail, os.path.join(upload_folder, path), target_path)
+    future.add_done_callback(_report_failure)
+    return future
+
+def backfill_thumbnails(upload_folder, paths):
+    """Make the missing thumbnails for stored files (paths) and wait for them. Returns (made, failed)."""
+    futures = [future for future in (queue_thumbnail(upload_folder, path) for path in paths) if future is not None]
+    failed = sum(1 for future in futures if future.exception() is not None)
+    return len(futures) - failed, failed
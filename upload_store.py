@@ -0,0 +1,139 @@
+# upload_store.py
+
+# Content-addressed storage for submitted task files, shared by the web app and the
+# desktop client. An upload is streamed to disk in chunks and hashed on the way, then
+# moved to UPLOAD_FOLDER/<aa>/<bb>/<sha256><ext>. A file that is already stored is not
+# written again: the 200 copies of a handed-back worksheet become one file with an
+# upload_blob.refcount of 200. Files whose refcount has dropped to zero are deleted by
+# prune_uploads (python manage.py prune-uploads), together with their thumbnails.
+
+import os
+import re
+import hashlib
+import tempfile
+from collections import namedtuple
+from sqlalchemy.dialects.sqlite import insert
+from database import Task, UploadBlob
+from thumbnails import thumbnail_path
+
+CHUNK_SIZE = 64 * 1024
+
+StoredUpload = namedtuple('StoredUpload', ['file_hash', 'path', 'size'])
+
+STORE_PATH = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.[A-Za-z0-9]+)?$')
+
+def blob_path(file_hash, extension=''):
+    """Store path (relative to the upload folder) of a file with this hash, sharded by its first two bytes."""
+    return f'{file_hash[:2]}/{file_hash[2:4]}/{file_hash}{extension}'
+
+def store_path_hash(path):
+    """The file hash in a store path, or None if path is not one."""
+    match = STORE_PATH.match(path)
+    return match.group(3) if match else None
+
+def _stream_to_temp(stream, upload_folder):
+    """Copy stream to a temporary file in the upload folder, hashing it in the same pass."""
+    temp_dir = os.path.join(upload_folder, 'tmp')
+    os.makedirs(temp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+def store_upload(session, stream, filename, upload_folder):
+    """
+    Save the file read from stream into the store and count one more reference to it.
+    filename only supplies the extension. The reference is added in the caller's
+    transaction, so commit it together with the Task row that points at the file.
+    Returns StoredUpload; set Task.file_hash and Task.file_path from it.
+    """
+    temp_path, file_hash, size = _stream_to_temp(stream, upload_folder)
+    try:
+        # Count the reference before looking for the file: the write lock this takes, held to the
+        # caller's commit, keeps prune_uploads from removing the file once it has been seen.
+        # Another upload of the same file may have committed meanwhile; its path wins
+        session.execute(
+            insert(UploadBlob.__table__)
+            .values(hash=file_hash, path=blob_path(file_hash, os.path.splitext(filename)[1].lower()),
+                    size=size, refcount=1)
+            .on_conflict_do_update(index_elements=['hash'], set_={'refcount': UploadBlob.__table__.c.refcount + 1})
+        )
+        path = session.query(UploadBlob.path).filter_by(hash=file_hash).scalar()
+        full_path = os.path.join(upload_folder, path)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(temp_path, full_path)  # atomic, so a reader never sees half a file
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return StoredUpload(file_hash, path, size)
+
+def store_file(session, source_path, upload_folder):
+    """store_upload for a file on disk (the desktop client's attachments)."""
+    with open(source_path, 'rb') as source:
+        return store_upload(session, source, source_path, upload_folder)
+
+def release_upload(session, file_hash):
+    """Drop one reference to a stored file, e.g. when a submission's attachment is replaced."""
+    if file_hash:
+        session.query(UploadBlob) \
+            .filter(UploadBlob.hash == file_hash, UploadBlob.refcount > 0) \
+            .update({'refcount': UploadBlob.refcount - 1}, synchronize_session=False)
+
+def prune_uploads(session, upload_folder):
+    """Delete stored files no submission refers to any more. Returns how many were removed."""
+    orphans = session.query(UploadBlob.hash, UploadBlob.path).filter(UploadBlob.refcount <= 0).all()
+    if not orphans:
+        return 0
+    orphan_hashes = [orphan.hash for orphan in orphans]
+    # The DELETE takes the write lock and keeps it until the commit below, so the rows it left
+    # (referenced again since the SELECT) are exactly the survivors, and a store_upload of a
+    # removed file waits until the file is gone, then writes it again.
+    session.query(UploadBlob).filter(UploadBlob.hash.in_(orphan_hashes), UploadBlob.refcount <= 0) \
+        .delete(synchronize_session=False)
+    survivors = {row.hash for row in session.query(UploadBlob.hash).filter(UploadBlob.hash.in_(orphan_hashes))}
+    removed = [orphan for orphan in orphans if orphan.hash not in survivors]
+    for orphan in removed:
+        for path in (orphan.path, thumbnail_path(orphan.path)):
+            try:
+                os.remove(os.path.join(upload_folder, path))
+            except FileNotFoundError:
+                pass
+    session.commit()
+    return len(removed)
+
+def import_legacy_uploads(session, upload_folder):
+    """
+    Move files saved before the store existed (Task.file_path set, file_hash empty)
+    into the store, one committed submission at a time. Returns (imported, missing).
+    """
+    imported = missing = 0
+    legacy_files = set()
+    tasks = session.query(Task).filter(Task.file_path.isnot(None), Task.file_hash.is_(None)).all()
+    for task in tasks:
+        # The web app stored absolute paths, the desktop app bare file names
+        source_path = task.file_path if os.path.isabs(task.file_path) else os.path.join(upload_folder, task.file_path)
+        if not os.path.isfile(source_path):
+            missing += 1
+            continue
+        stored = store_file(session, source_path, upload_folder)
+        task.file_hash = stored.file_hash
+        task.file_path = stored.path
+        session.commit()
+        legacy_files.add(source_path)
+        imported += 1
+    for source_path in legacy_files:
+        os.remove(source_path)
+    return imported, missing
@@ -0,0 +1,44 @@
+# user_cache.py
+
+# Per-process cache of logged-in users for the Flask-Login user_loader, so an
+# authenticated request does not start with a query for its own user row.
+
+import os
+from collections import namedtuple
+from flask_login import UserMixin
+from cache import LRUCache
+from database import User
+
+# Entries are invalidated explicitly when this process changes a user's role, classroom or
+# parent email; the TTL only bounds staleness from changes made by another process.
+USER_CACHE_SIZE = int(os.environ.get('ENGAGE_USER_CACHE_SIZE', 1024))
+USER_CACHE_TTL = int(os.environ.get('ENGAGE_USER_CACHE_TTL', 60))
+
+_USER_FIELDS = ('id', 'username', 'role', 'classroom_id', 'parent_email')
+
+class CachedUser(UserMixin, namedtuple('CachedUserFields', _USER_FIELDS)):
+    """
+    Read-only snapshot of a user, detached from any session, used as current_user.
+    It has no relationships: load the classroom or tasks explicitly by id.
+    """
+    __slots__ = ()
+
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def load_cached_user(session, user_id):
+    """Return the snapshot of the given user, querying the five columns on a miss (None if no such user)."""
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        row = session.query(*(getattr(User, field) for field in _USER_FIELDS)).filter(User.id == user_id).first()
+        if row is None:
+            return None  # not cached, so a user created later with this id is found
+        user = CachedUser(*row)
+        user_cache.set(user_id, user)
+    return user
+
+def invalidate_user(*user_ids):
+    """Forget the cached snapshots of the given users (None and empty ids are ignored)."""
+    for user_id in user_ids:
+        if user_id:
+            user_cache.invalidate(int(user_id))